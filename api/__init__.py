@@ -4,6 +4,10 @@
 from .analysis import analysis_bp
 from .user_path import user_path_bp
 from .dashboard import dashboard_bp
+from .track import track_bp
+from .funnel import funnel_bp
+from .retention import retention_bp
+from .event_analysis import event_analysis_bp
 
 def register_blueprints(app):
     """
@@ -15,10 +19,18 @@ def register_blueprints(app):
     app.register_blueprint(analysis_bp)
     app.register_blueprint(user_path_bp)
     app.register_blueprint(dashboard_bp)
+    app.register_blueprint(track_bp)
+    app.register_blueprint(funnel_bp)
+    app.register_blueprint(retention_bp)
+    app.register_blueprint(event_analysis_bp)
 
 __all__ = [
     'analysis_bp',
     'user_path_bp', 
     'dashboard_bp',
+    'track_bp',
+    'funnel_bp',
+    'retention_bp',
+    'event_analysis_bp',
     'register_blueprints'
 ]
\ No newline at end of file
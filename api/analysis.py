@@ -1,35 +1,43 @@
 # api/analysis.py
 # 🔍 分析选项API模块
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from urllib.parse import urlparse
 import logging
-from database import execute_query
-from utils import format_event_name, clean_page_path, categorize_referrer
+from collections import Counter
+from database import execute_query, json_property_sql, get_event_source
+from utils import format_event_name, clean_page_path, categorize_referrer, StaleWhileRevalidateCache
 from config import get_config
 
 # 创建蓝图
 analysis_bp = Blueprint('analysis', __name__)
 config = get_config()
 
+# 分析选项缓存：选项变化缓慢，过期后先返回旧值再后台刷新
+options_cache = StaleWhileRevalidateCache('analysis_options', stale_ttl=config.ANALYSIS_OPTIONS_STALE_TTL)
+
 @analysis_bp.route('/api/analysis-options', methods=['GET'])
 def get_analysis_options():
     """获取所有可用的分析选项（事件+页面路径+URL+其他属性）"""
     try:
+        # 强制刷新缓存
+        if request.args.get('refresh', '').lower() in ('1', 'true'):
+            options_cache.invalidate()
+        
         # 获取所有事件类型
-        events = get_event_options()
+        events = get_cached_options('events')
         
         # 获取页面路径（从all_json中提取）
-        pages = get_page_options()
+        pages = get_cached_options('pages')
         
         # 获取URL路径（从url字段）
-        urls = get_url_options()
+        urls = get_cached_options('urls')
         
         # 获取页面标题
-        titles = get_title_options()
+        titles = get_cached_options('titles')
         
         # 获取来源渠道
-        referrers = get_referrer_options()
+        referrers = get_cached_options('referrers')
         
         # 合并所有选项
         all_options = events + pages + urls + titles + referrers
@@ -51,6 +59,277 @@ def get_analysis_options():
         logging.error(f"获取分析选项失败: {e}")
         return jsonify({'error': f'获取分析选项失败: {str(e)}'}), 500
 
+def get_cached_options(category):
+    """
+    获取带缓存的分析选项（按类别独立TTL，并发请求只触发一次查询）
+    
+    缓存未命中时执行一次选项发现查询，同时刷新全部类别的缓存。
+    
+    Args:
+        category (str): 选项类别，见 OPTION_LIMITS
+        
+    Returns:
+        list: 选项列表（共享对象，调用方不要修改）
+    """
+    ttl = config.ANALYSIS_OPTIONS_TTL.get(category, 300)
+    # 查询失败时返回空列表，空结果不写入缓存
+    return options_cache.get(category, lambda: load_options_by_discovery(category), ttl, cache_if=bool)
+
+def load_options_by_discovery(category):
+    """
+    执行选项发现，把其余类别的结果一并写入缓存
+    
+    Args:
+        category (str): 本次需要的选项类别
+        
+    Returns:
+        list: 该类别的选项列表
+    """
+    all_options = discover_options()
+    for other_category, options in all_options.items():
+        if other_category != category and options:
+            options_cache.put(other_category, options)
+    return all_options.get(category, [])
+
+def discover_options():
+    """
+    一条查询计算全部五类选项
+    
+    每个类别单独按取值分组并取Top N（ORDER BY 次数 DESC LIMIT N），五个子查询用
+    UNION ALL 合并为一条语句返回，结果最多只有各类别上限之和行。不按多列组合分组：
+    url、referrer 带查询参数时组合数接近事件数，会把几乎所有行读回Python。
+    过滤条件和数量上限与分类查询保持一致。
+    
+    Returns:
+        dict: 类别 -> 选项列表，查询失败时各类别为空列表
+    """
+    source = get_event_source()
+    if not source.supports_sql:
+        return discover_options_from_events(source)
+    
+    subqueries = []
+    for category, (expression, condition) in option_sql_filters().items():
+        subqueries.append(f'''
+            (SELECT '{category}' AS category, value, COUNT(*) AS count
+             FROM (SELECT {expression} AS value FROM summit) AS flattened
+             WHERE {condition}
+             GROUP BY value
+             ORDER BY count DESC
+             LIMIT {int(OPTION_LIMITS[category])})
+        ''')
+    
+    results, _ = execute_query(' UNION ALL '.join(subqueries))
+    if results is None:
+        logging.error("选项发现查询失败")
+        return {category: [] for category in OPTION_LIMITS}
+    
+    rows = {category: [] for category in OPTION_LIMITS}
+    for category, value, count in results:
+        rows[category].append((value, count))
+    
+    return {
+        category: OPTION_BUILDERS[category](sorted(rows[category], key=lambda row: row[1], reverse=True))
+        for category in OPTION_LIMITS
+    }
+
+def option_sql_filters():
+    """
+    各类别的取值表达式和过滤条件（SQL数据源）
+    
+    Returns:
+        dict: 类别 -> (取值表达式, 过滤条件)
+    """
+    return {
+        'events': ('event', "value IS NOT NULL AND value != ''"),
+        'pages': (json_property_sql('$url_path'),
+                  "value IS NOT NULL AND value NOT IN ('null', '', 'undefined') AND CHAR_LENGTH(value) > 0"),
+        'urls': ('url', "value IS NOT NULL AND value != '' "
+                        "AND value NOT LIKE '%localhost%' AND value NOT LIKE '%127.0.0.1%'"),
+        'titles': (json_property_sql('$title'),
+                   "value IS NOT NULL AND value NOT IN ('null', '', 'undefined') AND CHAR_LENGTH(value) > 0"),
+        'referrers': ('referrer', "value IS NOT NULL AND value != '' AND value NOT LIKE '%localhost%'")
+    }
+
+def discover_options_from_events(source):
+    """
+    单遍扫描事件数据源（不支持SQL的数据源，如Parquet），计算全部五类选项
+    
+    过滤条件与 option_sql_filters 一致，在每块DataFrame上向量化计算。
+    
+    Args:
+        source (EventSource): 事件数据源
+        
+    Returns:
+        dict: 类别 -> 选项列表，读取失败时各类别为空列表
+    """
+    counters = {category: Counter() for category in OPTION_LIMITS}
+    
+    try:
+        for chunk in source.iter_events(list(OPTION_SOURCE_COLUMNS.values())):
+            for category, column in OPTION_SOURCE_COLUMNS.items():
+                values = chunk[column].dropna().astype(str)
+                values = values[values.map(OPTION_VALUE_FILTERS[category])]
+                counters[category].update(values.value_counts().to_dict())
+    except Exception as e:
+        logging.error(f"单遍选项发现失败: {e}")
+        return {category: [] for category in OPTION_LIMITS}
+    
+    return {
+        category: OPTION_BUILDERS[category](counters[category].most_common(OPTION_LIMITS[category]))
+        for category in OPTION_LIMITS
+    }
+
+def build_event_options(results):
+    """
+    由 (事件名, 次数) 行构建事件选项
+    
+    Args:
+        results (iterable): 查询结果行
+        
+    Returns:
+        list: 事件选项
+    """
+    events = []
+    if results:
+        for row in results:
+            event_name = row[0]
+            count = row[1]
+            
+            events.append({
+                'type': 'event',
+                'key': f"event_{event_name}",
+                'value': event_name,
+                'count': count,
+                'display_name': format_event_name(event_name),
+                'category': '事件类型'
+            })
+    
+    return events
+
+def build_page_options(results):
+    """
+    由 (页面路径, 次数) 行构建页面路径选项
+    
+    Args:
+        results (iterable): 查询结果行
+        
+    Returns:
+        list: 页面路径选项
+    """
+    pages = []
+    if results:
+        for row in results:
+            original_path = row[0]
+            count = row[1]
+            
+            if original_path and original_path.strip():
+                clean_path = clean_page_path(original_path)
+                if clean_path != 'unknown':
+                    pages.append({
+                        'type': 'page',
+                        'key': f"page_{clean_path}",
+                        'value': original_path,
+                        'count': count,
+                        'display_name': f"页面: {clean_path}",
+                        'category': '页面路径'
+                    })
+    
+    return pages
+
+def build_url_options(results):
+    """
+    由 (URL, 次数) 行构建URL路径选项
+    
+    Args:
+        results (iterable): 查询结果行
+        
+    Returns:
+        list: URL路径选项
+    """
+    urls = []
+    if results:
+        for row in results:
+            url = row[0]
+            count = row[1]
+            
+            if url and url.strip():
+                # 提取URL路径部分
+                try:
+                    parsed = urlparse(url)
+                    path = parsed.path if parsed.path else url
+                    if path and path != '/':
+                        clean_url = clean_page_path(path)
+                        if clean_url != 'unknown':
+                            urls.append({
+                                'type': 'url',
+                                'key': f"url_{clean_url}",
+                                'value': url,
+                                'count': count,
+                                'display_name': f"URL: {clean_url}",
+                                'category': 'URL路径'
+                            })
+                except:
+                    pass
+    
+    return urls
+
+def build_title_options(results):
+    """
+    由 (页面标题, 次数) 行构建页面标题选项
+    
+    Args:
+        results (iterable): 查询结果行
+        
+    Returns:
+        list: 页面标题选项
+    """
+    titles = []
+    if results:
+        for row in results:
+            title = row[0]
+            count = row[1]
+            
+            if title and len(title.strip()) > 0:
+                titles.append({
+                    'type': 'title',
+                    'key': f"title_{title}",
+                    'value': title,
+                    'count': count,
+                    'display_name': f"标题: {title[:30]}{'...' if len(title) > 30 else ''}",
+                    'category': '页面标题'
+                })
+    
+    return titles
+
+def build_referrer_options(results):
+    """
+    由 (来源URL, 次数) 行构建来源渠道选项
+    
+    Args:
+        results (iterable): 查询结果行
+        
+    Returns:
+        list: 来源渠道选项
+    """
+    referrers = []
+    if results:
+        for row in results:
+            referrer = row[0]
+            count = row[1]
+            
+            if referrer and referrer.strip():
+                category, display_name = categorize_referrer(referrer)
+                referrers.append({
+                    'type': 'referrer',
+                    'key': f"referrer_{category}",
+                    'value': referrer,
+                    'count': count,
+                    'display_name': display_name,
+                    'category': '来源渠道'
+                })
+    
+    return referrers
+
 def get_event_options():
     """获取事件类型选项"""
     try:
@@ -63,23 +342,7 @@ def get_event_options():
             LIMIT 50
         '''
         results, _ = execute_query(events_query)
-        
-        events = []
-        if results:
-            for row in results:
-                event_name = row[0]
-                count = row[1]
-                
-                events.append({
-                    'type': 'event',
-                    'key': f"event_{event_name}",
-                    'value': event_name,
-                    'count': count,
-                    'display_name': format_event_name(event_name),
-                    'category': '事件类型'
-                })
-        
-        return events
+        return build_event_options(results)
         
     except Exception as e:
         logging.error(f"获取事件选项失败: {e}")
@@ -88,39 +351,21 @@ def get_event_options():
 def get_page_options():
     """获取页面路径选项"""
     try:
-        pages_query = '''
+        url_path_sql = json_property_sql('$url_path')
+        pages_query = f'''
             SELECT 
-                JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$url_path"')) AS url_path,
+                {url_path_sql} AS url_path,
                 COUNT(*) as count
             FROM summit 
-            WHERE JSON_EXTRACT(all_json, '$.properties."$url_path"') IS NOT NULL
-                AND JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$url_path"')) NOT IN ('null', '', 'undefined')
-                AND CHAR_LENGTH(JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$url_path"'))) > 0
+            WHERE {url_path_sql} IS NOT NULL
+                AND {url_path_sql} NOT IN ('null', '', 'undefined')
+                AND CHAR_LENGTH({url_path_sql}) > 0
             GROUP BY url_path 
             ORDER BY count DESC
             LIMIT 50
         '''
         results, _ = execute_query(pages_query)
-        
-        pages = []
-        if results:
-            for row in results:
-                original_path = row[0]
-                count = row[1]
-                
-                if original_path and original_path.strip():
-                    clean_path = clean_page_path(original_path)
-                    if clean_path != 'unknown':
-                        pages.append({
-                            'type': 'page',
-                            'key': f"page_{clean_path}",
-                            'value': original_path,
-                            'count': count,
-                            'display_name': f"页面: {clean_path}",
-                            'category': '页面路径'
-                        })
-        
-        return pages
+        return build_page_options(results)
         
     except Exception as e:
         logging.error(f"获取页面选项失败: {e}")
@@ -143,33 +388,7 @@ def get_url_options():
             LIMIT 30
         '''
         results, _ = execute_query(url_query)
-        
-        urls = []
-        if results:
-            for row in results:
-                url = row[0]
-                count = row[1]
-                
-                if url and url.strip():
-                    # 提取URL路径部分
-                    try:
-                        parsed = urlparse(url)
-                        path = parsed.path if parsed.path else url
-                        if path and path != '/':
-                            clean_url = clean_page_path(path)
-                            if clean_url != 'unknown':
-                                urls.append({
-                                    'type': 'url',
-                                    'key': f"url_{clean_url}",
-                                    'value': url,
-                                    'count': count,
-                                    'display_name': f"URL: {clean_url}",
-                                    'category': 'URL路径'
-                                })
-                    except:
-                        pass
-        
-        return urls
+        return build_url_options(results)
         
     except Exception as e:
         logging.error(f"获取URL选项失败: {e}")
@@ -178,37 +397,21 @@ def get_url_options():
 def get_title_options():
     """获取页面标题选项"""
     try:
-        title_query = '''
+        title_sql = json_property_sql('$title')
+        title_query = f'''
             SELECT 
-                JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$title"')) AS page_title,
+                {title_sql} AS page_title,
                 COUNT(*) as count
             FROM summit 
-            WHERE JSON_EXTRACT(all_json, '$.properties."$title"') IS NOT NULL
-                AND JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$title"')) NOT IN ('null', '', 'undefined')
-                AND CHAR_LENGTH(JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$title"'))) > 0
+            WHERE {title_sql} IS NOT NULL
+                AND {title_sql} NOT IN ('null', '', 'undefined')
+                AND CHAR_LENGTH({title_sql}) > 0
             GROUP BY page_title 
             ORDER BY count DESC
             LIMIT 30
         '''
         results, _ = execute_query(title_query)
-        
-        titles = []
-        if results:
-            for row in results:
-                title = row[0]
-                count = row[1]
-                
-                if title and len(title.strip()) > 0:
-                    titles.append({
-                        'type': 'title',
-                        'key': f"title_{title}",
-                        'value': title,
-                        'count': count,
-                        'display_name': f"标题: {title[:30]}{'...' if len(title) > 30 else ''}",
-                        'category': '页面标题'
-                    })
-        
-        return titles
+        return build_title_options(results)
         
     except Exception as e:
         logging.error(f"获取标题选项失败: {e}")
@@ -230,35 +433,51 @@ def get_referrer_options():
             LIMIT 20
         '''
         results, _ = execute_query(referrer_query)
-        
-        referrers = []
-        if results:
-            for row in results:
-                referrer = row[0]
-                count = row[1]
-                
-                if referrer and referrer.strip():
-                    category, display_name = categorize_referrer(referrer)
-                    referrers.append({
-                        'type': 'referrer',
-                        'key': f"referrer_{category}",
-                        'value': referrer,
-                        'count': count,
-                        'display_name': display_name,
-                        'category': '来源渠道'
-                    })
-        
-        return referrers
+        return build_referrer_options(results)
         
     except Exception as e:
         logging.error(f"获取来源选项失败: {e}")
         return []
 
+# 单遍选项发现：类别 -> 结果列下标 / 数量上限 / 选项构建函数
+OPTION_LIMITS = {
+    'events': 50,
+    'pages': 50,
+    'urls': 30,
+    'titles': 30,
+    'referrers': 20
+}
+
+# 不支持SQL的数据源：类别 -> 事件列 / 取值过滤条件（与 option_sql_filters 一致）
+OPTION_SOURCE_COLUMNS = {
+    'events': 'event',
+    'pages': 'url_path',
+    'urls': 'url',
+    'titles': 'page_title',
+    'referrers': 'referrer'
+}
+
+OPTION_VALUE_FILTERS = {
+    'events': lambda value: value != '',
+    'pages': lambda value: value not in ('null', '', 'undefined'),
+    'urls': lambda value: value != '' and 'localhost' not in value.lower() and '127.0.0.1' not in value,
+    'titles': lambda value: value not in ('null', '', 'undefined'),
+    'referrers': lambda value: value != '' and 'localhost' not in value.lower()
+}
+
+OPTION_BUILDERS = {
+    'events': build_event_options,
+    'pages': build_page_options,
+    'urls': build_url_options,
+    'titles': build_title_options,
+    'referrers': build_referrer_options
+}
+
 @analysis_bp.route('/api/events', methods=['GET'])
 def get_available_events():
     """获取所有可用的事件类型（兼容旧接口）"""
     try:
-        events = get_event_options()
+        events = get_cached_options('events')
         # 转换为旧格式
         old_format_events = []
         for event in events:
@@ -278,7 +497,7 @@ def get_available_events():
 def get_available_pages():
     """获取所有可用的页面路径（兼容旧接口）"""
     try:
-        pages = get_page_options()
+        pages = get_cached_options('pages')
         # 转换为旧格式
         old_format_pages = []
         for page in pages:
@@ -3,29 +3,60 @@
 
 from flask import Blueprint, jsonify, request
 import logging
-from database import execute_query, test_connection
-from utils import get_time_condition, generate_mock_trend_data, generate_mock_hourly_data
+from datetime import datetime, timedelta
+import pandas as pd
+from database import (
+    execute_query, test_connection, get_pool_stats, get_bulk_insert_stats, json_property_sql, get_event_source
+)
+from utils import (
+    get_time_condition, get_time_bounds, build_dataframe_from_chunks, generate_mock_trend_data, generate_mock_hourly_data,
+    get_memoized_stats, get_result_cache_stats
+)
+from utils.hll import HyperLogLog
+from rollup import (
+    load_hourly_rollups, refresh_rollups_async, estimate_basic_metrics, estimate_os_users, PV_EVENTS, OS_USER_EVENT
+)
+from jobs import get_job_stats
+from collector import get_collector_stats
+from config import get_config
 
 # 创建蓝图
 dashboard_bp = Blueprint('dashboard', __name__)
+config = get_config()
 
 @dashboard_bp.route('/api/dashboard', methods=['GET'])
 def dashboard_api():
-    """仪表板数据API"""
+    """
+    仪表板数据API
+    
+    参数：
+    - timeRange：时间范围
+    - exact：true 时UV使用 COUNT(DISTINCT) 精确计算，默认由小时草图估计
+    """
     try:
         time_range = request.args.get('timeRange', 'today')
+        exact = request.args.get('exact', '').lower() in ('1', 'true')
+        
+        # 不支持SQL的数据源（Parquet）直接在事件数据上计算
+        source = get_event_source()
+        if not source.supports_sql:
+            return jsonify(build_dashboard_from_events(source, time_range))
         
         time_condition = get_time_condition(time_range)
         
+        # UV估计使用的时间范围（精确模式或不支持草图时为None）
+        time_bounds = get_uv_sketch_bounds(time_range, exact)
+        
         # 基础统计查询
-        metrics = get_basic_metrics(time_condition)
+        metrics = get_basic_metrics(time_condition, time_bounds)
         
         # 设备分布数据
-        device_data = get_device_distribution(time_condition)
+        device_data = get_device_distribution(time_condition, time_bounds)
         
-        # 生成趋势数据
-        trend_data = generate_mock_trend_data(time_range)
-        hourly_data = generate_mock_hourly_data()
+        # 趋势和热力图来自小时汇总表，汇总过旧时后台增量更新
+        refresh_rollups_async()
+        trend_data = get_trend_data(time_range)
+        hourly_data = get_hourly_heatmap_data()
         
         result = {
             'metrics': metrics,
@@ -40,21 +71,125 @@ def dashboard_api():
         logging.error(f"仪表板API错误: {e}")
         return jsonify({'error': f'获取仪表板数据失败: {str(e)}'}), 500
 
-def get_basic_metrics(time_condition):
+def get_uv_sketch_bounds(time_range, exact=False):
+    """
+    获取UV草图估计使用的时间范围
+    
+    Args:
+        time_range (str): 时间范围
+        exact (bool): 是否要求精确计算
+        
+    Returns:
+        tuple: (起始时间戳, 结束时间戳)；精确模式、未启用、草图误差超过
+               APPROX_UV_MAX_ERROR 或全部时间时返回None
+    """
+    if exact or not config.APPROX_UV_ENABLED:
+        return None
+    if HyperLogLog(config.HLL_PRECISION).relative_error() > config.APPROX_UV_MAX_ERROR:
+        return None
+    start_ts, end_ts = get_time_bounds(time_range)
+    if start_ts is None:
+        return None
+    return start_ts, end_ts
+
+def get_trend_data(time_range):
+    """
+    从小时汇总获取UV/PV趋势（今天/昨天按小时，其余按天）
+    
+    Args:
+        time_range (str): 时间范围
+        
+    Returns:
+        dict: 趋势数据 {'dates', 'uv', 'pv'}，汇总不可用时返回模拟数据
+    """
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    if time_range in ('today', 'yesterday'):
+        day_start = today_start if time_range == 'today' else today_start - timedelta(days=1)
+        hours = 24 if time_range == 'yesterday' else datetime.now().hour + 1
+        start_ts = int(day_start.timestamp())
+        rollups = load_hourly_rollups(start_ts, start_ts + hours * 3600)
+        if rollups is None:
+            return generate_mock_trend_data(time_range)
+        
+        buckets = [start_ts + hour * 3600 for hour in range(hours)]
+        return {
+            'dates': [f"{hour:02d}:00" for hour in range(hours)],
+            'uv': [rollups[b]['users'].count() if b in rollups else 0 for b in buckets],
+            'pv': [rollups[b]['pv'] if b in rollups else 0 for b in buckets]
+        }
+    
+    days = {'last30days': 30}.get(time_range, 7)
+    first_day = today_start - timedelta(days=days - 1)
+    start_ts = int(first_day.timestamp())
+    rollups = load_hourly_rollups(start_ts, int((today_start + timedelta(days=1)).timestamp()))
+    if rollups is None:
+        return generate_mock_trend_data(time_range)
+    
+    dates, uv, pv = [], [], []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        day_ts = int(day.timestamp())
+        day_rows = [rollups[b] for b in range(day_ts, day_ts + 86400, 3600) if b in rollups]
+        dates.append(day.strftime('%m-%d'))
+        uv.append(HyperLogLog.merge_all(row['users'] for row in day_rows).count())
+        pv.append(sum(row['pv'] for row in day_rows))
+    
+    return {'dates': dates, 'uv': uv, 'pv': pv}
+
+def get_hourly_heatmap_data():
+    """
+    从小时汇总获取最近7天 × 24小时的活跃用户热力图
+    
+    Returns:
+        dict: {'hourlyData': [[小时, 天序号, 活跃用户数], ...]}，天序号0为6天前，
+              汇总不可用时返回模拟数据
+    """
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day_ts = int((today_start - timedelta(days=6)).timestamp())
+    rollups = load_hourly_rollups(first_day_ts, int((today_start + timedelta(days=1)).timestamp()))
+    if rollups is None:
+        return generate_mock_hourly_data()
+    
+    hourly_data = []
+    for hour in range(24):
+        for day in range(7):
+            bucket = first_day_ts + day * 86400 + hour * 3600
+            users = rollups[bucket]['users'].count() if bucket in rollups else 0
+            hourly_data.append([hour, day, users])
+    
+    return {'hourlyData': hourly_data}
+
+def get_basic_metrics(time_condition, time_bounds=None):
     """
     获取基础指标数据
     
     Args:
         time_condition (str): 时间条件
+        time_bounds (tuple): 传入时由小时汇总估计（UV合并草图、PV和会话取汇总），
+                             只扫描不足一小时的边缘区间，不再执行全范围查询
         
     Returns:
-        dict: 基础指标
+        dict: 基础指标（uv_relative_error 为UV的相对标准误差，精确计算时为0）
     """
     try:
+        estimate = estimate_basic_metrics(*time_bounds) if time_bounds else None
+        if estimate is not None:
+            sessions = estimate['sessions']
+            return {
+                'total_users': estimate['users'].count(),
+                'total_pv': estimate['pv'],
+                'avg_session_duration': round(sessions['engaged_duration'] / sessions['engaged_sessions'], 1)
+                                        if sessions['engaged_sessions'] else (0 if sessions['sessions'] else 125.5),
+                'bounce_rate': round(sessions['bounce_sessions'] / sessions['sessions'] * 100, 1)
+                               if sessions['sessions'] else 35.2,
+                'uv_approximate': True,
+                'uv_relative_error': round(float(estimate['users'].relative_error()), 4)
+            }
+        
         stats_query = f'''
             SELECT 
                 COUNT(DISTINCT distinct_id) as total_users,
-                COUNT(*) as total_events,
                 COUNT(CASE WHEN event IN ('$MPViewScreen', '$MPShow') THEN 1 END) as total_pv
             FROM summit
             WHERE event IS NOT NULL
@@ -65,10 +200,9 @@ def get_basic_metrics(time_condition):
         
         if results:
             total_users = int(results[0]) if results[0] else 0
-            total_events = int(results[1]) if results[1] else 0
-            total_pv = int(results[2]) if results[2] else 0
+            total_pv = int(results[1]) if results[1] else 0
         else:
-            total_users = total_events = total_pv = 0
+            total_users = total_pv = 0
         
         # 计算会话相关指标（简化处理）
         session_metrics = calculate_session_metrics(time_condition)
@@ -77,7 +211,9 @@ def get_basic_metrics(time_condition):
             'total_users': total_users,
             'total_pv': total_pv,
             'avg_session_duration': session_metrics.get('avg_duration', 125.5),
-            'bounce_rate': session_metrics.get('bounce_rate', 35.2)
+            'bounce_rate': session_metrics.get('bounce_rate', 35.2),
+            'uv_approximate': False,
+            'uv_relative_error': 0
         }
         
     except Exception as e:
@@ -86,12 +222,17 @@ def get_basic_metrics(time_condition):
             'total_users': 0,
             'total_pv': 0,
             'avg_session_duration': 0,
-            'bounce_rate': 0
+            'bounce_rate': 0,
+            'uv_approximate': False,
+            'uv_relative_error': 0
         }
 
 def calculate_session_metrics(time_condition):
     """
-    计算会话相关指标
+    计算会话相关指标（在数据库端按会话超时切分会话，只返回汇总值）
+    
+    同一用户相邻事件间隔超过 SESSION_TIMEOUT 即开始新会话；
+    平均时长按含多个事件的会话计算，跳出率为只有一个事件的会话占比。
     
     Args:
         time_condition (str): 时间条件
@@ -100,48 +241,60 @@ def calculate_session_metrics(time_condition):
         dict: 会话指标
     """
     try:
-        # 简化的会话时长计算
         session_query = f'''
             SELECT 
-                distinct_id,
-                MIN(created_at) as session_start,
-                MAX(created_at) as session_end,
-                COUNT(*) as event_count
-            FROM summit
-            WHERE event IS NOT NULL
-            {time_condition}
-            GROUP BY distinct_id
-            HAVING COUNT(*) >= 2
+                COUNT(*) AS total_sessions,
+                SUM(event_count = 1) AS bounce_sessions,
+                SUM(CASE WHEN event_count > 1 THEN duration ELSE 0 END) AS total_duration,
+                SUM(event_count > 1) AS engaged_sessions
+            FROM (
+                SELECT 
+                    distinct_id,
+                    session_no,
+                    COUNT(*) AS event_count,
+                    MAX(created_at) - MIN(created_at) AS duration
+                FROM (
+                    SELECT 
+                        distinct_id,
+                        created_at,
+                        SUM(is_new_session) OVER (
+                            PARTITION BY distinct_id ORDER BY created_at
+                            ROWS UNBOUNDED PRECEDING
+                        ) AS session_no
+                    FROM (
+                        SELECT 
+                            distinct_id,
+                            created_at,
+                            CASE 
+                                WHEN LAG(created_at) OVER w IS NULL THEN 1
+                                WHEN created_at - LAG(created_at) OVER w > %s THEN 1
+                                ELSE 0
+                            END AS is_new_session
+                        FROM summit
+                        WHERE event IS NOT NULL
+                        {time_condition}
+                        WINDOW w AS (PARTITION BY distinct_id ORDER BY created_at)
+                    ) AS marked_events
+                ) AS numbered_events
+                GROUP BY distinct_id, session_no
+            ) AS sessions
         '''
         
-        results, _ = execute_query(session_query)
+        results, _ = execute_query(session_query, (config.SESSION_TIMEOUT,), fetch_all=False)
         
-        if not results:
+        if not results or not results[0]:
             return {'avg_duration': 125.5, 'bounce_rate': 35.2}
         
-        total_duration = 0
-        valid_sessions = 0
-        single_event_sessions = 0
-        
-        for row in results:
-            session_start = row[1]
-            session_end = row[2]
-            event_count = row[3]
-            
-            if session_end > session_start:
-                duration = session_end - session_start
-                total_duration += duration
-                valid_sessions += 1
-            
-            if event_count == 1:
-                single_event_sessions += 1
+        total_sessions = int(results[0])
+        bounce_sessions = int(results[1] or 0)
+        total_duration = float(results[2] or 0)
+        engaged_sessions = int(results[3] or 0)
         
         # 计算平均会话时长
-        avg_duration = (total_duration / valid_sessions) if valid_sessions > 0 else 125.5
+        avg_duration = (total_duration / engaged_sessions) if engaged_sessions > 0 else 0
         
-        # 计算跳出率（单页面会话比例）
-        total_sessions = len(results) + single_event_sessions
-        bounce_rate = (single_event_sessions / total_sessions * 100) if total_sessions > 0 else 35.2
+        # 计算跳出率（单事件会话比例）
+        bounce_rate = bounce_sessions / total_sessions * 100
         
         return {
             'avg_duration': round(avg_duration, 1),
@@ -152,20 +305,27 @@ def calculate_session_metrics(time_condition):
         logging.error(f"计算会话指标失败: {e}")
         return {'avg_duration': 125.5, 'bounce_rate': 35.2}
 
-def get_device_distribution(time_condition):
+def get_device_distribution(time_condition, time_bounds=None):
     """
     获取设备分布数据
     
     Args:
         time_condition (str): 时间条件
+        time_bounds (tuple): 传入时按OS的用户数由小时草图估计
         
     Returns:
         list: 设备分布数据
     """
     try:
+        os_sketches = estimate_os_users(*time_bounds) if time_bounds else None
+        if os_sketches is not None:
+            return build_device_distribution(
+                (os_name, sketch.count()) for os_name, sketch in os_sketches.items()
+            )
+        
         device_query = f'''
             SELECT 
-                JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$os"')) as os,
+                {json_property_sql('$os')} as os,
                 COUNT(DISTINCT distinct_id) as user_count
             FROM summit
             WHERE event = '$MPLaunch'
@@ -176,29 +336,7 @@ def get_device_distribution(time_condition):
         
         results, _ = execute_query(device_query)
         
-        device_data = []
-        if results:
-            for row in results:
-                os_name = row[0]
-                user_count = int(row[1])
-                
-                if os_name and os_name.strip():
-                    # 映射操作系统名称
-                    display_name = map_os_name(os_name)
-                    device_data.append({
-                        'value': user_count,
-                        'name': display_name
-                    })
-        
-        # 如果没有数据，返回示例数据
-        if not device_data:
-            device_data = [
-                {'value': 600, 'name': 'iOS'},
-                {'value': 350, 'name': 'Android'},
-                {'value': 50, 'name': '其他'}
-            ]
-        
-        return device_data
+        return build_device_distribution((row[0], int(row[1])) for row in results or [])
         
     except Exception as e:
         logging.error(f"获取设备分布失败: {e}")
@@ -209,6 +347,192 @@ def get_device_distribution(time_condition):
             {'value': 50, 'name': '其他'}
         ]
 
+def build_device_distribution(os_counts):
+    """
+    生成设备分布数据
+    
+    Args:
+        os_counts (iterable): (原始操作系统名称, 用户数)
+        
+    Returns:
+        list: 设备分布数据，没有数据时返回示例数据
+    """
+    device_data = []
+    for os_name, user_count in os_counts:
+        if os_name and os_name.strip():
+            # 映射操作系统名称
+            device_data.append({
+                'value': user_count,
+                'name': map_os_name(os_name)
+            })
+    
+    # 如果没有数据，返回示例数据
+    if not device_data:
+        device_data = [
+            {'value': 600, 'name': 'iOS'},
+            {'value': 350, 'name': 'Android'},
+            {'value': 50, 'name': '其他'}
+        ]
+    
+    return device_data
+
+def build_dashboard_from_events(source, time_range, now=None):
+    """
+    在事件数据上计算仪表板（不支持SQL的数据源使用，口径与SQL/小时汇总版本一致）
+    
+    一次读取 时间范围 ∪ 最近7天 的事件，指标、会话、设备分布、趋势和热力图
+    都在同一个DataFrame上计算；UV为精确去重。
+    
+    Args:
+        source (EventSource): 事件数据源
+        time_range (str): 时间范围
+        now (datetime): 基准时间，默认当前时间
+        
+    Returns:
+        dict: 与 /api/dashboard 相同结构的结果
+    """
+    now = now or datetime.now()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    heatmap_start_ts = int((today_start - timedelta(days=6)).timestamp())
+    start_ts, end_ts = get_time_bounds(time_range, now)
+    trend_days = 1 if time_range in ('today', 'yesterday') else {'last30days': 30}.get(time_range, 7)
+    trend_start_ts = int((today_start - timedelta(days=1 if time_range == 'yesterday' else trend_days - 1)).timestamp())
+    
+    read_start_ts = min(ts for ts in (start_ts, heatmap_start_ts, trend_start_ts) if ts is not None)
+    if start_ts is None:
+        read_start_ts = None
+    chunks = source.iter_events(['distinct_id', 'event', 'created_at', 'os'], read_start_ts, int(now.timestamp()))
+    df = build_dataframe_from_chunks(chunks, category_columns=['event', 'os'])
+    if df.empty:
+        df = pd.DataFrame(columns=['distinct_id', 'event', 'created_at', 'os'])
+    df = df[df['event'].notna()]
+    df['created_at'] = df['created_at'].astype('int64')
+    
+    in_range = df
+    if start_ts is not None:
+        in_range = df[(df['created_at'] >= start_ts) & (df['created_at'] <= end_ts)]
+    
+    session_metrics = calculate_session_metrics_from_events(in_range)
+    metrics = {
+        'total_users': int(in_range['distinct_id'].nunique()),
+        'total_pv': int(in_range['event'].isin(PV_EVENTS).sum()),
+        'avg_session_duration': session_metrics['avg_duration'],
+        'bounce_rate': session_metrics['bounce_rate'],
+        'uv_approximate': False,
+        'uv_relative_error': 0
+    }
+    
+    return {
+        'metrics': metrics,
+        'trend': build_trend_from_events(df, time_range, today_start, now),
+        'device': {'devices': build_device_distribution_from_events(in_range)},
+        'hourly': build_hourly_heatmap_from_events(df, heatmap_start_ts)
+    }
+
+def calculate_session_metrics_from_events(df):
+    """
+    在事件数据上计算会话指标（与 calculate_session_metrics 口径一致）
+    
+    Args:
+        df (pandas.DataFrame): 含 distinct_id、created_at 的事件数据
+        
+    Returns:
+        dict: 会话指标
+    """
+    if df.empty:
+        return {'avg_duration': 125.5, 'bounce_rate': 35.2}
+    
+    events = df[['distinct_id', 'created_at']].sort_values(['distinct_id', 'created_at'])
+    new_user = events['distinct_id'].ne(events['distinct_id'].shift())
+    new_session = new_user | (events['created_at'].diff() > config.SESSION_TIMEOUT)
+    sessions = events.groupby(new_session.cumsum())['created_at'].agg(['count', 'min', 'max'])
+    
+    engaged = sessions[sessions['count'] > 1]
+    avg_duration = float((engaged['max'] - engaged['min']).mean()) if not engaged.empty else 0
+    bounce_rate = float((sessions['count'] == 1).mean() * 100)
+    
+    return {
+        'avg_duration': round(avg_duration, 1),
+        'bounce_rate': round(bounce_rate, 1)
+    }
+
+def build_device_distribution_from_events(df):
+    """
+    在事件数据上计算设备分布（与 get_device_distribution 口径一致）
+    
+    Args:
+        df (pandas.DataFrame): 含 distinct_id、event、os 的事件数据
+        
+    Returns:
+        list: 设备分布数据
+    """
+    launches = df[(df['event'] == OS_USER_EVENT) & df['os'].notna()]
+    launches = launches[launches['os'].astype(str).str.strip().ne('') & (launches['os'].astype(str) != 'null')]
+    user_counts = launches.groupby(launches['os'].astype(str))['distinct_id'].nunique()
+    
+    device_data = [
+        {'value': int(user_count), 'name': map_os_name(os_name)}
+        for os_name, user_count in user_counts.items()
+    ]
+    if not device_data:
+        device_data = [
+            {'value': 600, 'name': 'iOS'},
+            {'value': 350, 'name': 'Android'},
+            {'value': 50, 'name': '其他'}
+        ]
+    return device_data
+
+def build_trend_from_events(df, time_range, today_start, now):
+    """
+    在事件数据上计算UV/PV趋势（与 get_trend_data 的分桶方式一致）
+    
+    Returns:
+        dict: 趋势数据 {'dates', 'uv', 'pv'}
+    """
+    if time_range in ('today', 'yesterday'):
+        day_start = today_start if time_range == 'today' else today_start - timedelta(days=1)
+        hours = 24 if time_range == 'yesterday' else now.hour + 1
+        start_ts = int(day_start.timestamp())
+        bucket_size = 3600
+        labels = [f"{hour:02d}:00" for hour in range(hours)]
+        bucket_count = hours
+    else:
+        days = {'last30days': 30}.get(time_range, 7)
+        day_start = today_start - timedelta(days=days - 1)
+        start_ts = int(day_start.timestamp())
+        bucket_size = 86400
+        labels = [(day_start + timedelta(days=offset)).strftime('%m-%d') for offset in range(days)]
+        bucket_count = days
+    
+    window = df[(df['created_at'] >= start_ts) & (df['created_at'] < start_ts + bucket_count * bucket_size)]
+    buckets = (window['created_at'] - start_ts) // bucket_size
+    uv = window.groupby(buckets)['distinct_id'].nunique()
+    pv = window['event'].isin(PV_EVENTS).groupby(buckets).sum()
+    
+    return {
+        'dates': labels,
+        'uv': [int(uv.get(b, 0)) for b in range(bucket_count)],
+        'pv': [int(pv.get(b, 0)) for b in range(bucket_count)]
+    }
+
+def build_hourly_heatmap_from_events(df, first_day_ts):
+    """
+    在事件数据上计算最近7天 × 24小时的活跃用户热力图
+    
+    Returns:
+        dict: {'hourlyData': [[小时, 天序号, 活跃用户数], ...]}
+    """
+    window = df[(df['created_at'] >= first_day_ts) & (df['created_at'] < first_day_ts + 7 * 86400)]
+    offsets = window['created_at'] - first_day_ts
+    users = window.groupby([offsets // 86400, offsets % 86400 // 3600])['distinct_id'].nunique()
+    
+    hourly_data = []
+    for hour in range(24):
+        for day in range(7):
+            hourly_data.append([hour, day, int(users.get((day, hour), 0))])
+    
+    return {'hourlyData': hourly_data}
+
 def map_os_name(os_name):
     """
     映射操作系统名称
@@ -270,6 +594,7 @@ def debug():
             'database_status': 'connected',
             'total_records': connection_test.get('record_count', 0),
             'event_distribution': event_distribution,
+            'db_pool': get_pool_stats(),
             'api_status': 'optimized'
         })
         
@@ -277,6 +602,23 @@ def debug():
         logging.error(f"调试接口错误: {e}")
         return jsonify({'error': f'Debug failed: {str(e)}'}), 500
 
+@dashboard_bp.route('/api/metrics', methods=['GET'])
+def metrics():
+    """运行时指标接口（当前worker进程）"""
+    try:
+        return jsonify({
+            'db_pool': get_pool_stats(),
+            'normalizer_cache': get_memoized_stats(),
+            'result_cache': get_result_cache_stats(),
+            'analysis_jobs': get_job_stats(),
+            'bulk_insert': get_bulk_insert_stats(),
+            'event_collector': get_collector_stats()
+        })
+        
+    except Exception as e:
+        logging.error(f"获取运行指标失败: {e}")
+        return jsonify({'error': f'获取运行指标失败: {str(e)}'}), 500
+
 @dashboard_bp.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
@@ -0,0 +1,346 @@
+# api/event_analysis.py
+# ⚡ 事件分析API模块（按时间粒度和属性分组的指标趋势）
+
+from flask import Blueprint, jsonify, request
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from database import execute_query, get_event_source, event_column_sql
+from utils import format_event_name, LRUCache
+from config import get_config
+
+# 创建蓝图
+event_analysis_bp = Blueprint('event_analysis', __name__)
+config = get_config()
+
+# 指标 -> 每个时间桶保存的聚合值（sum/avg 共用 时长合计 + 有时长的事件数）
+EVENT_METRICS = {
+    'count': 'count',
+    'uv': 'uv',
+    'sum_duration': 'duration',
+    'avg_duration': 'duration'
+}
+
+# 分组属性 -> 扁平化事件列（EVENT_COLUMNS）
+EVENT_GROUP_BY = {
+    'event': 'event',
+    '$os': 'os',
+    '$brand': 'brand',
+    '$title': 'page_title',
+    '$url_path': 'url_path',
+    '$screen_name': 'screen_name'
+}
+
+# 时间粒度 -> 桶长度（秒）；按天的桶从本地零点开始
+EVENT_GRANULARITIES = {'hour': 3600, 'day': 86400}
+
+# 时间范围 -> 覆盖的自然日数（含今天，与仪表板趋势一致）
+EVENT_TIME_RANGE_DAYS = {'today': 1, 'yesterday': 1, 'last7days': 7, 'last30days': 30}
+
+# 已结束时间桶的聚合结果：缓存键 -> {桶开始时间戳: {(事件, 分组值): [值, 时长计数]}}
+event_bucket_cache = LRUCache(
+    'event_analysis_buckets', maxsize=config.PATH_CACHE_MAX_ENTRIES, ttl=config.EVENT_ANALYSIS_CACHE_TTL,
+    sizeof=lambda buckets: 64 * sum(len(values) + 1 for values in buckets.values())
+)
+_bucket_cache_lock = threading.Lock()
+
+@event_analysis_bp.route('/api/event-analysis', methods=['GET', 'POST'])
+def event_analysis_api():
+    """
+    事件分析API
+
+    参数（JSON请求体或查询参数）：
+    - events：事件列表，查询参数用逗号分隔
+    - metric：count / uv / sum_duration / avg_duration
+    - groupBy：分组属性（$os、$brand、$title、$url_path、$screen_name、event），为空不分组
+    - granularity：hour / day
+    - timeRange：today / yesterday / last7days / last30days
+    """
+    try:
+        params = parse_event_params(request.get_json(silent=True) or request.values)
+
+        error = validate_event_params(params)
+        if error:
+            return jsonify({'error': error}), 400
+
+        return jsonify(run_event_analysis(params))
+
+    except ValueError as e:
+        return jsonify({'error': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"事件分析API错误: {e}")
+        return jsonify({'error': f'事件分析失败: {str(e)}'}), 500
+
+def parse_event_params(args):
+    """
+    解析事件分析参数
+
+    Args:
+        args (dict): 请求参数
+
+    Returns:
+        dict: 规范化后的参数
+    """
+    events = args.get('events', '')
+    if isinstance(events, str):
+        events = events.split(',')
+
+    return {
+        'events': tuple(sorted({event.strip() for event in events if event and event.strip()})),
+        'metric': args.get('metric', 'count'),
+        'group_by': args.get('groupBy') or '',
+        'granularity': args.get('granularity', 'day'),
+        'time_range': args.get('timeRange', 'last7days')
+    }
+
+def validate_event_params(params):
+    """
+    校验事件分析参数
+
+    Returns:
+        str: 错误信息，校验通过时返回None
+    """
+    if not params['events']:
+        return '请至少选择一个事件'
+    if len(params['events']) > config.EVENT_ANALYSIS_MAX_EVENTS:
+        return f'最多选择 {config.EVENT_ANALYSIS_MAX_EVENTS} 个事件'
+    if params['metric'] not in EVENT_METRICS:
+        return f"不支持的指标: {params['metric']}"
+    if params['group_by'] and params['group_by'] not in EVENT_GROUP_BY:
+        return f"不支持的分组属性: {params['group_by']}"
+    if params['granularity'] not in EVENT_GRANULARITIES:
+        return '时间粒度只支持 hour / day'
+    if params['time_range'] not in EVENT_TIME_RANGE_DAYS:
+        return f"不支持的时间范围: {params['time_range']}"
+    return None
+
+def event_time_window(time_range, now):
+    """
+    时间范围 -> (第一天零点时间戳, 结束时间戳)，覆盖完整的自然日
+
+    Args:
+        time_range (str): 时间范围
+        now (datetime): 当前时间
+
+    Returns:
+        tuple: (起始时间戳, 结束时间戳)，闭区间
+    """
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if time_range == 'yesterday':
+        return int((today - timedelta(days=1)).timestamp()), int(today.timestamp()) - 1
+    first_day = today - timedelta(days=EVENT_TIME_RANGE_DAYS[time_range] - 1)
+    return int(first_day.timestamp()), int(now.timestamp())
+
+def run_event_analysis(params, now=None):
+    """
+    执行事件分析
+
+    已结束的时间桶从缓存读取，只聚合缺失的桶和当前桶（一次查询/扫描）。
+
+    Args:
+        params (dict): parse_event_params 的结果
+        now (datetime): 当前时间
+
+    Returns:
+        dict: 分析结果
+    """
+    now = now or datetime.now()
+    bucket_size = EVENT_GRANULARITIES[params['granularity']]
+    start_ts, end_ts = event_time_window(params['time_range'], now)
+    bucket_starts = list(range(start_ts, end_ts + 1, bucket_size))
+    completed_before = int(now.timestamp()) - config.EVENT_ANALYSIS_LAG
+
+    cache_key = (params['events'], EVENT_METRICS[params['metric']], params['group_by'], params['granularity'])
+    with _bucket_cache_lock:
+        cached = dict(event_bucket_cache.get(cache_key) or {})
+
+    missing = [bucket for bucket in bucket_starts
+               if bucket not in cached or bucket + bucket_size > completed_before]
+    if missing:
+        start_time = time.monotonic()
+        fresh = aggregate_event_buckets(params, missing[0], end_ts, bucket_size)
+        logging.info(f"事件分析聚合: {len(missing)} 个时间桶，耗时 {time.monotonic() - start_time:.2f} 秒")
+
+        for bucket in missing:
+            values = fresh.get(bucket, {})
+            cached[bucket] = values
+        # 只缓存已结束的时间桶
+        completed = {bucket: values for bucket, values in cached.items() if bucket + bucket_size <= completed_before}
+        with _bucket_cache_lock:
+            merged = dict(event_bucket_cache.get(cache_key) or {})
+            merged.update(completed)
+            event_bucket_cache.set(cache_key, merged)
+
+    return build_event_result(params, bucket_starts, cached)
+
+def aggregate_event_buckets(params, start_ts, end_ts, bucket_size):
+    """
+    按 (时间桶, 事件, 分组值) 聚合
+
+    支持SQL的数据源执行一条 GROUP BY 查询，否则列式扫描事件数据。
+
+    Args:
+        params (dict): 分析参数
+        start_ts (int): 第一个时间桶的开始时间戳
+        end_ts (int): 结束时间戳（闭区间）
+        bucket_size (int): 桶长度（秒）
+
+    Returns:
+        dict: {桶开始时间戳: {(事件, 分组值): [值, 时长计数]}}
+    """
+    source = get_event_source()
+    family = EVENT_METRICS[params['metric']]
+    group_column = EVENT_GROUP_BY.get(params['group_by'])
+
+    if source.supports_sql:
+        rows = query_event_buckets(params['events'], family, group_column, start_ts, end_ts, bucket_size)
+    else:
+        rows = scan_event_buckets(source, params['events'], family, group_column, start_ts, end_ts, bucket_size)
+
+    result = {}
+    for bucket_index, event, group_value, value, duration_count in rows:
+        bucket = start_ts + int(bucket_index) * bucket_size
+        result.setdefault(bucket, {})[(event, group_value)] = [float(value or 0), int(duration_count or 0)]
+    return result
+
+def query_event_buckets(events, family, group_column, start_ts, end_ts, bucket_size):
+    """
+    单条聚合SQL
+
+    Returns:
+        list: [(桶序号, 事件, 分组值, 值, 时长计数)]
+    """
+    group_sql = f"COALESCE({event_column_sql(group_column)}, '')" if group_column else "''"
+    if family == 'count':
+        value_sql, count_sql = 'COUNT(*)', '0'
+    elif family == 'uv':
+        value_sql, count_sql = 'COUNT(DISTINCT distinct_id)', '0'
+    else:
+        duration_sql = event_column_sql('event_duration')
+        value_sql = f'SUM(CAST({duration_sql} AS DECIMAL(20, 3)))'
+        count_sql = f'COUNT({duration_sql})'
+
+    placeholders = ', '.join(['%s'] * len(events))
+    query = f"""
+    SELECT
+        FLOOR((created_at - %s) / %s) AS bucket_index,
+        event,
+        {group_sql} AS group_value,
+        {value_sql} AS value,
+        {count_sql} AS duration_count
+    FROM summit
+    WHERE created_at >= %s AND created_at <= %s
+    AND event IN ({placeholders})
+    GROUP BY bucket_index, event, group_value
+    """
+    rows, _ = execute_query(query, [start_ts, bucket_size, start_ts, end_ts, *events])
+    if rows is None:
+        raise RuntimeError('事件分析查询失败')
+    return rows
+
+def scan_event_buckets(source, events, family, group_column, start_ts, end_ts, bucket_size):
+    """
+    列式扫描聚合（口径与SQL版本一致；UV在每块内先去重）
+
+    Returns:
+        list: [(桶序号, 事件, 分组值, 值, 时长计数)]
+    """
+    columns = ['created_at', 'event']
+    if group_column and group_column not in columns:
+        columns.append(group_column)
+    if family == 'uv':
+        columns.append('distinct_id')
+    elif family == 'duration':
+        columns.append('event_duration')
+
+    keys = ['bucket_index', 'event', 'group_value']
+    parts = []
+    for chunk in source.iter_events(columns, start_ts, end_ts, events=list(events)):
+        if chunk.empty:
+            continue
+        frame = pd.DataFrame({
+            'bucket_index': (pd.to_numeric(chunk['created_at'], errors='coerce').fillna(start_ts).astype('int64') - start_ts) // bucket_size,
+            'event': chunk['event'],
+            'group_value': chunk[group_column].fillna('').astype(str) if group_column else ''
+        })
+        if family == 'count':
+            parts.append(frame.groupby(keys).size().rename('value').reset_index())
+        elif family == 'uv':
+            frame['distinct_id'] = chunk['distinct_id']
+            parts.append(frame[frame['distinct_id'].notna()].drop_duplicates())
+        else:
+            frame['duration'] = pd.to_numeric(chunk['event_duration'], errors='coerce')
+            parts.append(frame.groupby(keys)['duration'].agg(['sum', 'count']).reset_index())
+
+    if not parts:
+        return []
+    combined = pd.concat(parts, ignore_index=True)
+    if family == 'count':
+        aggregated = combined.groupby(keys)['value'].sum().reset_index()
+        aggregated['duration_count'] = 0
+    elif family == 'uv':
+        aggregated = combined.groupby(keys)['distinct_id'].nunique().rename('value').reset_index()
+        aggregated['duration_count'] = 0
+    else:
+        aggregated = combined.groupby(keys)[['sum', 'count']].sum().reset_index()
+        aggregated.columns = keys + ['value', 'duration_count']
+    return list(aggregated[keys + ['value', 'duration_count']].itertuples(index=False, name=None))
+
+def build_event_result(params, bucket_starts, buckets):
+    """
+    生成事件分析返回数据（分组过多时只保留合计最高的 EVENT_ANALYSIS_MAX_GROUPS 条）
+
+    Args:
+        params (dict): 分析参数
+        bucket_starts (list): 时间桶开始时间戳
+        buckets (dict): {桶开始时间戳: {(事件, 分组值): [值, 时长计数]}}
+
+    Returns:
+        dict: 返回数据
+    """
+    metric = params['metric']
+    series_keys = sorted({key for bucket in bucket_starts for key in buckets.get(bucket, {})})
+    values = np.zeros((len(series_keys), len(bucket_starts)))
+    counts = np.zeros((len(series_keys), len(bucket_starts)))
+    key_index = {key: index for index, key in enumerate(series_keys)}
+    for column, bucket in enumerate(bucket_starts):
+        for key, (value, duration_count) in buckets.get(bucket, {}).items():
+            values[key_index[key], column] = value
+            counts[key_index[key], column] = duration_count
+
+    if metric == 'avg_duration':
+        series_values = np.divide(values, counts, out=np.zeros_like(values), where=counts > 0)
+        totals = np.divide(values.sum(axis=1), counts.sum(axis=1), out=np.zeros(len(series_keys)), where=counts.sum(axis=1) > 0)
+    else:
+        series_values = values
+        # 各时间桶的UV不能相加，合计取单桶最大值仅用于排序
+        totals = values.max(axis=1) if metric == 'uv' else values.sum(axis=1)
+
+    order = np.argsort(-totals, kind='stable')[:config.EVENT_ANALYSIS_MAX_GROUPS]
+    series = []
+    for index in order:
+        event, group_value = series_keys[index]
+        event_name = format_event_name(event)
+        group_label = (group_value or '未知') if params['group_by'] else ''
+        series.append({
+            'event': event,
+            'eventName': event_name,
+            'group': group_label,
+            'name': f'{event_name} / {group_label}' if params['group_by'] and params['group_by'] != 'event' else event_name,
+            'values': [round(float(value), 2) for value in series_values[index]],
+            'total': None if metric == 'uv' else round(float(totals[index]), 2)
+        })
+
+    label_format = '%Y-%m-%d %H:00' if params['granularity'] == 'hour' else '%Y-%m-%d'
+    return {
+        'buckets': [datetime.fromtimestamp(bucket).strftime(label_format) for bucket in bucket_starts],
+        'series': series,
+        'truncated': len(series_keys) > len(series),
+        'metric': metric,
+        'groupBy': params['group_by'],
+        'granularity': params['granularity'],
+        'timeRange': params['time_range']
+    }
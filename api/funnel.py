@@ -0,0 +1,181 @@
+# api/funnel.py
+# 🔄 漏斗分析API模块
+
+from flask import Blueprint, jsonify, request
+import json
+import time
+import logging
+from datetime import datetime
+import pandas as pd
+from database import get_event_source
+from utils import (
+    get_time_bounds, build_dataframe_from_chunks, format_event_name, LRUCache,
+    match_funnel_steps, compute_funnel
+)
+from api.user_path import build_option_filters, OPTION_FILTER_RULES
+from config import get_config
+
+# 创建蓝图
+funnel_bp = Blueprint('funnel', __name__)
+config = get_config()
+
+# 漏斗结果缓存
+funnel_result_cache = LRUCache(
+    'funnel_results', maxsize=config.PATH_CACHE_MAX_ENTRIES, ttl=config.FUNNEL_CACHE_TTL,
+    sizeof=lambda result: len(json.dumps(result, ensure_ascii=False).encode('utf-8'))
+)
+
+@funnel_bp.route('/api/funnel-analysis', methods=['GET', 'POST'])
+def funnel_analysis_api():
+    """
+    漏斗分析API
+
+    参数（JSON请求体或查询参数）：
+    - steps：步骤选项键列表（与分析选项格式一致，如 event_$MPLaunch、page_/home），查询参数用逗号分隔
+    - window：转化窗口（秒），默认 FUNNEL_DEFAULT_WINDOW
+    - timeRange：时间范围
+    """
+    try:
+        params = parse_funnel_params(request.get_json(silent=True) or request.values)
+
+        error = validate_funnel_params(params)
+        if error:
+            return jsonify({'error': error}), 400
+
+        return jsonify(run_funnel_analysis(params))
+
+    except ValueError as e:
+        return jsonify({'error': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"漏斗分析API错误: {e}")
+        return jsonify({'error': f'漏斗分析失败: {str(e)}'}), 500
+
+def parse_funnel_params(args):
+    """
+    解析漏斗分析参数
+
+    Args:
+        args (dict): 请求参数
+
+    Returns:
+        dict: 规范化后的参数
+    """
+    steps = args.get('steps', '')
+    if isinstance(steps, str):
+        steps = steps.split(',')
+    bucket = config.PATH_CACHE_TIME_BUCKET
+
+    return {
+        'steps': tuple(step.strip() for step in steps if step and step.strip()),
+        'window': int(args.get('window', config.FUNNEL_DEFAULT_WINDOW)),
+        'time_range': args.get('timeRange', 'last7days'),
+        'time_bucket': int(time.time()) // bucket * bucket,
+        'refresh': str(args.get('refresh', '')).lower() in ('1', 'true')
+    }
+
+def validate_funnel_params(params):
+    """
+    校验漏斗分析参数
+
+    Returns:
+        str: 错误信息，校验通过时返回None
+    """
+    if len(params['steps']) < 2:
+        return '漏斗至少需要两个步骤'
+    if len(params['steps']) > config.FUNNEL_MAX_STEPS:
+        return f'漏斗最多 {config.FUNNEL_MAX_STEPS} 个步骤'
+    if len(build_option_filters(params['steps'])) != len(params['steps']):
+        return '无效的步骤选项'
+    if params['window'] <= 0:
+        return '转化窗口必须大于0'
+    return None
+
+def run_funnel_analysis(params):
+    """
+    执行漏斗分析
+
+    只读取满足任一步骤条件的事件，分块时即把步骤条件计算为布尔列并丢弃文本列。
+
+    Args:
+        params (dict): parse_funnel_params 的结果
+
+    Returns:
+        dict: 分析结果
+    """
+    cache_key = (params['steps'], params['window'], params['time_range'], params['time_bucket'])
+    if params['refresh']:
+        funnel_result_cache.invalidate(cache_key)
+    result = funnel_result_cache.get(cache_key)
+    if result is not None:
+        return result
+
+    step_filters = build_option_filters(params['steps'])
+    columns = ['distinct_id', 'created_at'] + sorted({column for column, _, _ in step_filters})
+    start_ts, end_ts = get_time_bounds(params['time_range'], now=datetime.fromtimestamp(params['time_bucket']))
+    step_columns = [f'step_{index}' for index in range(len(step_filters))]
+
+    def to_step_flags(chunk_df):
+        flags = pd.DataFrame({
+            'distinct_id': chunk_df['distinct_id'],
+            'created_at': pd.to_numeric(chunk_df['created_at'], errors='coerce').fillna(0).astype('int64')
+        })
+        for column, mask in zip(step_columns, match_funnel_steps(chunk_df, step_filters)):
+            flags[column] = mask
+        return flags
+
+    start_time = time.monotonic()
+    chunks = get_event_source().iter_events(columns, start_ts, end_ts, any_of=step_filters)
+    df = build_dataframe_from_chunks(chunks, transform=to_step_flags)
+    if df.empty:
+        df = pd.DataFrame(columns=['distinct_id', 'created_at'] + step_columns)
+
+    steps = compute_funnel(df, [df[column].to_numpy(dtype=bool) for column in step_columns], params['window'])
+    logging.info(f"漏斗分析完成: {len(df)} 行事件，{len(steps)} 个步骤，耗时 {time.monotonic() - start_time:.2f} 秒")
+
+    result = build_funnel_result(params, steps)
+    funnel_result_cache.set(cache_key, result)
+    return result
+
+def build_funnel_result(params, steps):
+    """
+    生成漏斗分析返回数据
+
+    Args:
+        params (dict): 漏斗参数
+        steps (list): compute_funnel 的结果
+
+    Returns:
+        dict: 返回数据
+    """
+    entry_users = steps[0]['users'] if steps else 0
+    funnel = []
+
+    for index, (key, step) in enumerate(zip(params['steps'], steps)):
+        previous_users = steps[index - 1]['users'] if index > 0 else step['users']
+        funnel.append({
+            'key': key,
+            'displayName': funnel_step_display_name(key),
+            'users': step['users'],
+            'conversionRate': round(step['users'] / previous_users * 100, 2) if previous_users else 0.0,
+            'overallRate': round(step['users'] / entry_users * 100, 2) if entry_users else 0.0,
+            'dropOff': previous_users - step['users'],
+            'avgTime': step['avg_time'],
+            'medianTime': step['median_time']
+        })
+
+    return {
+        'steps': funnel,
+        'totalUsers': entry_users,
+        'convertedUsers': steps[-1]['users'] if steps else 0,
+        'window': params['window'],
+        'timeRange': params['time_range']
+    }
+
+def funnel_step_display_name(key):
+    """步骤选项键 -> 显示名称（与分析选项的显示名称一致）"""
+    labels = {'event_': None, 'page_': '页面', 'url_': 'URL', 'title_': '标题', 'referrer_': '来源'}
+    for prefix, _, _ in OPTION_FILTER_RULES:
+        if key.startswith(prefix):
+            value = key[len(prefix):]
+            return format_event_name(value) if labels[prefix] is None else f"{labels[prefix]}: {value}"
+    return key
@@ -0,0 +1,184 @@
+# api/retention.py
+# 🔁 留存分析API模块
+
+from flask import Blueprint, jsonify, request
+import time
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+from database import get_event_source
+from utils import format_event_name, LRUCache, compute_retention
+from retention import RetentionDayStore
+from config import get_config
+
+# 创建蓝图
+retention_bp = Blueprint('retention', __name__)
+config = get_config()
+
+# 留存结果缓存（结果很小，只按条目数限制）
+retention_result_cache = LRUCache('retention_results', maxsize=config.PATH_CACHE_MAX_ENTRIES, ttl=config.RETENTION_CACHE_TTL)
+
+# 按天用户集合缓存（已结束的日期落盘）
+retention_days = RetentionDayStore(
+    config.RETENTION_CACHE_DIR,
+    lambda columns, start_ts, end_ts, events: get_event_source().iter_events(columns, start_ts, end_ts, events=events)
+)
+
+# 周期单位 -> 每周期天数
+RETENTION_UNITS = {'day': 1, 'week': 7}
+
+@retention_bp.route('/api/retention-analysis', methods=['GET', 'POST'])
+def retention_analysis_api():
+    """
+    留存分析API
+
+    参数（JSON请求体或查询参数）：
+    - startEvent：起始事件，默认 $MPLaunch；用户按最早发生起始事件的日期/周分组
+    - returnEvent：回访事件，默认为空表示任意事件
+    - unit：day / week
+    - periods：同期群数量（最近N天/周，含当前）
+    - maxOffset：最大留存周期（第N天/周），默认 periods - 1
+    """
+    try:
+        params = parse_retention_params(request.get_json(silent=True) or request.values)
+
+        error = validate_retention_params(params)
+        if error:
+            return jsonify({'error': error}), 400
+
+        return jsonify(run_retention_analysis(params))
+
+    except ValueError as e:
+        return jsonify({'error': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        logging.error(f"留存分析API错误: {e}")
+        return jsonify({'error': f'留存分析失败: {str(e)}'}), 500
+
+def parse_retention_params(args):
+    """
+    解析留存分析参数
+
+    Args:
+        args (dict): 请求参数
+
+    Returns:
+        dict: 规范化后的参数
+    """
+    unit = args.get('unit', 'day')
+    periods = int(args.get('periods', config.RETENTION_DEFAULT_DAYS if unit == 'day' else config.RETENTION_DEFAULT_WEEKS))
+    bucket = config.PATH_CACHE_TIME_BUCKET
+
+    return {
+        'start_event': (args.get('startEvent') or '$MPLaunch').strip(),
+        'return_event': (args.get('returnEvent') or '').strip(),
+        'unit': unit,
+        'periods': periods,
+        'max_offset': int(args.get('maxOffset', periods - 1)),
+        'time_bucket': int(time.time()) // bucket * bucket,
+        'refresh': str(args.get('refresh', '')).lower() in ('1', 'true')
+    }
+
+def validate_retention_params(params):
+    """
+    校验留存分析参数
+
+    Returns:
+        str: 错误信息，校验通过时返回None
+    """
+    if params['unit'] not in RETENTION_UNITS:
+        return '周期单位只支持 day / week'
+    if params['periods'] < 1 or params['max_offset'] < 0:
+        return '周期数必须大于0'
+    lookback = lookback_periods(params['unit'])
+    if (params['periods'] + lookback) * RETENTION_UNITS[params['unit']] > config.RETENTION_MAX_DAYS:
+        return f'留存分析最多覆盖 {config.RETENTION_MAX_DAYS} 天（含 RETENTION_LOOKBACK_DAYS）'
+    return None
+
+def lookback_periods(unit):
+    """排除老用户时向前多看的周期数"""
+    return -(-config.RETENTION_LOOKBACK_DAYS // RETENTION_UNITS[unit])
+
+def run_retention_analysis(params):
+    """
+    执行留存分析
+
+    Args:
+        params (dict): parse_retention_params 的结果
+
+    Returns:
+        dict: 分析结果
+    """
+    cache_key = (params['start_event'], params['return_event'], params['unit'], params['periods'],
+                 params['max_offset'], params['time_bucket'])
+    if params['refresh']:
+        retention_result_cache.invalidate(cache_key)
+    result = retention_result_cache.get(cache_key)
+    if result is not None:
+        return result
+
+    now = datetime.fromtimestamp(params['time_bucket'])
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    period_days = RETENTION_UNITS[params['unit']]
+    lookback = lookback_periods(params['unit'])
+
+    # 周从周一开始；第一个周期为 lookback 的开始
+    current_period_start = today - timedelta(days=today.weekday()) if params['unit'] == 'week' else today
+    first_day = current_period_start - timedelta(days=(params['periods'] + lookback - 1) * period_days)
+    days = [first_day + timedelta(days=offset) for offset in range((today - first_day).days + 1)]
+
+    start_time = time.monotonic()
+    daily = retention_days.daily_users(params['start_event'], params['return_event'], days, now)
+
+    # 按周期合并每天的用户（同一周期内的重复用户在构建位图时合并）
+    period_users = []
+    for start in range(0, len(days), period_days):
+        chunk = daily[start:start + period_days]
+        period_users.append((np.concatenate([users[0] for users in chunk]),
+                             np.concatenate([users[1] for users in chunk])))
+
+    retention = compute_retention(period_users, lookback, params['max_offset'])
+    logging.info(f"留存分析完成: {len(days)} 天，耗时 {time.monotonic() - start_time:.2f} 秒")
+
+    result = build_retention_result(params, retention, days[::period_days][lookback:])
+    retention_result_cache.set(cache_key, result)
+    return result
+
+def build_retention_result(params, retention, cohort_starts):
+    """
+    生成留存分析返回数据
+
+    Args:
+        params (dict): 留存参数
+        retention (dict): compute_retention 的结果
+        cohort_starts (list): 每个同期群的开始日期
+
+    Returns:
+        dict: 返回数据
+    """
+    cohorts = []
+    totals = [0] * (params['max_offset'] + 1)
+    bases = [0] * (params['max_offset'] + 1)
+
+    for start, users, retained in zip(cohort_starts, retention['cohort_users'], retention['retained']):
+        cohorts.append({
+            'cohort': start.strftime('%Y-%m-%d'),
+            'users': users,
+            'retained': retained,
+            'rates': [None if count is None else (round(count / users * 100, 2) if users else 0.0) for count in retained]
+        })
+        for offset, count in enumerate(retained):
+            if count is not None:
+                totals[offset] += count
+                bases[offset] += users
+
+    return {
+        'unit': params['unit'],
+        'startEvent': params['start_event'],
+        'startEventName': format_event_name(params['start_event']),
+        'returnEvent': params['return_event'],
+        'returnEventName': format_event_name(params['return_event']) if params['return_event'] else '任意事件',
+        'cohorts': cohorts,
+        'totalUsers': sum(retention['cohort_users']),
+        # 各周期的加权平均留存率（只统计已到达该周期的同期群）
+        'average': [round(total / base * 100, 2) if base else None for total, base in zip(totals, bases)]
+    }
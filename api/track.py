@@ -0,0 +1,152 @@
+# api/track.py
+# 📮 事件采集API模块
+
+from flask import Blueprint, jsonify, request
+import base64
+import json
+import time
+import logging
+import zlib
+from urllib.parse import unquote
+from ingest import flatten_event, summit_row
+from collector import get_event_buffer, BufferFullError
+from config import get_config
+
+class PayloadTooLargeError(ValueError):
+    """上报数据解压后超过大小限制"""
+
+# 创建蓝图
+track_bp = Blueprint('track', __name__)
+config = get_config()
+
+@track_bp.route('/api/track', methods=['GET', 'POST'])
+def track_api():
+    """
+    事件采集接口（小程序SDK上报格式，与summit.all_json一致）
+
+    支持：JSON请求体（单个事件或事件数组）；表单/查询参数 data 或 data_list
+    （base64编码的JSON，gzip=1 时先gzip压缩）。
+    """
+    try:
+        events = parse_track_payload()
+    except PayloadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': f'无效的事件数据: {str(e)}'}), 400
+
+    if len(events) > config.EVENT_TRACK_MAX_BATCH:
+        return jsonify({'error': f'单次最多上报 {config.EVENT_TRACK_MAX_BATCH} 条事件'}), 413
+
+    rows, invalid = build_track_rows(events)
+    if not rows:
+        return jsonify({'error': '没有有效事件', 'invalid': invalid}), 400
+
+    try:
+        dropped = get_event_buffer().offer(rows)
+    except BufferFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(max(1, int(config.EVENT_FLUSH_INTERVAL)))
+        return response, 503
+    except Exception as e:
+        logging.error(f"事件采集失败: {e}")
+        return jsonify({'error': f'事件采集失败: {str(e)}'}), 500
+
+    return jsonify({'accepted': len(rows), 'invalid': invalid, 'dropped': dropped})
+
+def parse_track_payload():
+    """
+    解析上报数据
+
+    Returns:
+        list: 事件列表
+
+    Raises:
+        ValueError: 数据无法解析
+    """
+    payload = request.get_json(silent=True)
+
+    if payload is None:
+        encoded = request.values.get('data_list') or request.values.get('data')
+        if not encoded:
+            raise ValueError('缺少事件数据')
+        try:
+            data = base64.b64decode(unquote(encoded))
+            if request.values.get('gzip') == '1':
+                data = gunzip_limited(data, config.EVENT_TRACK_MAX_DECOMPRESSED)
+            payload = json.loads(data.decode('utf-8'))
+        except PayloadTooLargeError:
+            raise
+        except (ValueError, OSError, zlib.error) as e:
+            raise ValueError(str(e))
+
+    if isinstance(payload, dict):
+        return [payload]
+    if isinstance(payload, list):
+        return payload
+    raise ValueError('事件数据必须是对象或数组')
+
+def gunzip_limited(data, limit):
+    """
+    解压gzip数据，解压结果不超过 limit 字节（防止压缩炸弹）
+
+    Args:
+        data (bytes): gzip压缩数据
+        limit (int): 解压后最大字节数
+
+    Returns:
+        bytes: 解压后的数据
+
+    Raises:
+        PayloadTooLargeError: 解压结果超过 limit
+        zlib.error: 数据不是有效的gzip格式
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    result = decompressor.decompress(data, limit)
+    if decompressor.unconsumed_tail or (not decompressor.eof and len(result) >= limit):
+        raise PayloadTooLargeError(f'解压后数据超过 {limit} 字节')
+    if not decompressor.eof:
+        raise ValueError('gzip数据不完整')
+    return result
+
+def build_track_rows(events):
+    """
+    校验事件并生成summit插入参数（db_time 一律设为服务器接收时间，忽略客户端传入的值，
+    避免事件被回填到已汇总的时间段）
+
+    Args:
+        events (list): 事件列表
+
+    Returns:
+        tuple: (插入参数列表, 无效事件数)
+    """
+    now = int(time.time())
+    rows = []
+    invalid = 0
+
+    for event in events:
+        if not is_valid_event(event):
+            invalid += 1
+            continue
+        event['db_time'] = now
+        raw = json.dumps(event, ensure_ascii=False)
+        rows.append(summit_row(raw, flatten_event(event)))
+
+    return rows, invalid
+
+def is_valid_event(event):
+    """
+    事件是否满足入库要求：有 distinct_id 和 type，track 类型需有 event
+
+    Args:
+        event: 单个事件
+
+    Returns:
+        bool: 是否有效
+    """
+    if not isinstance(event, dict):
+        return False
+    if not event.get('distinct_id') or not isinstance(event.get('type'), str):
+        return False
+    if event['type'] == 'track' and not event.get('event'):
+        return False
+    return isinstance(event.get('properties', {}), dict)
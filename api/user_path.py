@@ -2,192 +2,518 @@
 # 🛤️ 用户路径分析API模块
 
 from flask import Blueprint, jsonify, request
-import pandas as pd
 import logging
-from database import execute_query
+import json
+import math
+import time
+from datetime import datetime, timedelta
+from database import get_event_source
 from utils import (
-    get_time_condition, preprocess_dataframe, build_enhanced_user_paths,
-    build_enhanced_sankey_data, analyze_step_distribution, 
-    analyze_path_conversion, calculate_enhanced_path_stats
+    get_time_bounds, preprocess_dataframe, build_dataframe_from_chunks,
+    build_user_path_store_parallel, build_path_analysis_result, scale_path_analysis_result,
+    path_user_square_sums, LRUCache
 )
 from config import get_config
+from jobs import JobManager, JobQueueFullError, JOB_SUCCEEDED
+from incremental_paths import IncrementalPathIndex, time_range_days
 
 # 创建蓝图
 user_path_bp = Blueprint('user_path', __name__)
 config = get_config()
 
+# 路径分析从数据源读取的列
+PATH_QUERY_COLUMNS = ['distinct_id', 'event', 'created_at', 'url_path', 'event_duration', 'page_title',
+                      'url', 'referrer', 'screen_name', 'element_content']
+
+# 预处理后路径分析需要保留的列，其余列在分块阶段即丢弃以控制内存
+PATH_ANALYSIS_COLUMNS = ['distinct_id', 'event', 'created_at', 'timestamp', 'event_duration', 'step_identifier']
+
+# 路径分析三级缓存：最终结果 / 路径计数 / 预处理后的查询数据
+path_result_cache = LRUCache(
+    'path_results', maxsize=config.PATH_CACHE_MAX_ENTRIES, ttl=config.PATH_CACHE_TTL,
+    max_bytes=config.PATH_RESULT_CACHE_MAX_BYTES,
+    sizeof=lambda result: len(json.dumps(result, ensure_ascii=False).encode('utf-8'))
+)
+path_counter_cache = LRUCache(
+    'path_counters', maxsize=config.PATH_CACHE_MAX_ENTRIES, ttl=config.PATH_CACHE_TTL,
+    max_bytes=config.PATH_COUNTER_CACHE_MAX_BYTES,
+    sizeof=lambda store: store.nbytes()
+)
+path_frame_cache = LRUCache(
+    'path_frames', maxsize=config.PATH_FRAME_CACHE_MAX_ENTRIES, ttl=config.PATH_CACHE_TTL,
+    max_bytes=config.PATH_FRAME_CACHE_MAX_BYTES,
+    sizeof=lambda df: int(df.memory_usage(deep=True).sum())
+)
+
 @user_path_bp.route('/api/user-path-analysis', methods=['GET'])
 def user_path_analysis_api():
-    """优化后的用户路径分析API - 支持事件、页面、URL、标题、来源混合分析"""
+    """
+    优化后的用户路径分析API - 支持事件、页面、URL、标题、来源混合分析
+    
+    采样参数：
+    - sampleRate：按用户哈希采样的比例（0~1]，计数按采样率放大并返回置信区间
+    - progressive：true 时默认使用 PATH_SAMPLE_RATES 的第一档，结果中的 sampling.nextRate 为下一档
+    """
     try:
-        # 获取筛选参数
-        selected_options = request.args.get('selectedOptions', '').split(',') if request.args.get('selectedOptions') else []
-        path_type = request.args.get('pathType', 'start')
-        start_option = request.args.get('startOption', '') if path_type == 'start' else ''
-        end_option = request.args.get('endOption', '') if path_type == 'end' else ''
-        path_length = request.args.get('pathLength', 'all')
-        min_conversions = int(request.args.get('minConversions', config.MIN_CONVERSIONS_DEFAULT))
-        time_range = request.args.get('timeRange', 'last7days')
-        page_filter = request.args.get('pageFilter', '')
+        # 获取并规范化筛选参数
+        params = parse_path_params(request.args)
         
         logging.info(f"用户路径分析参数:")
-        logging.info(f"  选择的选项: {selected_options}")
-        logging.info(f"  路径类型: {path_type}")
-        logging.info(f"  起始选项: {start_option}")
-        logging.info(f"  结束选项: {end_option}")
+        logging.info(f"  选择的选项: {list(params['selected_options'])}")
+        logging.info(f"  路径类型: {params['path_type']}")
+        logging.info(f"  起始选项: {params['start_option']}")
+        logging.info(f"  结束选项: {params['end_option']}")
+        logging.info(f"  采样率: {params['sample_rate']}")
         
         # 参数验证
-        if not selected_options or selected_options == ['']:
-            return jsonify({'error': '请至少选择一个分析选项'}), 400
+        error = validate_path_params(params)
+        if error:
+            return jsonify({'error': error}), 400
         
-        # 构建查询条件
-        where_conditions, query_params = build_query_conditions(selected_options)
+        result = run_path_analysis(params)
+        return jsonify(result)
         
-        if not where_conditions:
-            return jsonify({'error': '无效的选择选项'}), 400
+    except Exception as e:
+        logging.error(f"用户路径分析API错误: {e}")
+        return jsonify({'error': f'用户路径分析失败: {str(e)}'}), 500
+
+@user_path_bp.route('/api/user-path-analysis/jobs', methods=['POST'])
+def submit_path_analysis_job():
+    """提交异步用户路径分析任务（参数同 /api/user-path-analysis，可放在JSON请求体或查询参数中）"""
+    try:
+        params = parse_path_params(request.get_json(silent=True) or request.values)
         
-        time_condition = get_time_condition(time_range)
-        options_condition = f"AND ({' OR '.join(where_conditions)})"
+        error = validate_path_params(params)
+        if error:
+            return jsonify({'error': error}), 400
         
-        # 查询用户路径数据
-        df = query_user_path_data(time_condition, options_condition, query_params)
+        result_key = path_cache_keys(params)[2]
         
-        if df.empty:
-            return get_empty_result()
+        # 结果已在本进程缓存时无需排队
+        cached = None if params['refresh'] else path_result_cache.get(result_key)
+        if cached is not None:
+            return jsonify({'jobId': None, 'status': JOB_SUCCEEDED, 'progress': 1.0, 'result': cached})
         
-        # 数据预处理
-        df = preprocess_dataframe(df)
+        state, deduplicated = path_jobs.submit(params, dedupe_key=result_key, force=params['refresh'])
+        return jsonify(format_job_state(state, deduplicated=deduplicated)), 202
         
-        # 关键词筛选
-        if page_filter:
-            df = df[df['step_identifier'].str.contains(page_filter, case=False, na=False)]
+    except JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        logging.error(f"提交用户路径分析任务失败: {e}")
+        return jsonify({'error': f'提交分析任务失败: {str(e)}'}), 500
+
+@user_path_bp.route('/api/user-path-analysis/jobs/<job_id>', methods=['GET'])
+def get_path_analysis_job(job_id):
+    """查询异步分析任务状态，完成后返回结果"""
+    state = path_jobs.get(job_id)
+    if state is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    
+    response = format_job_state(state)
+    if state['status'] == JOB_SUCCEEDED:
+        result = path_jobs.get_result(job_id)
+        if result is None:
+            return jsonify({'error': '任务结果已过期'}), 404
+        response['result'] = result
+    return jsonify(response)
+
+@user_path_bp.route('/api/user-path-analysis/jobs/<job_id>', methods=['DELETE'])
+def cancel_path_analysis_job(job_id):
+    """取消异步分析任务"""
+    state = path_jobs.cancel(job_id)
+    if state is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(format_job_state(state))
+
+def format_job_state(state, deduplicated=False):
+    """
+    任务状态的接口返回格式
+    
+    Args:
+        state (dict): 任务状态
+        deduplicated (bool): 是否复用了已有任务
+        
+    Returns:
+        dict: 返回数据
+    """
+    return {
+        'jobId': state['id'],
+        'status': state['status'],
+        'stage': state.get('stage'),
+        'progress': state.get('progress', 0.0),
+        'error': state.get('error'),
+        'cancelRequested': state.get('cancel_requested', False),
+        'deduplicated': deduplicated,
+        'createdAt': state.get('created_at'),
+        'startedAt': state.get('started_at'),
+        'finishedAt': state.get('finished_at')
+    }
+
+def validate_path_params(params):
+    """
+    校验路径分析参数
+    
+    Args:
+        params (dict): parse_path_params 的结果
+        
+    Returns:
+        str: 错误信息，校验通过时返回None
+    """
+    if not params['selected_options']:
+        return '请至少选择一个分析选项'
+    if not build_option_filters(params['selected_options']):
+        return '无效的选择选项'
+    if not 0 < params['sample_rate'] <= 1:
+        return '采样率必须在 (0, 1] 之间'
+    return None
+
+def parse_path_params(args):
+    """
+    解析并规范化路径分析参数，相同含义的参数组合得到相同的结果
+    
+    选项去重排序；相对时间范围的基准时间向下取整到 PATH_CACHE_TIME_BUCKET 秒，
+    同一时间桶内的请求共享缓存。
+    
+    Args:
+        args (dict): 请求参数
+        
+    Returns:
+        dict: 规范化后的参数
+    """
+    selected_options = args.get('selectedOptions', '')
+    if isinstance(selected_options, str):
+        selected_options = selected_options.split(',')
+    selected_options = tuple(sorted({option.strip() for option in selected_options if option.strip()}))
+    path_type = args.get('pathType', 'start')
+    bucket = config.PATH_CACHE_TIME_BUCKET
+    progressive = str(args.get('progressive', '')).lower() in ('1', 'true')
+    sample_rate = float(args.get('sampleRate', config.PATH_SAMPLE_RATES[0] if progressive else 1))
+    
+    return {
+        'selected_options': selected_options,
+        'path_type': path_type,
+        'start_option': args.get('startOption', '') if path_type == 'start' else '',
+        'end_option': args.get('endOption', '') if path_type == 'end' else '',
+        'path_length': args.get('pathLength', 'all'),
+        'min_conversions': int(args.get('minConversions', config.MIN_CONVERSIONS_DEFAULT)),
+        'time_range': args.get('timeRange', 'last7days'),
+        'time_bucket': int(time.time()) // bucket * bucket,
+        'page_filter': args.get('pageFilter', ''),
+        'incremental': str(args.get('incremental', config.PATH_INCREMENTAL_DEFAULT)).lower() in ('1', 'true'),
+        'sample_rate': sample_rate,
+        # 采样率取整到哈希桶，相同桶数的请求共享缓存
+        'sample_buckets': min(config.PATH_SAMPLE_BUCKETS, max(1, round(sample_rate * config.PATH_SAMPLE_BUCKETS))),
+        'refresh': str(args.get('refresh', '')).lower() in ('1', 'true')
+    }
+
+def path_cache_keys(params):
+    """
+    生成三级缓存键：查询数据 ⊂ 路径计数 ⊂ 最终结果
+    
+    Args:
+        params (dict): parse_path_params 的结果
         
-        # 会话划分和路径构建
-        user_paths = build_enhanced_user_paths(df, path_type, start_option, end_option, path_length)
+    Returns:
+        tuple: (数据缓存键, 路径计数缓存键, 结果缓存键)
+    """
+    frame_key = (params['selected_options'], params['time_range'], params['time_bucket'], params['sample_buckets'])
+    paths_key = frame_key + (params['path_type'], params['start_option'], params['end_option'],
+                             params['path_length'], params['page_filter'], params['incremental'])
+    result_key = paths_key + (params['min_conversions'],)
+    return frame_key, paths_key, result_key
+
+def run_path_analysis(params, progress=None):
+    """
+    执行用户路径分析（逐级复用缓存）
+    
+    只改变 minConversions 时复用路径计数；只改变 pageFilter 或路径条件时复用
+    预处理后的数据，均无需重新查询数据库。采样时只读取选中用户的全部事件（不再截断行数），
+    计数按采样率放大。
+    
+    Args:
+        params (dict): parse_path_params 的结果
+        progress (callable): 进度回调 progress(阶段, 0~1)，异步任务中用于上报进度和响应取消
         
-        # 筛选满足最小转化数的路径
-        filtered_paths = {path: count for path, count in user_paths.items() if count >= min_conversions}
+    Returns:
+        dict: 分析结果
+    """
+    progress = progress or (lambda stage, fraction: None)
+    frame_key, paths_key, result_key = path_cache_keys(params)
+    sample = path_sample(params)
+    rate = sample[0] / sample[1] if sample else 1.0
+    
+    # 强制刷新缓存
+    if params.get('refresh'):
+        invalidate_path_caches()
+    
+    result = path_result_cache.get(result_key)
+    if result is not None:
+        return result
+    
+    user_paths = path_counter_cache.get(paths_key)
+    df = None
+    
+    # 增量模式：合并按天路径计数，只处理水位线之后的新事件（增量状态为全量计数，采样时不使用）
+    days = time_range_days(params['time_range'], datetime.fromtimestamp(params['time_bucket']),
+                           max_days=config.PATH_INCREMENTAL_DAYS) if params['incremental'] and not sample else None
+    if user_paths is None and days is not None:
+        user_paths = incremental_paths.query(path_spec(params), days, progress=progress)
+        path_counter_cache.set(paths_key, user_paths)
+    
+    if user_paths is None:
+        df = path_frame_cache.get(frame_key)
+        if df is None:
+            progress('querying', 0.05)
+            start_ts, end_ts = get_time_bounds(params['time_range'],
+                                               now=datetime.fromtimestamp(params['time_bucket']))
+            
+            # 流式读取用户路径数据，并在分块阶段完成预处理
+            df = query_user_path_data(start_ts, end_ts, build_option_filters(params['selected_options']),
+                                      chunk_transform=prepare_path_chunk,
+                                      limit=None if sample else config.MAX_QUERY_LIMIT, sample=sample)
+            path_frame_cache.set(frame_key, df)
         
-        if not filtered_paths:
-            return get_empty_result()
+        # 关键词筛选
+        progress('building_paths', 0.6)
+        df = apply_page_filter(df, params['page_filter'])
         
+        # 会话划分和路径构建（数据量大时按用户分片并行；采样时保存逐用户计数用于置信区间）
+        user_paths = build_user_path_store_parallel(df, params['path_type'], params['start_option'],
+                                                    params['end_option'], params['path_length'],
+                                                    per_user=bool(sample))
+        path_counter_cache.set(paths_key, user_paths)
+    
+    # 筛选满足最小转化数的路径（采样时按放大后的估计值比较）
+    progress('building_result', 0.9)
+    filtered_paths = user_paths.filter(max(1, math.ceil(params['min_conversions'] * rate)) if sample
+                                       else params['min_conversions'])
+    
+    if filtered_paths:
         # 生成分析结果
         result = generate_analysis_result(df, filtered_paths)
-        
+        if sample:
+            result = scale_path_analysis_result(result, rate, config.PATH_SAMPLE_Z,
+                                                path_user_square_sums(filtered_paths))
         logging.info(f"分析完成: 找到 {len(filtered_paths)} 条有效路径")
-        return jsonify(result)
+    else:
+        result = empty_result()
+    result['sampling'] = sampling_info(rate)
+    result['timeWindow'] = analysis_window(params, days)
+    
+    path_result_cache.set(result_key, result)
+    return result
+
+def analysis_window(params, days=None):
+    """
+    实际分析的时间窗口
+
+    增量模式按自然日合并（last7days 为含今天在内的7个自然日），非增量模式为
+    get_time_bounds 的滚动窗口（last7days 为最近7×24小时），两者起点不同。
+
+    Args:
+        params (dict): parse_path_params 的结果
+        days (list): 增量模式使用的日期列表，非增量模式为None
+
+    Returns:
+        dict: mode（calendar_days / rolling）、start、end（YYYY-MM-DD HH:MM:SS）
+    """
+    now = datetime.fromtimestamp(params['time_bucket'])
+    if days:
+        start = datetime.strptime(days[0], '%Y-%m-%d')
+        end = min(datetime.strptime(days[-1], '%Y-%m-%d') + timedelta(days=1, seconds=-1), now)
+        mode = 'calendar_days'
+    else:
+        start_ts, end_ts = get_time_bounds(params['time_range'], now=now)
+        if start_ts is None:
+            return None
+        start, end = datetime.fromtimestamp(start_ts), datetime.fromtimestamp(end_ts)
+        mode = 'rolling'
+    return {'mode': mode, 'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'end': end.strftime('%Y-%m-%d %H:%M:%S')}
+
+def path_sample(params):
+    """
+    路径分析的用户采样条件
+    
+    Args:
+        params (dict): parse_path_params 的结果
         
-    except Exception as e:
-        logging.error(f"用户路径分析API错误: {e}")
-        return jsonify({'error': f'用户路径分析失败: {str(e)}'}), 500
+    Returns:
+        tuple: (选中桶数, 总桶数)，不采样时返回None
+    """
+    if params['sample_buckets'] >= config.PATH_SAMPLE_BUCKETS:
+        return None
+    return params['sample_buckets'], config.PATH_SAMPLE_BUCKETS
+
+def sampling_info(rate):
+    """
+    结果中的采样说明
+    
+    Args:
+        rate (float): 实际采样率
+        
+    Returns:
+        dict: {'rate', 'sampled', 'confidence', 'nextRate'}，nextRate 为渐进模式的下一档采样率
+    """
+    next_rates = sorted(r for r in config.PATH_SAMPLE_RATES if r > rate)
+    return {
+        'rate': rate,
+        'sampled': rate < 1,
+        'confidence': round(math.erf(config.PATH_SAMPLE_Z / math.sqrt(2)), 3) if rate < 1 else None,
+        'nextRate': next_rates[0] if next_rates else None
+    }
+
+def invalidate_path_caches():
+    """清空路径分析的全部缓存"""
+    path_result_cache.invalidate()
+    path_counter_cache.invalidate()
+    path_frame_cache.invalidate()
+
+def apply_page_filter(df, page_filter):
+    """按关键词筛选步骤（不区分大小写）"""
+    if page_filter and not df.empty:
+        df = df[df['step_identifier'].str.contains(page_filter, case=False, na=False)]
+    return df
+
+def path_spec(params):
+    """
+    路径条件（不含时间范围），作为增量路径状态的键
+    
+    Args:
+        params (dict): parse_path_params 的结果
+        
+    Returns:
+        dict: 路径条件
+    """
+    return {
+        'selected_options': params['selected_options'],
+        'path_type': params['path_type'],
+        'start_option': params['start_option'],
+        'end_option': params['end_option'],
+        'path_length': params['path_length'],
+        'page_filter': params['page_filter']
+    }
+
+def load_incremental_rows(spec, start_ts, end_ts):
+    """
+    读取增量更新所需的新事件（不截断行数，避免丢失部分用户的事件）
+    
+    Args:
+        spec (dict): path_spec 的结果
+        start_ts (int): 起始时间戳（含）
+        end_ts (int): 结束时间戳（含）
+        
+    Returns:
+        pandas.DataFrame: 预处理并按关键词筛选后的数据
+    """
+    df = query_user_path_data(start_ts, end_ts, build_option_filters(spec['selected_options']),
+                              chunk_transform=prepare_path_chunk, limit=None)
+    return apply_page_filter(df, spec['page_filter'])
+
+# 增量路径索引（状态目录在同一台机器的worker和任务进程之间共享）
+incremental_paths = IncrementalPathIndex(
+    config.PATH_INCREMENTAL_DIR, load_incremental_rows, days=config.PATH_INCREMENTAL_DAYS,
+    lag=config.ROLLUP_LAG
+)
+
+# 异步分析任务（长时间范围的分析在独立进程中执行，不阻塞web worker）
+path_jobs = JobManager(
+    'user_path', run_path_analysis, max_workers=config.ANALYSIS_JOB_WORKERS,
+    max_queue=config.ANALYSIS_JOB_MAX_QUEUE, result_ttl=config.ANALYSIS_JOB_RESULT_TTL,
+    timeout=config.ANALYSIS_JOB_TIMEOUT
+)
 
-def build_query_conditions(selected_options):
+# 选项前缀 -> (事件列, 匹配方式)
+OPTION_FILTER_RULES = [
+    ('event_', 'event', '='),
+    ('page_', 'url_path', 'contains'),
+    ('url_', 'url', 'contains'),
+    ('title_', 'page_title', '='),
+    ('referrer_', 'referrer', 'contains')
+]
+
+def build_option_filters(selected_options):
     """
-    构建查询条件
+    构建选项过滤条件（与数据源无关，任一条件满足即可）
     
     Args:
         selected_options (list): 选择的选项列表
         
     Returns:
-        tuple: (条件列表, 参数列表)
+        list: [(列名, 匹配方式, 值), ...]
     """
-    where_conditions = []
-    query_params = []
+    filters = []
     
     for option in selected_options:
-        if option.startswith('event_'):
-            event_name = option.replace('event_', '')
-            where_conditions.append("event = %s")
-            query_params.append(event_name)
-        elif option.startswith('page_'):
-            page_path = option.replace('page_', '')
-            where_conditions.append('JSON_UNQUOTE(JSON_EXTRACT(all_json, \'$.properties."$url_path"\')) LIKE %s')
-            query_params.append(f'%{page_path}%')
-        elif option.startswith('url_'):
-            url_path = option.replace('url_', '')
-            where_conditions.append('url LIKE %s')
-            query_params.append(f'%{url_path}%')
-        elif option.startswith('title_'):
-            title = option.replace('title_', '')
-            where_conditions.append('JSON_UNQUOTE(JSON_EXTRACT(all_json, \'$.properties."$title"\')) = %s')
-            query_params.append(title)
-        elif option.startswith('referrer_'):
-            referrer_domain = option.replace('referrer_', '')
-            where_conditions.append('referrer LIKE %s')
-            query_params.append(f'%{referrer_domain}%')
-    
-    return where_conditions, query_params
-
-def query_user_path_data(time_condition, options_condition, query_params):
-    """
-    查询用户路径数据
+        for prefix, column, op in OPTION_FILTER_RULES:
+            if option.startswith(prefix):
+                filters.append((column, op, option[len(prefix):]))
+                break
+    
+    return filters
+
+def prepare_path_chunk(chunk_df):
+    """
+    对单块查询结果做预处理并裁剪列
     
     Args:
-        time_condition (str): 时间条件
-        options_condition (str): 选项条件
-        query_params (list): 查询参数
+        chunk_df (pandas.DataFrame): 单块原始数据
+        
+    Returns:
+        pandas.DataFrame: 预处理后的数据
+    """
+    chunk_df = preprocess_dataframe(chunk_df)
+    return chunk_df[[col for col in PATH_ANALYSIS_COLUMNS if col in chunk_df.columns]]
+
+def query_user_path_data(start_ts, end_ts, option_filters, chunk_transform=None, limit=config.MAX_QUERY_LIMIT,
+                         sample=None):
+    """
+    查询用户路径数据（从配置的数据源流式读取，分块构建DataFrame）
+    
+    Args:
+        start_ts (int): 起始时间戳，None表示不限
+        end_ts (int): 结束时间戳，None表示不限
+        option_filters (list): build_option_filters 的结果
+        chunk_transform (callable): 对每块数据的处理函数
+        limit (int): 最大读取行数，0或None表示不限制
+        sample (tuple): (选中桶数, 总桶数)，按用户哈希采样
         
     Returns:
         pandas.DataFrame: 查询结果
     """
-    path_query = f'''
-        SELECT 
-            distinct_id,
-            event,
-            created_at,
-            JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$url_path"')) AS url_path,
-            JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties.event_duration')) AS event_duration,
-            JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$title"')) AS page_title,
-            url,
-            referrer,
-            JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$screen_name"')) AS screen_name,
-            JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.properties."$element_content"')) AS element_content
-        FROM summit
-        WHERE 1=1
-        {time_condition}
-        {options_condition}
-        ORDER BY distinct_id, created_at
-        LIMIT {config.MAX_QUERY_LIMIT}
-    '''
-    
-    results, columns = execute_query(path_query, query_params)
-    
-    if results and columns:
-        return pd.DataFrame(results, columns=columns)
-    else:
-        return pd.DataFrame()
+    chunks = get_event_source().iter_events(
+        PATH_QUERY_COLUMNS, start_ts, end_ts, any_of=option_filters,
+        order_by=['distinct_id', 'created_at'], limit=limit or None, sample=sample
+    )
+    return build_dataframe_from_chunks(chunks, transform=chunk_transform,
+                                       category_columns=['event', 'step_identifier'])
 
-def get_empty_result():
-    """返回空结果"""
-    return jsonify({
+def empty_result():
+    """空结果数据"""
+    return {
         'sankey': {'nodes': [], 'links': []},
         'stepDistribution': {'steps': []},
         'pathConversion': {'funnelData': []},
         'pathStats': {}
-    })
+    }
+
+def get_empty_result():
+    """返回空结果"""
+    return jsonify(empty_result())
 
 def generate_analysis_result(df, filtered_paths):
     """
-    生成分析结果
+    生成分析结果（单次遍历路径集合）
     
     Args:
         df (pandas.DataFrame): 原始数据
-        filtered_paths (dict): 过滤后的路径数据
+        filtered_paths (dict|PathStore): 过滤后的路径数据
         
     Returns:
         dict: 分析结果
     """
-    sankey_data = build_enhanced_sankey_data(filtered_paths)
-    step_distribution = analyze_step_distribution(filtered_paths)
-    path_conversion = analyze_path_conversion(df, filtered_paths)
-    path_stats = calculate_enhanced_path_stats(df, filtered_paths)
-    
-    return {
-        'sankey': sankey_data,
-        'stepDistribution': step_distribution,
-        'pathConversion': path_conversion,
-        'pathStats': path_stats
-    }
+    return build_path_analysis_result(filtered_paths)
 
 # 提供一些示例数据生成函数，用于测试和演示
 def generate_mock_path_data():
@@ -3,6 +3,7 @@
 
 import os
 import logging
+import click
 from flask import Flask, render_template, jsonify
 from config import get_config
 from api import register_blueprints
@@ -60,27 +61,18 @@ def register_routes(app):
     
     @app.route('/event-analysis.html')
     def event_analysis():
-        """事件分析页面（占位）"""
-        return jsonify({
-            'message': '事件分析页面正在开发中',
-            'status': 'coming_soon'
-        })
+        """事件分析页面"""
+        return render_template('event-analysis.html')
     
     @app.route('/funnel-analysis.html')
     def funnel_analysis():
-        """漏斗分析页面（占位）"""
-        return jsonify({
-            'message': '漏斗分析页面正在开发中',
-            'status': 'coming_soon'
-        })
+        """漏斗分析页面"""
+        return render_template('funnel-analysis.html')
     
     @app.route('/retention-analysis.html')
     def retention_analysis():
-        """留存分析页面（占位）"""
-        return jsonify({
-            'message': '留存分析页面正在开发中',
-            'status': 'coming_soon'
-        })
+        """留存分析页面"""
+        return render_template('retention-analysis.html')
 
 def register_error_handlers(app):
     """
@@ -161,6 +153,127 @@ def test_db():
     else:
         print(f"❌ {result['message']}")
 
+@app.cli.command()
+@click.option('--dry-run', is_flag=True, help='只打印将要执行的ALTER语句')
+def migrate_json_columns(dry_run):
+    """为高频JSON属性添加物化列并回填"""
+    from database import build_json_column_migration, migrate_json_columns as run_migration
+    if dry_run:
+        statement = build_json_column_migration()
+        print(statement or "✅ 物化列已全部存在，无需迁移")
+        return
+    result = run_migration()
+    if result['statement']:
+        print(result['statement'])
+    if result['success']:
+        print(f"✅ {result['message']}")
+    else:
+        print(f"❌ {result['message']}")
+
+@app.cli.command()
+@click.option('--rebuild', is_flag=True, help='清空汇总表后从头重建')
+def update_rollups(rebuild):
+    """增量更新小时汇总表"""
+    from rollup import update_rollups as run_update
+    result = run_update(rebuild=rebuild)
+    if result['success']:
+        print(f"✅ {result['message']}")
+    else:
+        print(f"❌ {result['message']}")
+
+@app.cli.command()
+@click.option('--days', default=7, help='最近N天（含今天）')
+@click.option('--by', 'group_by', type=click.Choice(['day', 'event', 'os']), default='day', help='分组方式')
+def approx_uv(days, group_by):
+    """基于小时草图估计UV（替代调试SQL中的 COUNT(DISTINCT)）"""
+    import time
+    from datetime import datetime, timedelta
+    from rollup import estimate_users, estimate_event_users, estimate_os_users
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day = today_start - timedelta(days=days - 1)
+    start_ts, end_ts = int(first_day.timestamp()), int(time.time())
+    
+    if group_by == 'day':
+        rows = []
+        for offset in range(days):
+            day_ts = int((first_day + timedelta(days=offset)).timestamp())
+            sketch = estimate_users(day_ts, min(day_ts + 86399, end_ts))
+            if sketch is None:
+                rows = None
+                break
+            rows.append(((first_day + timedelta(days=offset)).strftime('%Y-%m-%d'), sketch.count()))
+    elif group_by == 'event':
+        estimates = estimate_event_users(start_ts, end_ts)
+        rows = None if estimates is None else sorted(
+            ((event, entry['users'].count(), entry['events']) for event, entry in estimates.items()),
+            key=lambda row: row[2], reverse=True
+        )
+    else:
+        estimates = estimate_os_users(start_ts, end_ts)
+        rows = None if estimates is None else sorted(
+            ((os_name, sketch.count()) for os_name, sketch in estimates.items()),
+            key=lambda row: row[1], reverse=True
+        )
+    
+    if rows is None:
+        print("❌ 小时汇总不可用，请先运行 flask update-rollups")
+        return
+    print(f"\n👥 最近 {days} 天UV估计（按 {group_by}，相对误差约 ±{1.04 / (1 << get_config().HLL_PRECISION) ** 0.5:.2%}）")
+    print("-" * 50)
+    for row in rows:
+        print(f"{str(row[0]):30} " + ' '.join(f"{value:>10}" for value in row[1:]))
+
+@app.cli.command()
+@click.option('--start', default=None, help='起始日期 YYYY-MM-DD（含），默认不限')
+@click.option('--end', default=None, help='结束日期 YYYY-MM-DD（含），默认不限')
+@click.option('--path', default=None, help='数据集目录，默认 EVENT_STORE_PATH')
+def export_events(start, end, path):
+    """从MySQL导出事件到Parquet数据集（按天覆盖写入）"""
+    from datetime import datetime, timedelta
+    from event_store import export_events as run_export
+    start_ts = int(datetime.strptime(start, '%Y-%m-%d').timestamp()) if start else None
+    end_ts = int((datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)).timestamp()) - 1 if end else None
+    result = run_export(path, start_ts, end_ts)
+    if result['success']:
+        print(f"✅ {result['message']}")
+    else:
+        print(f"❌ {result['message']}")
+
+@app.cli.command()
+@click.argument('file_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--target', type=click.Choice(['db', 'parquet']), default='db', help='写入summit表或Parquet数据集')
+@click.option('--batch-size', default=None, type=int, help='每批行数，默认 INGEST_BATCH_SIZE')
+@click.option('--output', default=None, help='Parquet数据集目录，默认 EVENT_STORE_PATH')
+@click.option('--no-dedupe', is_flag=True, help='不按 _track_id 去重')
+def ingest_export(file_path, target, batch_size, output, no_dedupe):
+    """导入summit导出文件（CSV/JSON）"""
+    from ingest import ingest_export as run_ingest
+    result = run_ingest(file_path, target=target, batch_size=batch_size, output_path=output,
+                        dedupe=not no_dedupe)
+    if result['success']:
+        print(f"✅ {result['message']}")
+    else:
+        print(f"❌ {result['message']}")
+    
+    # 回填的历史数据不会被已有的汇总和按天缓存计入
+    min_created_at = result.get('min_created_at')
+    if min_created_at is None:
+        return
+    from datetime import datetime
+    from rollup import get_rollup_watermark
+    config = get_config()
+    actions = []
+    watermark = get_rollup_watermark() if target == 'db' else None
+    if watermark is not None and min_created_at < watermark:
+        actions.append("仪表板小时汇总：flask update-rollups --rebuild")
+    if min_created_at < datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp():
+        actions.append(f"留存按天缓存：删除 {config.RETENTION_CACHE_DIR} 下的缓存文件")
+        actions.append(f"增量路径状态：删除 {config.PATH_INCREMENTAL_DIR} 后重新计算")
+    if actions:
+        print(f"⚠️  写入了 {datetime.fromtimestamp(min_created_at):%Y-%m-%d %H:%M} 起的历史事件，以下状态需要重建后才会计入：")
+        for action in actions:
+            print(f"   - {action}")
+
 @app.cli.command()
 def show_routes():
     """显示所有路由"""
@@ -180,6 +293,71 @@ def show_config():
     print(f"数据库主机: {config.DB_CONFIG['host']}")
     print(f"数据库名称: {config.DB_CONFIG['database']}")
     print(f"会话超时: {config.SESSION_TIMEOUT}秒")
+    print(f"连接池大小: {config.DB_POOL_SIZE} (等待超时 {config.DB_POOL_TIMEOUT}秒)")
+    print(f"数据源: {config.DATA_SOURCE} ({config.EVENT_STORE_PATH if config.DATA_SOURCE == 'parquet' else 'summit'})")
+
+@app.cli.command()
+@click.option('--rows', default=1000000, help='合成数据行数')
+@click.option('--compare/--no-compare', default=True, help='是否同时运行逐行参考实现并校验结果')
+@click.option('--workers', default=0, help='大于1时同时测试多进程实现')
+def bench_paths(rows, compare, workers):
+    """用户路径构建性能基准测试"""
+    from utils.benchmark import benchmark_user_paths
+    print(f"\n⏱️  用户路径构建基准测试 ({rows} 行)")
+    print("-" * 50)
+    result = benchmark_user_paths(rows, compare=compare, workers=workers)
+    for key, value in result.items():
+        print(f"{key:20} {value}")
+
+@app.cli.command()
+@click.option('--rows', default=500000, help='合成数据行数')
+@click.option('--compare/--no-compare', default=True, help='是否同时运行逐行apply实现并校验结果')
+def bench_steps(rows, compare):
+    """步骤标识构建性能基准测试"""
+    from utils.benchmark import benchmark_step_identifiers
+    print(f"\n⏱️  步骤标识构建基准测试 ({rows} 行)")
+    print("-" * 50)
+    result = benchmark_step_identifiers(rows, compare=compare)
+    for key, value in result.items():
+        print(f"{key:20} {value}")
+
+@app.cli.command()
+@click.option('--paths', default=100000, help='不同路径数')
+@click.option('--compare/--no-compare', default=True, help='是否同时运行分别构建的实现并校验结果')
+def bench_result(paths, compare):
+    """路径分析结果构建性能基准测试"""
+    from utils.benchmark import benchmark_result_builder
+    print(f"\n⏱️  分析结果构建基准测试 ({paths} 条路径)")
+    print("-" * 50)
+    result = benchmark_result_builder(paths, compare=compare)
+    for key, value in result.items():
+        print(f"{key:20} {value}")
+
+@app.cli.command()
+@click.option('--rows', default=1000000, help='合成数据行数')
+@click.option('--steps', default=4, help='漏斗步骤数')
+@click.option('--compare/--no-compare', default=True, help='是否同时运行逐用户扫描实现并校验结果')
+def bench_funnel(rows, steps, compare):
+    """漏斗计算性能基准测试"""
+    from utils.benchmark import benchmark_funnel
+    print(f"\n⏱️  漏斗计算基准测试 ({rows} 行, {steps} 步)")
+    print("-" * 50)
+    result = benchmark_funnel(rows, compare=compare, n_steps=steps)
+    for key, value in result.items():
+        print(f"{key:20} {value}")
+
+@app.cli.command()
+@click.option('--users', default=1000000, help='合成用户数')
+@click.option('--days', default=30, help='天数（同期群数）')
+@click.option('--compare/--no-compare', default=True, help='是否同时运行pandas分组参考实现并校验结果')
+def bench_retention(users, days, compare):
+    """留存计算性能基准测试"""
+    from utils.benchmark import benchmark_retention
+    print(f"\n⏱️  留存计算基准测试 ({users} 用户, {days} 天)")
+    print("-" * 50)
+    result = benchmark_retention(users, days, compare=compare)
+    for key, value in result.items():
+        print(f"{key:20} {value}")
 
 if __name__ == '__main__':
     # 从环境变量获取运行参数
@@ -0,0 +1,302 @@
+# collector.py
+# 📮 事件采集缓冲区（内存队列 + 后台批量写入summit）
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from config import get_config
+from database import execute_bulk_insert, is_retryable_error
+from ingest import SUMMIT_INSERT_COLUMNS
+
+# 获取配置
+config = get_config()
+
+# 缓冲区满时的处理方式
+OVERFLOW_REJECT = 'reject'  # 拒绝新事件（接口返回503，由SDK稍后重发）
+OVERFLOW_DROP_OLDEST = 'drop_oldest'  # 丢弃最早的事件，保证新事件入队
+
+class BufferFullError(Exception):
+    """事件缓冲区已满"""
+    pass
+
+class EventBuffer:
+    """
+    事件写入缓冲区
+
+    接口线程只把待写入的行放入内存队列；后台线程在积累到 batch_size 条，或最早一条
+    事件等待超过 flush_interval 秒时，通过 execute_bulk_insert 批量写入summit。
+    数据库暂时不可用时整批放回队首等待下次重试；数据错误时对半拆分定位出错的事件，
+    只丢弃这些事件；提交时连接断开（是否写入未知）的批次不重试，避免重复写入。
+    进程退出时写完剩余事件。
+    """
+
+    def __init__(self, max_events=50000, batch_size=1000, flush_interval=2.0, overflow=OVERFLOW_REJECT,
+                 table='summit', columns=SUMMIT_INSERT_COLUMNS):
+        self.max_events = max(1, int(max_events))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.overflow = overflow
+        self.table = table
+        self.columns = columns
+
+        self._cond = threading.Condition()
+        self._events = deque()
+        self._oldest_at = None  # 队列由空变为非空的时间
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._stats = {
+            'accepted': 0,
+            'rejected': 0,
+            'dropped': 0,
+            'flushed': 0,
+            'flush_failed': 0,
+            'uncertain': 0,
+            'invalid': 0,
+            'flushes': 0,
+            'flush_time_total': 0.0,
+            'flush_time_max': 0.0,
+            'last_flush_latency': 0.0,
+            'last_flush_at': None,
+            'max_depth': 0
+        }
+
+    def _ensure_thread(self):
+        """启动后台写入线程（调用方需持有锁），fork出的子进程中重新创建"""
+        pid = os.getpid()
+        if self._pid != pid:
+            # 父进程中尚未写入的事件由父进程负责
+            self._events.clear()
+            self._oldest_at = None
+            self._thread = None
+            self._stopping = False
+            self._pid = pid
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='event-flush', daemon=True)
+            self._thread.start()
+
+    def offer(self, rows):
+        """
+        事件入队
+
+        Args:
+            rows (list): 插入参数元组列表
+
+        Returns:
+            int: 因缓冲区满而丢弃的旧事件数
+
+        Raises:
+            BufferFullError: 缓冲区剩余空间不足且策略为 reject（整批拒绝，不会部分入队）
+        """
+        with self._cond:
+            self._ensure_thread()
+            if self._stopping:
+                raise BufferFullError('事件缓冲区正在关闭')
+
+            free = self.max_events - len(self._events)
+            dropped = 0
+            if len(rows) > free:
+                if self.overflow != OVERFLOW_DROP_OLDEST or len(rows) > self.max_events:
+                    self._stats['rejected'] += len(rows)
+                    raise BufferFullError(f'事件缓冲区已满（{len(self._events)}/{self.max_events}）')
+                dropped = len(rows) - free
+                for _ in range(dropped):
+                    self._events.popleft()
+                self._stats['dropped'] += dropped
+
+            if not self._events:
+                self._oldest_at = time.monotonic()
+            self._events.extend(rows)
+            self._stats['accepted'] += len(rows)
+            self._stats['max_depth'] = max(self._stats['max_depth'], len(self._events))
+            self._cond.notify()
+        return dropped
+
+    def _take_batch(self):
+        """等待满足写入条件并取出一批（返回None表示线程应退出）"""
+        with self._cond:
+            while True:
+                if self._events:
+                    waited = time.monotonic() - self._oldest_at
+                    if self._stopping or len(self._events) >= self.batch_size or waited >= self.flush_interval:
+                        break
+                    self._cond.wait(self.flush_interval - waited)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+
+            count = min(self.batch_size, len(self._events))
+            batch = [self._events.popleft() for _ in range(count)]
+            self._oldest_at = time.monotonic() if self._events else None
+            return batch
+
+    def _requeue(self, batch):
+        """数据库暂时不可用时写入失败的事件放回队首（超出容量的部分丢弃）"""
+        with self._cond:
+            room = self.max_events - len(self._events)
+            keep = batch[:room] if room < len(batch) else batch
+            self._events.extendleft(reversed(keep))
+            if keep:
+                self._oldest_at = time.monotonic() - self.flush_interval
+            self._stats['dropped'] += len(batch) - len(keep)
+
+    def _write(self, batch):
+        """
+        写入一批事件，数据错误时对半拆分重写，定位出错的事件
+
+        Returns:
+            tuple: (写入数, 提交结果未知数, 数据错误丢弃数, 需要稍后重写的事件列表)
+        """
+        try:
+            result = execute_bulk_insert(self.table, self.columns, batch, batch_size=len(batch))
+        except Exception as e:
+            logging.error(f"事件缓冲区写入失败: {e}")
+            if is_retryable_error(e):
+                return 0, 0, 0, batch
+            result = {'success': False, 'batch_stats': [{'uncertain': False, 'retryable': False}]}
+
+        if result['success']:
+            return len(batch), 0, 0, []
+        batch_stat = result['batch_stats'][0]
+        if batch_stat['uncertain']:
+            return 0, len(batch), 0, []
+        if batch_stat['retryable']:
+            return 0, 0, 0, batch
+        if len(batch) == 1:
+            logging.error(f"事件写入失败（数据错误），丢弃该事件: {batch_stat.get('error')}")
+            return 0, 0, 1, []
+
+        middle = len(batch) // 2
+        totals = [0, 0, 0, []]
+        for part in (batch[:middle], batch[middle:]):
+            for index, value in enumerate(self._write(part)):
+                totals[index] += value
+        return tuple(totals)
+
+    def _flush(self, batch):
+        """
+        写入一批事件
+
+        Returns:
+            list: 数据库暂时不可用、需要稍后重写的事件
+        """
+        start_time = time.monotonic()
+        written, uncertain, invalid, retry = self._write(batch)
+        elapsed = time.monotonic() - start_time
+
+        with self._cond:
+            self._stats['flushes'] += 1
+            self._stats['flush_time_total'] += elapsed
+            self._stats['flush_time_max'] = max(self._stats['flush_time_max'], elapsed)
+            self._stats['last_flush_latency'] = elapsed
+            self._stats['last_flush_at'] = time.time()
+            self._stats['flushed'] += written
+            self._stats['uncertain'] += uncertain
+            self._stats['invalid'] += invalid
+            self._stats['flush_failed'] += len(retry)
+        return retry
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            retry = self._flush(batch)
+            if not retry:
+                continue
+
+            with self._cond:
+                stopping = self._stopping
+            if stopping:
+                logging.error(f"进程退出时写入失败，丢弃 {len(retry)} 条事件")
+                with self._cond:
+                    self._stats['dropped'] += len(retry)
+                continue
+            self._requeue(retry)
+            # 数据库不可用时等待一个周期再重试，期间新事件继续入队直至缓冲区满
+            deadline = time.monotonic() + self.flush_interval
+            with self._cond:
+                while not self._stopping and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+
+    def stop(self, timeout=10):
+        """
+        停止后台线程并写完剩余事件
+
+        Args:
+            timeout (float): 等待写完的最长秒数
+        """
+        with self._cond:
+            if self._pid != os.getpid() or self._thread is None:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        thread.join(timeout)
+        if thread.is_alive():
+            with self._cond:
+                remaining = len(self._events)
+            logging.error(f"事件缓冲区关闭超时，仍有 {remaining} 条事件未写入")
+
+    def get_stats(self):
+        """
+        获取缓冲区指标
+
+        Returns:
+            dict: 缓冲区指标
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['depth'] = len(self._events)
+            stats['oldest_event_age'] = round(time.monotonic() - self._oldest_at, 3) if self._oldest_at else 0.0
+        stats['max_events'] = self.max_events
+        stats['batch_size'] = self.batch_size
+        stats['flush_interval'] = self.flush_interval
+        stats['overflow'] = self.overflow
+        flushes = stats['flushes']
+        stats['flush_time_avg'] = round(stats['flush_time_total'] / flushes, 6) if flushes else 0.0
+        stats['flush_time_total'] = round(stats['flush_time_total'], 6)
+        stats['flush_time_max'] = round(stats['flush_time_max'], 6)
+        stats['last_flush_latency'] = round(stats['last_flush_latency'], 6)
+        return stats
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_event_buffer():
+    """
+    获取当前进程的事件缓冲区
+
+    Returns:
+        EventBuffer: 事件缓冲区
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = EventBuffer(
+                max_events=config.EVENT_BUFFER_MAX_EVENTS,
+                batch_size=config.EVENT_FLUSH_BATCH_SIZE,
+                flush_interval=config.EVENT_FLUSH_INTERVAL,
+                overflow=config.EVENT_BUFFER_OVERFLOW
+            )
+        return _buffer
+
+def get_collector_stats():
+    """
+    获取事件采集指标（当前进程）
+
+    Returns:
+        dict: 缓冲区指标，尚未接收过事件时为空
+    """
+    return _buffer.get_stats() if _buffer is not None else {}
+
+def shutdown_collector():
+    """进程退出时写完缓冲区中的事件"""
+    if _buffer is not None:
+        _buffer.stop(timeout=config.EVENT_FLUSH_SHUTDOWN_TIMEOUT)
+
+atexit.register(shutdown_collector)
@@ -2,6 +2,7 @@
 # ⚙️ 配置文件 - 统一管理所有配置项
 
 import os
+import tempfile
 
 class Config:
     """基础配置类"""
@@ -15,12 +16,96 @@ class Config:
         'charset': 'utf8mb4'
     }
     
+    # 🔌 连接池配置（每个worker进程独立一个连接池）
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))  # 单进程最大连接数，建议与worker线程数一致
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # 获取连接的最长等待时间（秒）
+    DB_POOL_MAX_IDLE_TIME = int(os.getenv('DB_POOL_MAX_IDLE_TIME', 300))  # 空闲连接回收时间（秒）
+    DB_POOL_MAX_LIFETIME = int(os.getenv('DB_POOL_MAX_LIFETIME', 3600))  # 连接最大存活时间（秒）
+    DB_POOL_PING_INTERVAL = int(os.getenv('DB_POOL_PING_INTERVAL', 30))  # 空闲超过该时间的连接在取出时做健康检查
+    
+    SCHEMA_CACHE_TTL = int(os.getenv('SCHEMA_CACHE_TTL', 300))  # 表结构（物化列是否存在）缓存时间（秒）
+    
+    # 📦 数据源配置
+    DATA_SOURCE = os.getenv('DATA_SOURCE', 'mysql')  # 分析数据源：mysql 或 parquet（本地列式存储）
+    EVENT_STORE_PATH = os.getenv('EVENT_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'events'))  # Parquet数据集目录（按天分区）
+    
+    # 📥 数据导入配置
+    BULK_INSERT_BATCH_SIZE = int(os.getenv('BULK_INSERT_BATCH_SIZE', 1000))  # 批量写入每批行数（每批一次提交）
+    BULK_INSERT_MAX_RETRIES = int(os.getenv('BULK_INSERT_MAX_RETRIES', 3))  # 死锁、锁等待超时、连接断开时每批的重试次数
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 1000))  # 导入时每批写入行数（多行INSERT / Parquet写入）
+    
+    # 📮 事件采集配置（/api/track，每个worker进程独立缓冲）
+    EVENT_BUFFER_MAX_EVENTS = int(os.getenv('EVENT_BUFFER_MAX_EVENTS', 50000))  # 内存缓冲区最大事件数
+    EVENT_BUFFER_OVERFLOW = os.getenv('EVENT_BUFFER_OVERFLOW', 'reject')  # 缓冲区满时：reject（返回503）或 drop_oldest
+    EVENT_FLUSH_BATCH_SIZE = int(os.getenv('EVENT_FLUSH_BATCH_SIZE', 1000))  # 积累到该条数时立即写入
+    EVENT_FLUSH_INTERVAL = float(os.getenv('EVENT_FLUSH_INTERVAL', 2))  # 最早一条事件等待超过该秒数时写入
+    EVENT_FLUSH_SHUTDOWN_TIMEOUT = float(os.getenv('EVENT_FLUSH_SHUTDOWN_TIMEOUT', 10))  # 进程退出时等待写完的最长秒数
+    EVENT_TRACK_MAX_BATCH = int(os.getenv('EVENT_TRACK_MAX_BATCH', 500))  # 单次请求最多事件数
+    EVENT_TRACK_MAX_DECOMPRESSED = int(os.getenv('EVENT_TRACK_MAX_DECOMPRESSED', 4 * 1024 * 1024))  # gzip上报解压后最大字节数
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 2 * 1024 * 1024))  # 请求体最大字节数，超出返回413
+    
+    # 🧮 预聚合配置
+    ROLLUP_LAG = int(os.getenv('ROLLUP_LAG', 60))  # 汇总时跳过最近N秒的数据，等待写入完成
+    ROLLUP_REFRESH_INTERVAL = int(os.getenv('ROLLUP_REFRESH_INTERVAL', 300))  # 水位线落后超过该秒数时触发后台更新
+    ROLLUP_BATCH_SECONDS = int(os.getenv('ROLLUP_BATCH_SECONDS', 86400))  # 每批汇总的时间跨度（秒）
+    HLL_PRECISION = int(os.getenv('HLL_PRECISION', 12))  # HyperLogLog精度，误差约1.04/sqrt(2^p)
+    APPROX_UV_ENABLED = os.getenv('APPROX_UV_ENABLED', 'True').lower() == 'true'  # 仪表板UV默认使用小时草图估计（exact=true 时精确计算）
+    APPROX_UV_MAX_ERROR = float(os.getenv('APPROX_UV_MAX_ERROR', 0.02))  # 允许的UV相对标准误差上限，草图误差超过时使用精确计算
+    APPROX_UV_MAX_RAW_SECONDS = int(os.getenv('APPROX_UV_MAX_RAW_SECONDS', 10800))  # 草图未覆盖、需扫描原始事件的时间跨度上限（秒）
+    
     # ⏱️ 会话配置
     SESSION_TIMEOUT = 1800  # 30分钟会话超时
     
     # 📊 分析配置
-    MAX_QUERY_LIMIT = 5000  # 单次查询最大记录数
+    MAX_QUERY_LIMIT = int(os.getenv('MAX_QUERY_LIMIT', 2000000))  # 单次查询最大记录数，0表示不限制
+    QUERY_CHUNK_SIZE = int(os.getenv('QUERY_CHUNK_SIZE', 20000))  # 流式查询每块行数
     MIN_CONVERSIONS_DEFAULT = 5  # 默认最小转化数
+    ANALYSIS_OPTIONS_TTL = {  # 分析选项缓存有效期（秒），按类别设置
+        'events': 300,
+        'pages': 600,
+        'urls': 600,
+        'titles': 600,
+        'referrers': 1800
+    }
+    ANALYSIS_OPTIONS_STALE_TTL = int(os.getenv('ANALYSIS_OPTIONS_STALE_TTL', 3600))  # 过期后仍可返回旧值的宽限期（秒）
+    PATH_CACHE_TTL = int(os.getenv('PATH_CACHE_TTL', 600))  # 路径分析缓存有效期（秒）
+    PATH_CACHE_TIME_BUCKET = int(os.getenv('PATH_CACHE_TIME_BUCKET', 300))  # 相对时间范围的基准时间取整粒度（秒）
+    PATH_CACHE_MAX_ENTRIES = int(os.getenv('PATH_CACHE_MAX_ENTRIES', 256))  # 结果/路径计数缓存最大条目数
+    PATH_FRAME_CACHE_MAX_ENTRIES = int(os.getenv('PATH_FRAME_CACHE_MAX_ENTRIES', 16))  # 查询数据缓存最大条目数
+    PATH_RESULT_CACHE_MAX_BYTES = int(os.getenv('PATH_RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    PATH_COUNTER_CACHE_MAX_BYTES = int(os.getenv('PATH_COUNTER_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+    PATH_FRAME_CACHE_MAX_BYTES = int(os.getenv('PATH_FRAME_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    NORMALIZER_CACHE_SIZE = int(os.getenv('NORMALIZER_CACHE_SIZE', 4096))  # 每个规范化函数的缓存条数
+    PATH_PARALLEL_WORKERS = int(os.getenv('PATH_PARALLEL_WORKERS', min(4, os.cpu_count() or 1)))  # 路径构建子进程数，1表示不并行
+    PATH_PARALLEL_SHARD_ROWS = int(os.getenv('PATH_PARALLEL_SHARD_ROWS', 250000))  # 每个分片的目标行数
+    PATH_PARALLEL_MIN_ROWS = int(os.getenv('PATH_PARALLEL_MIN_ROWS', 500000))  # 少于该行数时在当前进程构建
+    PATH_INCREMENTAL_DEFAULT = os.getenv('PATH_INCREMENTAL_DEFAULT', 'False').lower() == 'true'  # 未传 incremental 参数时是否使用增量模式
+    PATH_INCREMENTAL_DAYS = int(os.getenv('PATH_INCREMENTAL_DAYS', 30))  # 增量模式保留的按天路径计数天数
+    PATH_INCREMENTAL_DIR = os.getenv('PATH_INCREMENTAL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'path_state'))  # 增量路径状态目录
+    PATH_SAMPLE_BUCKETS = int(os.getenv('PATH_SAMPLE_BUCKETS', 10000))  # 用户采样的哈希桶数（采样率精度）
+    PATH_SAMPLE_RATES = [float(rate) for rate in os.getenv('PATH_SAMPLE_RATES', '0.01,0.1,1').split(',')]  # 渐进模式依次使用的采样率
+    PATH_SAMPLE_Z = float(os.getenv('PATH_SAMPLE_Z', 1.96))  # 采样结果置信区间的分位数（1.96 为95%）
+    FUNNEL_MAX_STEPS = int(os.getenv('FUNNEL_MAX_STEPS', 10))  # 漏斗最多步骤数
+    FUNNEL_DEFAULT_WINDOW = int(os.getenv('FUNNEL_DEFAULT_WINDOW', 86400))  # 默认转化窗口（秒）
+    FUNNEL_CACHE_TTL = int(os.getenv('FUNNEL_CACHE_TTL', 600))  # 漏斗结果缓存有效期（秒）
+    RETENTION_DEFAULT_DAYS = int(os.getenv('RETENTION_DEFAULT_DAYS', 30))  # 按天留存默认同期群数
+    RETENTION_DEFAULT_WEEKS = int(os.getenv('RETENTION_DEFAULT_WEEKS', 8))  # 按周留存默认同期群数
+    RETENTION_MAX_DAYS = int(os.getenv('RETENTION_MAX_DAYS', 120))  # 留存分析最多覆盖的天数
+    RETENTION_LOOKBACK_DAYS = int(os.getenv('RETENTION_LOOKBACK_DAYS', 0))  # 向前多看N天，期间已发生起始事件的老用户不计入同期群
+    RETENTION_CACHE_TTL = int(os.getenv('RETENTION_CACHE_TTL', 600))  # 留存结果缓存有效期（秒）
+    RETENTION_CACHE_DIR = os.getenv('RETENTION_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'retention'))  # 按天用户集合缓存目录
+    EVENT_ANALYSIS_MAX_EVENTS = int(os.getenv('EVENT_ANALYSIS_MAX_EVENTS', 10))  # 事件分析最多选择的事件数
+    EVENT_ANALYSIS_MAX_GROUPS = int(os.getenv('EVENT_ANALYSIS_MAX_GROUPS', 50))  # 返回的最多序列数（按合计排序）
+    EVENT_ANALYSIS_CACHE_TTL = int(os.getenv('EVENT_ANALYSIS_CACHE_TTL', 86400))  # 已结束时间桶的缓存有效期（秒）
+    EVENT_ANALYSIS_LAG = int(os.getenv('EVENT_ANALYSIS_LAG', 60))  # 时间桶结束后再等待N秒才缓存，等待写入完成
+    
+    # 🧵 异步分析任务配置
+    ANALYSIS_JOB_WORKERS = int(os.getenv('ANALYSIS_JOB_WORKERS', 2))  # 每个worker进程的任务子进程数
+    ANALYSIS_JOB_MAX_QUEUE = int(os.getenv('ANALYSIS_JOB_MAX_QUEUE', 8))  # 每个worker进程最多排队的任务数
+    ANALYSIS_JOB_RESULT_TTL = int(os.getenv('ANALYSIS_JOB_RESULT_TTL', 1800))  # 任务结果保留时间（秒）
+    ANALYSIS_JOB_TIMEOUT = int(os.getenv('ANALYSIS_JOB_TIMEOUT', 3600))  # 任务无进展超过该时间视为失败（秒）
+    ANALYSIS_JOB_MAX_TASKS_PER_CHILD = int(os.getenv('ANALYSIS_JOB_MAX_TASKS_PER_CHILD', 1))  # 任务子进程执行N个任务后重建以释放内存（0不限，需Python 3.11+）
+    ANALYSIS_JOB_DIR = os.getenv('ANALYSIS_JOB_DIR', os.path.join(tempfile.gettempdir(), 'miniapp_analysis_jobs'))
     
     # 🔍 页面路径配置
     EXCLUDED_PATHS = [
@@ -1,16 +1,296 @@
 # database.py
 # 🗄️ 数据库连接管理
 
-import pymysql
+import os
+import time
+import threading
 import logging
+import itertools
+import zlib
+from collections import deque
+from contextlib import contextmanager
+import pymysql
+import numpy as np
+import pandas as pd
 from config import get_config
 
 # 获取配置
 config = get_config()
 
+class PoolTimeoutError(Exception):
+    """等待连接池空闲连接超时"""
+    pass
+
+class ConnectionPool:
+    """
+    线程安全的有界数据库连接池
+
+    每个进程持有一个连接池（gunicorn的每个worker各自独立），连接在取出时做健康检查，
+    空闲过久或存活超过上限的连接会被回收。
+    """
+
+    def __init__(self, db_config, max_size=8, timeout=10, max_idle_time=300,
+                 max_lifetime=3600, ping_interval=30):
+        self.db_config = db_config
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self._lock = threading.Condition(threading.Lock())
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._created_at = {}  # id(conn) -> 创建时间
+        self._size = 0
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_closed': 0,
+            'health_check_failures': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0
+        }
+
+    def _connect(self):
+        conn = pymysql.connect(**self.db_config)
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created_at.pop(id(conn), None)
+            self._size -= 1
+            self._stats['connections_closed'] += 1
+            self._lock.notify()
+
+    def _is_expired(self, created_at, last_used, now):
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return True
+        if self.max_idle_time and now - last_used > self.max_idle_time:
+            return True
+        return False
+
+    def _evict_idle(self, now):
+        """回收过期的空闲连接（调用方需持有锁），返回需要关闭的连接"""
+        expired = []
+        kept = deque()
+        while self._idle:
+            item = self._idle.popleft()
+            if self._is_expired(item[1], item[2], now):
+                expired.append(item[0])
+            else:
+                kept.append(item)
+        self._idle = kept
+        return expired
+
+    def acquire(self):
+        """
+        从连接池获取连接
+
+        Returns:
+            connection: 可用的数据库连接
+
+        Raises:
+            PoolTimeoutError: 在timeout内没有可用连接
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout if self.timeout else None
+
+        while True:
+            conn = None
+            need_create = False
+            with self._lock:
+                now = time.monotonic()
+                expired = self._evict_idle(now)
+                if self._idle:
+                    # 后进先出，优先复用最近使用过的热连接
+                    conn, _, last_used = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    need_create = True
+                elif not expired:
+                    remaining = deadline - now if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(f'等待数据库连接超时（{self.timeout}秒）')
+                    self._lock.wait(remaining)
+                    continue
+
+            for stale in expired:
+                self._close(stale)
+
+            if need_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif conn is not None and self.ping_interval is not None \
+                    and time.monotonic() - last_used >= self.ping_interval:
+                # 健康检查，失效连接直接丢弃并重试
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    with self._lock:
+                        self._stats['health_check_failures'] += 1
+                    self._close(conn)
+                    continue
+
+            if conn is None:
+                continue
+
+            waited = time.monotonic() - start
+            with self._lock:
+                self._stats['checkouts'] += 1
+                self._stats['wait_time_total'] += waited
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+            return conn
+
+    def release(self, conn, discard=False):
+        """
+        归还连接
+
+        连接放回空闲列表前先回滚：pymysql默认不自动提交，查询后事务仍然打开，
+        不回滚时该连接之后的读取都会看到旧快照，并一直持有表的元数据锁。
+
+        Args:
+            conn: 数据库连接
+            discard (bool): 是否直接关闭该连接（例如连接已出错）
+        """
+        if conn is None:
+            return
+
+        now = time.monotonic()
+        created_at = self._created_at.get(id(conn), now)
+        if discard or not conn.open or self._is_expired(created_at, now, now):
+            self._close(conn)
+            return
+
+        try:
+            conn.rollback()
+        except Exception:
+            self._close(conn)
+            return
+
+        with self._lock:
+            self._idle.append((conn, created_at, now))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """以上下文管理器方式借用连接，出现连接级错误时丢弃该连接"""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle = [item[0] for item in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn)
+
+    def get_stats(self):
+        """
+        获取连接池指标
+
+        Returns:
+            dict: 连接池指标
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+        checkouts = stats['checkouts']
+        stats['wait_time_avg'] = round(stats['wait_time_total'] / checkouts, 6) if checkouts else 0.0
+        stats['wait_time_total'] = round(stats['wait_time_total'], 6)
+        stats['wait_time_max'] = round(stats['wait_time_max'], 6)
+        return stats
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    获取当前进程的连接池（fork之后自动重建，避免与父进程共享socket）
+
+    Returns:
+        ConnectionPool: 连接池实例
+    """
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(
+                    config.DB_CONFIG,
+                    max_size=config.DB_POOL_SIZE,
+                    timeout=config.DB_POOL_TIMEOUT,
+                    max_idle_time=config.DB_POOL_MAX_IDLE_TIME,
+                    max_lifetime=config.DB_POOL_MAX_LIFETIME,
+                    ping_interval=config.DB_POOL_PING_INTERVAL
+                )
+                _pool_pid = pid
+    return _pool
+
+def get_pool_stats():
+    """
+    获取连接池指标
+
+    Returns:
+        dict: 连接池指标
+    """
+    return get_pool().get_stats()
+
+# 🧱 高频JSON属性的物化列（summit上的STORED生成列）
+# 属性名 -> (列名, 列类型, 是否建索引)
+JSON_PROPERTY_COLUMNS = {
+    '$url_path': ('prop_url_path', 'VARCHAR(512)', True),
+    '$title': ('prop_title', 'VARCHAR(512)', True),
+    '$os': ('prop_os', 'VARCHAR(64)', True),
+    '$screen_name': ('prop_screen_name', 'VARCHAR(512)', False),
+    '$element_content': ('prop_element_content', 'VARCHAR(512)', False),
+    'event_duration': ('prop_event_duration', 'VARCHAR(64)', False)
+}
+
+# 顶层JSON字段 -> (物化列名, 列类型, 是否建索引)
+JSON_TOP_LEVEL_COLUMNS = {
+    '_track_id': ('track_id', 'VARCHAR(64)', True)
+}
+
+_summit_columns = None
+_summit_columns_loaded_at = 0.0
+_summit_columns_lock = threading.Lock()
+
 def get_db_connection():
     """
-    获取数据库连接
+    获取数据库连接（新建连接，连接池使用连接请通过 get_pool()）
     
     Returns:
         connection: 数据库连接对象，失败时返回None
@@ -34,41 +314,79 @@ def execute_query(query, params=None, fetch_all=True):
     Returns:
         tuple: (结果数据, 列名列表) 或 (None, None)
     """
-    conn = None
+    try:
+        with get_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                
+                # 获取列名
+                columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                
+                # 获取数据
+                if fetch_all:
+                    results = cursor.fetchall()
+                else:
+                    results = cursor.fetchone()
+            
+        return results, columns
+        
+    except Exception as e:
+        logging.error(f"查询执行失败: {e}")
+        return None, None
+
+def execute_query_stream(query, params=None, chunk_size=None):
+    """
+    以服务端游标（SSCursor）流式执行查询，分块返回结果
+
+    结果不会在客户端整体缓存，适合百万级结果集。迭代过程中占用一个连接池连接，
+    读完后归还时回滚结束只读事务；中途停止迭代时该连接会被丢弃（未读完的结果集无法复用连接）。
+
+    Args:
+        query (str): SQL查询语句
+        params (tuple): 查询参数
+        chunk_size (int): 每块行数，默认使用 config.QUERY_CHUNK_SIZE
+
+    Yields:
+        tuple: (本块数据列表, 列名列表)
+
+    Raises:
+        Exception: 查询失败时抛出，避免把不完整的结果当作完整结果使用
+    """
+    chunk_size = chunk_size or config.QUERY_CHUNK_SIZE
+    pool = get_pool()
+    conn = pool.acquire()
     cursor = None
+    finished = False
     
     try:
-        conn = get_db_connection()
-        if not conn:
-            return None, None
-            
-        cursor = conn.cursor()
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
         
         if params:
             cursor.execute(query, params)
         else:
             cursor.execute(query)
         
-        # 获取列名
         columns = [desc[0] for desc in cursor.description] if cursor.description else []
         
-        # 获取数据
-        if fetch_all:
-            results = cursor.fetchall()
-        else:
-            results = cursor.fetchone()
-            
-        return results, columns
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows, columns
+        
+        finished = True
         
     except Exception as e:
-        logging.error(f"查询执行失败: {e}")
-        return None, None
+        logging.error(f"流式查询执行失败: {e}")
+        raise
         
     finally:
-        if cursor:
+        if finished and cursor:
             cursor.close()
-        if conn:
-            conn.close()
+        pool.release(conn, discard=not finished)
 
 def execute_insert(query, params=None):
     """
@@ -81,35 +399,184 @@ def execute_insert(query, params=None):
     Returns:
         int: 影响的行数，失败时返回0
     """
-    conn = None
-    cursor = None
-    
     try:
-        conn = get_db_connection()
-        if not conn:
-            return 0
-            
-        cursor = conn.cursor()
-        
-        if params:
-            result = cursor.execute(query, params)
-        else:
-            result = cursor.execute(query)
-            
-        conn.commit()
+        # 出错时连接池会负责回滚
+        with get_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                if params:
+                    result = cursor.execute(query, params)
+                else:
+                    result = cursor.execute(query)
+                
+            conn.commit()
         return result
         
     except Exception as e:
         logging.error(f"插入操作失败: {e}")
-        if conn:
-            conn.rollback()
         return 0
+
+# 可重试的MySQL错误：锁等待超时、死锁、连接断开
+TRANSIENT_ERROR_CODES = {1205, 1213, 2006, 2013}
+
+# 批量写入累计指标（当前进程）
+_bulk_insert_stats = {
+    'calls': 0,
+    'rows': 0,
+    'batches': 0,
+    'failed_rows': 0,
+    'uncertain_rows': 0,
+    'retries': 0,
+    'seconds': 0.0
+}
+_bulk_insert_lock = threading.Lock()
+
+# 连接断开（服务器已断开 / 查询中丢失连接）
+CONNECTION_LOST_ERROR_CODES = {2006, 2013}
+
+def is_connection_lost(error):
+    """是否为连接断开错误"""
+    if isinstance(error, pymysql.err.InterfaceError):
+        return True
+    return (isinstance(error, pymysql.err.OperationalError) and bool(error.args)
+            and error.args[0] in CONNECTION_LOST_ERROR_CODES)
+
+def is_transient_error(error):
+    """是否为可重试的数据库错误"""
+    if is_connection_lost(error):
+        return True
+    return (isinstance(error, pymysql.err.OperationalError) and bool(error.args)
+            and error.args[0] in TRANSIENT_ERROR_CODES)
+
+# 数据库暂时不可用：连接数已满、无法连接服务器
+UNAVAILABLE_ERROR_CODES = {1040, 2002, 2003}
+
+def is_retryable_error(error):
+    """重试次数用尽后该批是否仍可稍后重写（数据库暂时不可用，而不是数据本身有问题）"""
+    if isinstance(error, PoolTimeoutError) or is_transient_error(error):
+        return True
+    return (isinstance(error, pymysql.err.OperationalError) and bool(error.args)
+            and error.args[0] in UNAVAILABLE_ERROR_CODES)
+
+def execute_bulk_insert(table, columns, rows, batch_size=None, ignore=False, max_retries=None):
+    """
+    批量插入：按批拆分为多行INSERT，在同一个连接池连接上逐批提交
+    
+    每批通过 executemany 生成一条多行INSERT（pymysql会把 VALUES 子句合并），
+    遇到锁等待超时、死锁或连接断开时按指数退避重试该批；连接断开时换新连接。
+    提交（COMMIT）时连接断开无法确定该批是否已写入：ignore=False 时不重试，
+    计入 uncertain_rows；ignore=True 时依赖唯一键去重，照常重试。
+    某一批最终失败只影响该批，其余批次继续写入。
+    
+    Args:
+        table (str): 表名
+        columns (list): 列名列表
+        rows (iterable): 参数元组的可迭代对象，可以是生成器
+        batch_size (int): 每批行数，默认 BULK_INSERT_BATCH_SIZE
+        ignore (bool): 使用 INSERT IGNORE（跳过唯一键冲突的行），表需有唯一键才能安全重试提交
+        max_retries (int): 每批最大重试次数，默认 BULK_INSERT_MAX_RETRIES
         
+    Returns:
+        dict: 写入统计，含每批的行数、耗时、重试次数和错误；失败批次的 retryable
+        表示失败原因是数据库暂时不可用（稍后可重写），否则为数据错误
+    """
+    batch_size = max(1, int(batch_size or config.BULK_INSERT_BATCH_SIZE))
+    max_retries = config.BULK_INSERT_MAX_RETRIES if max_retries is None else max_retries
+    query = (f"INSERT {'IGNORE ' if ignore else ''}INTO {table} ({', '.join(columns)}) "
+             f"VALUES ({', '.join(['%s'] * len(columns))})")
+    
+    pool = get_pool()
+    stats = {'rows': 0, 'batches': 0, 'failed_rows': 0, 'uncertain_rows': 0, 'retries': 0, 'batch_stats': []}
+    start_time = time.monotonic()
+    iterator = iter(rows)
+    conn = None
+    
+    try:
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                break
+            
+            batch_start = time.monotonic()
+            batch_stat = {'rows': len(batch), 'affected': 0, 'retries': 0, 'seconds': 0.0, 'error': None,
+                          'retryable': False, 'uncertain': False}
+            attempt = 0
+            while True:
+                committing = False
+                try:
+                    if conn is None:
+                        conn = pool.acquire()
+                    with conn.cursor() as cursor:
+                        batch_stat['affected'] = cursor.executemany(query, batch) or 0
+                    committing = True
+                    conn.commit()
+                    stats['rows'] += len(batch)
+                    break
+                except Exception as e:
+                    if committing and is_connection_lost(e):
+                        # COMMIT已发出但连接断开，服务器可能已提交该批
+                        pool.release(conn, discard=True)
+                        conn = None
+                        if not ignore:
+                            logging.error(f"批量插入 {table} 第{stats['batches'] + 1}批提交时连接断开，"
+                                          f"无法确定是否已写入，不再重试: {e}")
+                            batch_stat['error'] = f'提交结果未知: {e}'
+                            batch_stat['uncertain'] = True
+                            stats['uncertain_rows'] += len(batch)
+                            break
+                    elif conn is not None:
+                        # 回滚本批；连接已断开或回滚失败时丢弃该连接
+                        try:
+                            conn.rollback()
+                        except Exception:
+                            pool.release(conn, discard=True)
+                            conn = None
+                    
+                    if is_transient_error(e) and attempt < max_retries:
+                        attempt += 1
+                        batch_stat['retries'] += 1
+                        stats['retries'] += 1
+                        time.sleep(min(0.1 * 2 ** (attempt - 1), 2.0))
+                        continue
+                    
+                    logging.error(f"批量插入 {table} 第{stats['batches'] + 1}批失败: {e}")
+                    batch_stat['error'] = str(e)
+                    batch_stat['retryable'] = is_retryable_error(e)
+                    stats['failed_rows'] += len(batch)
+                    break
+            
+            batch_stat['seconds'] = round(time.monotonic() - batch_start, 6)
+            stats['batches'] += 1
+            stats['batch_stats'].append(batch_stat)
+    
     finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        if conn is not None:
+            pool.release(conn)
+    
+    elapsed = time.monotonic() - start_time
+    stats['success'] = stats['failed_rows'] == 0 and stats['uncertain_rows'] == 0
+    stats['seconds'] = round(elapsed, 6)
+    stats['rows_per_sec'] = round(stats['rows'] / elapsed, 1) if elapsed > 0 else 0.0
+    
+    with _bulk_insert_lock:
+        _bulk_insert_stats['calls'] += 1
+        _bulk_insert_stats['seconds'] += elapsed
+        for key in ('rows', 'batches', 'failed_rows', 'uncertain_rows', 'retries'):
+            _bulk_insert_stats[key] += stats[key]
+    
+    return stats
+
+def get_bulk_insert_stats():
+    """
+    获取批量写入累计指标（当前进程）
+    
+    Returns:
+        dict: 批量写入指标
+    """
+    with _bulk_insert_lock:
+        stats = dict(_bulk_insert_stats)
+    stats['rows_per_sec'] = round(stats['rows'] / stats['seconds'], 1) if stats['seconds'] else 0.0
+    stats['seconds'] = round(stats['seconds'], 3)
+    return stats
 
 def test_connection():
     """
@@ -119,19 +586,10 @@ def test_connection():
         dict: 连接测试结果
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return {
-                'success': False,
-                'message': '无法建立数据库连接'
-            }
-            
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM summit")
-        count = cursor.fetchone()[0]
-        
-        cursor.close()
-        conn.close()
+        with get_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM summit")
+                count = cursor.fetchone()[0]
         
         return {
             'success': True,
@@ -182,4 +640,292 @@ def get_table_info():
         
     except Exception as e:
         logging.error(f"获取表信息失败: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def json_extract_sql(property_name, top_level=False):
+    """
+    生成从 all_json 提取属性的SQL表达式
+    
+    Args:
+        property_name (str): properties下的属性名，如 '$url_path'
+        top_level (bool): 为True时提取顶层字段，如 '_track_id'
+        
+    Returns:
+        str: SQL表达式
+    """
+    path = f'"{property_name}"' if property_name.startswith('$') else property_name
+    return f"JSON_UNQUOTE(JSON_EXTRACT(all_json, '$.{'' if top_level else 'properties.'}{path}'))"
+
+def get_summit_columns(refresh=False):
+    """
+    获取summit表的列名集合（带缓存，迁移后其他worker在TTL内自动感知）
+    
+    Args:
+        refresh (bool): 是否强制重新读取
+        
+    Returns:
+        set: 列名集合，读取失败时为空集合
+    """
+    global _summit_columns, _summit_columns_loaded_at
+    
+    with _summit_columns_lock:
+        expired = time.monotonic() - _summit_columns_loaded_at > config.SCHEMA_CACHE_TTL
+        if refresh or _summit_columns is None or expired:
+            results, _ = execute_query("SHOW COLUMNS FROM summit")
+            # 读取失败时不缓存，下次再试
+            if results is not None:
+                _summit_columns = {row[0] for row in results}
+                _summit_columns_loaded_at = time.monotonic()
+            return _summit_columns or set()
+        return _summit_columns
+
+def json_property_sql(property_name):
+    """
+    获取JSON属性的SQL表达式：已物化时直接使用生成列，否则回退到 JSON_EXTRACT
+    
+    Args:
+        property_name (str): properties下的属性名，如 '$url_path'
+        
+    Returns:
+        str: SQL表达式
+    """
+    column_spec = JSON_PROPERTY_COLUMNS.get(property_name)
+    if column_spec and column_spec[0] in get_summit_columns():
+        return column_spec[0]
+    return json_extract_sql(property_name)
+
+def json_top_level_sql(field_name):
+    """
+    获取顶层JSON字段的SQL表达式：已物化时直接使用生成列，否则回退到 JSON_EXTRACT
+    
+    Args:
+        field_name (str): 顶层字段名，如 '_track_id'
+        
+    Returns:
+        tuple: (SQL表达式, 是否为物化列)
+    """
+    column_spec = JSON_TOP_LEVEL_COLUMNS.get(field_name)
+    if column_spec and column_spec[0] in get_summit_columns():
+        return column_spec[0], True
+    return json_extract_sql(field_name, top_level=True), False
+
+def build_json_column_migration(existing_columns=None):
+    """
+    生成为缺失的物化列执行的 ALTER TABLE 语句
+    
+    STORED生成列在ALTER时由MySQL为存量数据计算（即回填），之后写入时自动维护。
+    超过列长度的值会被截断。
+    
+    Args:
+        existing_columns (set): 现有列名，默认从数据库读取
+        
+    Returns:
+        str: ALTER语句，无需迁移时返回None
+    """
+    if existing_columns is None:
+        existing_columns = get_summit_columns(refresh=True)
+    
+    clauses = []
+    specs = [(name, spec, False) for name, spec in JSON_PROPERTY_COLUMNS.items()]
+    specs += [(name, spec, True) for name, spec in JSON_TOP_LEVEL_COLUMNS.items()]
+    for property_name, (column, column_type, indexed), top_level in specs:
+        if column in existing_columns:
+            continue
+        length = column_type[column_type.index('(') + 1:-1]
+        clauses.append(
+            f"ADD COLUMN {column} {column_type} "
+            f"GENERATED ALWAYS AS (LEFT({json_extract_sql(property_name, top_level)}, {length})) STORED"
+        )
+        if indexed:
+            clauses.append(f"ADD INDEX idx_summit_{column} ({column})")
+    
+    if not clauses:
+        return None
+    return "ALTER TABLE summit\n    " + ",\n    ".join(clauses)
+
+def migrate_json_columns():
+    """
+    为summit添加高频JSON属性的物化列并回填
+    
+    整张表会被重建一次，大表请在低峰期执行。
+    
+    Returns:
+        dict: 迁移结果
+    """
+    statement = build_json_column_migration()
+    if not statement:
+        return {'success': True, 'message': '物化列已全部存在，无需迁移', 'statement': None}
+    
+    try:
+        start = time.monotonic()
+        with get_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(statement)
+            conn.commit()
+        get_summit_columns(refresh=True)
+        
+        return {
+            'success': True,
+            'message': f'物化列迁移完成，耗时 {time.monotonic() - start:.1f} 秒',
+            'statement': statement
+        }
+        
+    except Exception as e:
+        logging.error(f"物化列迁移失败: {e}")
+        return {
+            'success': False,
+            'message': f'物化列迁移失败: {str(e)}',
+            'statement': statement
+        }
+
+# 📦 事件数据源
+# 分析使用的扁平化事件列 -> JSON属性名（None表示summit表的原生列）
+EVENT_COLUMNS = {
+    'distinct_id': None,
+    'event': None,
+    'created_at': None,
+    'url': None,
+    'referrer': None,
+    'url_path': '$url_path',
+    'event_duration': 'event_duration',
+    'page_title': '$title',
+    'screen_name': '$screen_name',
+    'element_content': '$element_content',
+    'os': '$os',
+    'brand': '$brand'
+}
+
+def event_column_sql(column):
+    """
+    扁平化事件列对应的SQL表达式
+
+    Args:
+        column (str): EVENT_COLUMNS 中的列名
+
+    Returns:
+        str: SQL表达式
+    """
+    property_name = EVENT_COLUMNS[column]
+    return json_property_sql(property_name) if property_name else column
+
+class EventSource:
+    """
+    事件数据源接口
+
+    iter_events 按块返回扁平化事件（DataFrame），过滤条件：
+    - start_ts / end_ts：created_at 闭区间
+    - events：event 取值列表
+    - any_of：[(列名, 操作, 值), ...]，任一满足即可；操作为 '=' 或 'contains'（不区分大小写）
+    - sample：(选中桶数, 总桶数)，只返回 CRC32(distinct_id) % 总桶数 < 选中桶数 的用户的事件；
+      同一用户总是落在同一个桶，较小的采样是较大采样的子集
+    """
+
+    name = None
+    # 是否支持直接执行SQL（不支持时各接口改用基于DataFrame的计算）
+    supports_sql = False
+
+    def iter_events(self, columns, start_ts=None, end_ts=None, events=None, any_of=None,
+                    order_by=None, limit=None, chunk_size=None, sample=None):
+        raise NotImplementedError
+
+def user_sample_mask(distinct_ids, sample):
+    """
+    按用户哈希分桶采样（与MySQL的 CRC32(distinct_id) 取值一致）
+
+    Args:
+        distinct_ids: distinct_id 数组或Series
+        sample (tuple): (选中桶数, 总桶数)
+
+    Returns:
+        numpy.ndarray: 布尔数组，选中的用户为True
+    """
+    selected, total = sample
+    codes, uniques = pd.factorize(pd.Series(distinct_ids, dtype=object).to_numpy())
+    buckets = np.fromiter((zlib.crc32(str(value).encode('utf-8')) % total for value in uniques),
+                          dtype=np.int64, count=len(uniques))
+    mask = np.zeros(len(codes), dtype=bool)
+    valid = codes >= 0
+    mask[valid] = buckets[codes[valid]] < selected
+    return mask
+
+class MySQLEventSource(EventSource):
+    """MySQL summit表数据源（JSON属性优先读取物化列）"""
+
+    name = 'mysql'
+    supports_sql = True
+
+    def build_query(self, columns, start_ts=None, end_ts=None, events=None, any_of=None,
+                    order_by=None, limit=None, sample=None):
+        """
+        生成查询SQL
+
+        Returns:
+            tuple: (SQL语句, 参数列表)
+        """
+        select_columns = ',\n                '.join(
+            column if EVENT_COLUMNS[column] is None else f"{event_column_sql(column)} AS {column}"
+            for column in columns
+        )
+        conditions = []
+        params = []
+
+        if start_ts is not None:
+            conditions.append('created_at >= %s')
+            params.append(int(start_ts))
+        if end_ts is not None:
+            conditions.append('created_at <= %s')
+            params.append(int(end_ts))
+        if events:
+            conditions.append(f"event IN ({', '.join(['%s'] * len(events))})")
+            params.extend(events)
+        if any_of:
+            alternatives = []
+            for column, op, value in any_of:
+                if op == 'contains':
+                    alternatives.append(f"{event_column_sql(column)} LIKE %s")
+                    params.append(f'%{value}%')
+                else:
+                    alternatives.append(f"{event_column_sql(column)} = %s")
+                    params.append(value)
+            conditions.append(f"({' OR '.join(alternatives)})")
+        if sample:
+            conditions.append('MOD(CRC32(distinct_id), %s) < %s')
+            params.extend([int(sample[1]), int(sample[0])])
+
+        query = f'''
+            SELECT 
+                {select_columns}
+            FROM summit
+            WHERE {' AND '.join(conditions) if conditions else '1=1'}
+        '''
+        if order_by:
+            query += f"    ORDER BY {', '.join(order_by)}\n"
+        if limit:
+            query += f"    LIMIT {int(limit)}\n"
+        return query, params
+
+    def iter_events(self, columns, start_ts=None, end_ts=None, events=None, any_of=None,
+                    order_by=None, limit=None, chunk_size=None, sample=None):
+        query, params = self.build_query(columns, start_ts, end_ts, events, any_of, order_by, limit, sample)
+        for rows, result_columns in execute_query_stream(query, params, chunk_size):
+            yield pd.DataFrame.from_records(rows, columns=result_columns)
+
+_event_source = None
+_event_source_lock = threading.Lock()
+
+def get_event_source():
+    """
+    获取当前配置的事件数据源（DATA_SOURCE: mysql / parquet）
+
+    Returns:
+        EventSource: 数据源
+    """
+    global _event_source
+    with _event_source_lock:
+        if _event_source is None:
+            if config.DATA_SOURCE == 'parquet':
+                from event_store import ParquetEventSource
+                _event_source = ParquetEventSource(config.EVENT_STORE_PATH)
+            else:
+                _event_source = MySQLEventSource()
+        return _event_source
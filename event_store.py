@@ -0,0 +1,285 @@
+# event_store.py
+# 📦 本地列式事件存储（按天分区的Parquet数据集）
+
+import os
+import time
+import uuid
+import shutil
+import logging
+from datetime import datetime
+import pandas as pd
+from config import get_config
+from database import EventSource, MySQLEventSource, EVENT_COLUMNS, user_sample_mask
+
+# 获取配置
+config = get_config()
+
+# 数据集中保存的扁平化列（与 EVENT_COLUMNS 一致），另有分区列 dt（YYYY-MM-DD，本地时区）
+EVENT_STORE_COLUMNS = list(EVENT_COLUMNS)
+PARTITION_COLUMN = 'dt'
+
+def _require_pyarrow():
+    """导入pyarrow（可选依赖，只有使用Parquet数据源时才需要）"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Parquet数据源需要安装pyarrow: pip install pyarrow')
+    return pyarrow
+
+def event_store_schema():
+    """数据集的Arrow表结构"""
+    pa = _require_pyarrow()
+    return pa.schema([
+        (column, pa.int64() if column == 'created_at' else pa.string())
+        for column in EVENT_STORE_COLUMNS
+    ])
+
+def partition_day(timestamp):
+    """时间戳所在的分区日期（本地时区，与时间范围计算一致）"""
+    return datetime.fromtimestamp(int(timestamp)).strftime('%Y-%m-%d')
+
+def normalize_event_frame(df):
+    """
+    把事件DataFrame整理为数据集结构：补齐缺失列、统一类型
+
+    Args:
+        df (pandas.DataFrame): 含 EVENT_STORE_COLUMNS 中部分或全部列的数据
+
+    Returns:
+        pandas.DataFrame: 列顺序与类型一致的数据
+    """
+    df = df.reindex(columns=EVENT_STORE_COLUMNS)
+    df['created_at'] = pd.to_numeric(df['created_at'], errors='coerce').fillna(0).astype('int64')
+    for column in EVENT_STORE_COLUMNS:
+        if column != 'created_at':
+            values = df[column].astype(object)
+            df[column] = values.where(values.isna(), values.astype(str))
+    return df
+
+class EventStoreWriter:
+    """
+    按天分区写入Parquet数据集
+
+    overwrite_partitions=True 时本次写入的分区先写到数据集下的临时目录
+    （以 _ 开头，读取时被忽略），close() 成功时再逐个替换旧分区，写入过程中
+    查询仍读到完整的旧数据，中途失败时旧分区保持不变。否则直接向分区追加文件。
+    同一分区的多次写入以多个文件追加。调用方按 created_at 大致有序写入时文件数最少。
+    """
+
+    def __init__(self, path, overwrite_partitions=True):
+        self.pa = _require_pyarrow()
+        self.path = path
+        self.overwrite_partitions = overwrite_partitions
+        self.schema = event_store_schema()
+        # 文件名包含随机部分，同一进程内先后创建的写入器也不会覆盖已有文件
+        self._run_id = f'{int(time.time())}-{uuid.uuid4().hex[:12]}'
+        self._staging_dir = os.path.join(path, f'_staging-{self._run_id}') if overwrite_partitions else None
+        self._writers = {}  # 分区日期 -> ParquetWriter
+        self._file_seq = 0
+        self.partitions = set()
+        self.rows_written = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _partition_dir(self, day, root=None):
+        return os.path.join(root or self.path, f'{PARTITION_COLUMN}={day}')
+
+    def _writer(self, day):
+        writer = self._writers.get(day)
+        if writer is None:
+            partition_dir = self._partition_dir(day, self._staging_dir)
+            self.partitions.add(day)
+            os.makedirs(partition_dir, exist_ok=True)
+            file_path = os.path.join(partition_dir, f'part-{self._run_id}-{self._file_seq}.parquet')
+            self._file_seq += 1
+            writer = self.pa.parquet.ParquetWriter(file_path, self.schema, compression='zstd')
+            self._writers[day] = writer
+        return writer
+
+    def write(self, df):
+        """
+        写入一块事件数据
+
+        Args:
+            df (pandas.DataFrame): 事件数据
+        """
+        if df.empty:
+            return
+        df = normalize_event_frame(df)
+        days = df['created_at'].map(partition_day)
+
+        for day, index in days.groupby(days).groups.items():
+            table = self.pa.Table.from_pandas(df.loc[index], schema=self.schema, preserve_index=False)
+            self._writer(day).write_table(table)
+        self.rows_written += len(df)
+
+        # 已经写完的更早分区及时关闭，控制同时打开的文件数
+        latest = days.max()
+        for day in [day for day in self._writers if day < latest and day not in set(days)]:
+            self._writers.pop(day).close()
+
+    def close(self, commit=True):
+        """
+        关闭所有分区文件；覆盖模式下用临时目录中的分区替换旧分区
+
+        Args:
+            commit (bool): False 时丢弃临时目录，旧分区保持不变
+        """
+        try:
+            for writer in self._writers.values():
+                writer.close()
+        finally:
+            self._writers = {}
+
+        if self._staging_dir is None or not os.path.isdir(self._staging_dir):
+            return
+        try:
+            if commit:
+                self._replace_partitions()
+        finally:
+            shutil.rmtree(self._staging_dir, ignore_errors=True)
+
+    def _replace_partitions(self):
+        """把临时目录中的分区逐个重命名到数据集中，旧分区先移到回收目录再删除"""
+        trash_dir = os.path.join(self.path, f'_trash-{self._run_id}')
+        os.makedirs(trash_dir, exist_ok=True)
+        try:
+            for day in sorted(self.partitions):
+                target = self._partition_dir(day)
+                if os.path.isdir(target):
+                    os.replace(target, self._partition_dir(day, trash_dir))
+                os.replace(self._partition_dir(day, self._staging_dir), target)
+        finally:
+            shutil.rmtree(trash_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+def export_events(path=None, start_ts=None, end_ts=None, chunk_size=None):
+    """
+    从MySQL导出事件到Parquet数据集（按天覆盖写入）
+
+    Args:
+        path (str): 数据集目录，默认 EVENT_STORE_PATH
+        start_ts (int): 起始时间戳（含），默认不限
+        end_ts (int): 结束时间戳（含），默认不限
+        chunk_size (int): 流式读取每块行数
+
+    Returns:
+        dict: 导出结果
+    """
+    path = path or config.EVENT_STORE_PATH
+    start_time = time.monotonic()
+
+    try:
+        source = MySQLEventSource()
+        with EventStoreWriter(path) as writer:
+            for chunk in source.iter_events(EVENT_STORE_COLUMNS, start_ts, end_ts,
+                                            order_by=['created_at'], chunk_size=chunk_size):
+                writer.write(chunk)
+        elapsed = time.monotonic() - start_time
+        return {
+            'success': True,
+            'message': f'导出完成: {writer.rows_written} 行，{len(writer.partitions)} 个分区，耗时 {elapsed:.1f} 秒',
+            'rows': writer.rows_written,
+            'partitions': sorted(writer.partitions)
+        }
+
+    except Exception as e:
+        logging.error(f"导出Parquet数据集失败: {e}")
+        return {'success': False, 'message': f'导出失败: {str(e)}'}
+
+class ParquetEventSource(EventSource):
+    """
+    Parquet数据集数据源
+
+    created_at 条件同时换算为分区条件，只扫描相关日期的文件；created_at、event
+    及其他列条件下推到Parquet行组统计信息过滤。
+    """
+
+    name = 'parquet'
+    supports_sql = False
+
+    def __init__(self, path):
+        self.path = path
+        self.pa = _require_pyarrow()
+
+    def dataset(self):
+        """打开数据集（每次调用重新发现文件，导出或导入后无需重启）"""
+        if not os.path.isdir(self.path):
+            raise FileNotFoundError(f'Parquet数据集不存在: {self.path}，请先执行 flask export-events')
+        ds = self.pa.dataset
+        partitioning = ds.partitioning(self.pa.schema([(PARTITION_COLUMN, self.pa.string())]), flavor='hive')
+        return ds.dataset(self.path, format='parquet', partitioning=partitioning,
+                          schema=event_store_schema().append(self.pa.field(PARTITION_COLUMN, self.pa.string())))
+
+    def build_filter(self, start_ts=None, end_ts=None, events=None, any_of=None):
+        """
+        生成下推过滤表达式
+
+        Returns:
+            pyarrow.dataset.Expression: 过滤表达式，无条件时返回None
+        """
+        pc = self.pa.compute
+        field = self.pa.dataset.field
+        conditions = []
+
+        if start_ts is not None:
+            conditions.append(field(PARTITION_COLUMN) >= partition_day(start_ts))
+            conditions.append(field('created_at') >= int(start_ts))
+        if end_ts is not None:
+            conditions.append(field(PARTITION_COLUMN) <= partition_day(end_ts))
+            conditions.append(field('created_at') <= int(end_ts))
+        if events:
+            conditions.append(field('event').isin(list(events)))
+        if any_of:
+            alternatives = []
+            for column, op, value in any_of:
+                if op == 'contains':
+                    alternatives.append(pc.match_substring(field(column), value, ignore_case=True))
+                else:
+                    alternatives.append(field(column) == value)
+            combined = alternatives[0]
+            for alternative in alternatives[1:]:
+                combined = combined | alternative
+            conditions.append(combined)
+
+        if not conditions:
+            return None
+        expression = conditions[0]
+        for condition in conditions[1:]:
+            expression = expression & condition
+        return expression
+
+    def iter_events(self, columns, start_ts=None, end_ts=None, events=None, any_of=None,
+                    order_by=None, limit=None, chunk_size=None, sample=None):
+        chunk_size = chunk_size or config.QUERY_CHUNK_SIZE
+        dataset = self.dataset()
+        expression = self.build_filter(start_ts, end_ts, events, any_of)
+        read_columns = list(columns) + (['distinct_id'] if sample and 'distinct_id' not in columns else [])
+
+        if order_by or limit:
+            # 排序/截断需要完整结果（先采样再截断）
+            table = dataset.to_table(columns=read_columns, filter=expression)
+            if sample:
+                table = table.filter(self.pa.array(user_sample_mask(table.column('distinct_id').to_pandas(), sample)))
+            if order_by:
+                table = table.sort_by([(column, 'ascending') for column in order_by])
+            if limit:
+                table = table.slice(0, int(limit))
+            batches = table.to_batches(max_chunksize=chunk_size)
+        else:
+            batches = dataset.to_batches(columns=read_columns, filter=expression, batch_size=chunk_size)
+
+        for batch in batches:
+            if batch.num_rows:
+                chunk = batch.to_pandas()
+                if sample and not (order_by or limit):
+                    chunk = chunk[user_sample_mask(chunk['distinct_id'], sample)].reset_index(drop=True)
+                if len(chunk):
+                    yield chunk[list(columns)] if len(read_columns) > len(columns) else chunk
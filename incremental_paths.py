@@ -0,0 +1,322 @@
+# incremental_paths.py
+# ⏩ 增量用户路径分析（水位线 + 未结束会话 + 按天路径计数）
+
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from config import get_config
+from utils import build_user_path_store_parallel, PathStore
+
+# 获取配置
+config = get_config()
+
+# 未结束会话需要保留的列（路径构建只用到这些列）
+OPEN_SESSION_COLUMNS = ['distinct_id', 'created_at', 'timestamp', 'step_identifier']
+
+# 状态文件格式版本，变化时旧状态自动重建
+STATE_VERSION = 1
+
+class IncrementalPathIndex:
+    """
+    增量路径索引
+
+    每组路径条件（选项、路径类型、起止选项、路径长度、关键词）一份持久化状态：
+    - watermark：已处理到的 created_at（含）
+    - open_rows：截至水位线仍可能继续的会话（最后一个事件距水位线不超过会话超时）
+    - days：已结束会话按会话开始日期汇总的路径计数（PathStore）
+
+    每次更新只读取 (watermark, now - lag] 的新事件，与未结束会话合并后重新划分会话；
+    最后一个事件早于 水位线 - 超时 的会话不会再有新事件加入，计入其开始日期的计数，
+    其余会话留在 open_rows。状态文件在同一台机器的所有worker之间共享。
+    """
+
+    def __init__(self, directory, loader, days=30, session_timeout_minutes=30, lag=60):
+        """
+        Args:
+            directory (str): 状态目录
+            loader (callable): loader(spec, start_ts, end_ts) -> 预处理后的事件DataFrame
+            days (int): 保留的天数（含今天）
+            session_timeout_minutes (int): 会话超时（分钟），与路径构建一致
+            lag (int): 跳过最近N秒的数据，等待写入完成
+        """
+        self.directory = directory
+        self.loader = loader
+        self.days = max(1, int(days))
+        self.session_timeout = session_timeout_minutes * 60
+        self.session_timeout_minutes = session_timeout_minutes
+        self.lag = lag
+        self._stats_lock = threading.Lock()
+        self._stats = {'updates': 0, 'rows_processed': 0, 'sessions_completed': 0, 'update_time_total': 0.0}
+        os.makedirs(directory, exist_ok=True)
+
+    def spec_key(self, spec):
+        """路径条件 -> 状态文件名"""
+        return hashlib.sha1(repr(sorted(spec.items())).encode('utf-8')).hexdigest()[:24]
+
+    def _path(self, spec, suffix):
+        return os.path.join(self.directory, f'{self.spec_key(spec)}.{suffix}')
+
+    def _first_day(self, now):
+        """保留窗口的第一天（本地时区零点）"""
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=self.days - 1)
+
+    def load_state(self, spec):
+        """读取状态，不存在或版本不符时返回None"""
+        try:
+            with open(self._path(spec, 'state'), 'rb') as f:
+                state = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        except Exception as e:
+            logging.error(f"读取增量路径状态失败: {e}")
+            return None
+        return state if state.get('version') == STATE_VERSION and state.get('spec') == spec else None
+
+    def save_state(self, spec, state):
+        """原子写入状态"""
+        path = self._path(spec, 'state')
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _lock(self, spec, wait=30, stale=600):
+        """
+        跨进程更新锁（O_EXCL创建锁文件，超过stale秒的锁视为持有者已退出）
+
+        Yields:
+            bool: 是否拿到锁；拿不到时调用方只读取现有状态
+        """
+        path = self._path(spec, 'lock')
+        deadline = time.monotonic() + wait
+        acquired = False
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                acquired = True
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > stale:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(0.1)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def update(self, spec, now=None, progress=None):
+        """
+        处理水位线之后的新事件
+
+        Args:
+            spec (dict): 路径条件
+            now (datetime): 当前时间，默认系统时间
+            progress (callable): 进度回调 progress(阶段, 0~1)
+
+        Returns:
+            dict: 更新后的状态
+        """
+        progress = progress or (lambda stage, fraction: None)
+        now = now or datetime.now()
+        first_day = self._first_day(now)
+
+        with self._lock(spec) as acquired:
+            state = self.load_state(spec)
+            if not acquired:
+                logging.info("增量路径状态正在被其他进程更新，使用现有状态")
+                return state or self._new_state(spec, first_day)
+
+            if state is None:
+                state = self._new_state(spec, first_day)
+
+            new_watermark = int(now.timestamp()) - self.lag
+            if new_watermark <= state['watermark']:
+                return state
+
+            start_time = time.monotonic()
+            progress('querying', 0.05)
+            delta = self.loader(spec, state['watermark'] + 1, new_watermark)
+
+            progress('building_paths', 0.6)
+            completed = self._advance(state, delta, new_watermark)
+            state['watermark'] = new_watermark
+
+            # 超出保留窗口的天数直接丢弃
+            first_key = first_day.strftime('%Y-%m-%d')
+            state['days'] = {day: store for day, store in state['days'].items() if day >= first_key}
+            self.save_state(spec, state)
+
+            elapsed = time.monotonic() - start_time
+            with self._stats_lock:
+                self._stats['updates'] += 1
+                self._stats['rows_processed'] += len(delta)
+                self._stats['sessions_completed'] += completed
+                self._stats['update_time_total'] += elapsed
+            logging.info(f"增量路径更新: 新事件 {len(delta)} 行，结束会话 {completed} 个，"
+                         f"未结束会话 {len(state['open_rows'])} 行，耗时 {elapsed:.2f} 秒")
+            return state
+
+    def _new_state(self, spec, first_day):
+        """初始状态：水位线为保留窗口开始之前，第一次更新即回填整个窗口"""
+        return {
+            'version': STATE_VERSION,
+            'spec': spec,
+            'watermark': int(first_day.timestamp()) - 1,
+            'open_rows': pd.DataFrame(columns=OPEN_SESSION_COLUMNS),
+            'days': {}
+        }
+
+    def _advance(self, state, delta, new_watermark):
+        """
+        合并新事件和未结束会话，把已结束的会话计入按天计数
+
+        Returns:
+            int: 本次结束的会话数
+        """
+        frames = [frame[OPEN_SESSION_COLUMNS] for frame in (state['open_rows'], delta) if not frame.empty]
+        if not frames:
+            return 0
+        df = pd.concat(frames, ignore_index=True)
+        df['step_identifier'] = df['step_identifier'].astype(object)
+        df = df[df['distinct_id'].notna()]
+        df = df.sort_values(['distinct_id', 'created_at'], kind='stable').reset_index(drop=True)
+        if df.empty:
+            state['open_rows'] = pd.DataFrame(columns=OPEN_SESSION_COLUMNS)
+            return 0
+
+        created = df['created_at'].to_numpy(dtype=np.int64)
+        users = df['distinct_id'].to_numpy()
+        new_session = np.ones(len(df), dtype=bool)
+        new_session[1:] = (users[1:] != users[:-1]) | (np.diff(created) > self.session_timeout)
+        session_starts = np.flatnonzero(new_session)
+        session_ids = np.cumsum(new_session) - 1
+
+        # 会话最后一个事件距水位线超过超时，之后的新事件（created_at > 水位线）不会再并入
+        session_last = np.maximum.reduceat(created, session_starts)
+        row_complete = (session_last <= new_watermark - self.session_timeout)[session_ids]
+        row_start_ts = created[session_starts][session_ids]
+
+        state['open_rows'] = df.loc[~row_complete, OPEN_SESSION_COLUMNS].reset_index(drop=True)
+        completed_rows = df[row_complete]
+        if completed_rows.empty:
+            return 0
+
+        # 按会话开始日期（本地时区）分组构建路径
+        day_keys = self._day_keys(row_start_ts[row_complete])
+        for day, index in pd.Series(day_keys).groupby(day_keys).groups.items():
+            store = self._build(state['spec'], completed_rows.iloc[index])
+            target = state['days'].setdefault(day, PathStore())
+            for steps, count in store.items():
+                target.add(steps, count)
+
+        return int(np.count_nonzero(new_session & row_complete))
+
+    def _day_keys(self, timestamps):
+        """时间戳 -> 本地日期字符串（按本地零点边界二分查找，避免逐行转换）"""
+        first = datetime.fromtimestamp(int(timestamps.min())).replace(hour=0, minute=0, second=0, microsecond=0)
+        last = datetime.fromtimestamp(int(timestamps.max())).replace(hour=0, minute=0, second=0, microsecond=0)
+        days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+        boundaries = np.array([int(day.timestamp()) for day in days], dtype=np.int64)
+        labels = np.array([day.strftime('%Y-%m-%d') for day in days], dtype=object)
+        return labels[np.searchsorted(boundaries, timestamps, side='right') - 1]
+
+    def _build(self, spec, df):
+        """在已结束（或未结束）会话的行上构建路径"""
+        return build_user_path_store_parallel(df, spec['path_type'], spec['start_option'], spec['end_option'],
+                                              spec['path_length'], self.session_timeout_minutes)
+
+    def query(self, spec, days, now=None, progress=None):
+        """
+        合并指定日期的路径计数（含当前未结束的会话）
+
+        Args:
+            spec (dict): 路径条件
+            days (list): 日期字符串列表（YYYY-MM-DD）
+            now (datetime): 当前时间
+            progress (callable): 进度回调
+
+        Returns:
+            PathStore: 合并后的路径存储
+        """
+        state = self.update(spec, now=now, progress=progress)
+        days = set(days)
+        result = PathStore()
+
+        for day in sorted(days):
+            store = state['days'].get(day)
+            if store is not None:
+                for steps, count in store.items():
+                    result.add(steps, count)
+
+        # 未结束的会话按当前已有事件计入（开始日期在范围内时）
+        open_rows = state['open_rows']
+        if not open_rows.empty:
+            open_rows = open_rows.sort_values(['distinct_id', 'created_at'], kind='stable').reset_index(drop=True)
+            created = open_rows['created_at'].to_numpy(dtype=np.int64)
+            users = open_rows['distinct_id'].to_numpy()
+            new_session = np.ones(len(open_rows), dtype=bool)
+            new_session[1:] = users[1:] != users[:-1]
+            start_ts = created[new_session][np.cumsum(new_session) - 1]
+            in_range = np.isin(self._day_keys(start_ts), list(days))
+            if in_range.any():
+                for steps, count in self._build(spec, open_rows[in_range]).items():
+                    result.add(steps, count)
+
+        return result
+
+    def get_stats(self):
+        """
+        获取增量更新统计（当前进程）
+
+        Returns:
+            dict: 统计信息
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['update_time_total'] = round(stats['update_time_total'], 3)
+        return stats
+
+def time_range_days(time_range, now=None, max_days=30):
+    """
+    时间范围 -> 覆盖的自然日（与仪表板趋势一致：最近N天含今天）
+
+    Args:
+        time_range (str): today / yesterday / last7days / last30days
+        now (datetime): 基准时间
+
+    Returns:
+        list: 日期字符串列表，不支持的范围返回None
+    """
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if time_range == 'today':
+        days = [today]
+    elif time_range == 'yesterday':
+        days = [today - timedelta(days=1)]
+    elif time_range in ('last7days', 'last30days'):
+        count = 7 if time_range == 'last7days' else 30
+        days = [today - timedelta(days=offset) for offset in range(count - 1, -1, -1)]
+    else:
+        return None
+    if (today - days[0]).days >= max_days:
+        return None
+    return [day.strftime('%Y-%m-%d') for day in days]
@@ -0,0 +1,342 @@
+# ingest.py
+# 📥 summit导出文件批量导入（CSV/JSON流式解析 → 数据库或Parquet数据集）
+
+import os
+import csv
+import sys
+import json
+import time
+import logging
+from config import get_config
+from database import execute_query, execute_bulk_insert, json_top_level_sql, EVENT_COLUMNS
+
+# 优先使用更快的orjson（可选依赖），未安装时回退到标准库
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+# 获取配置
+config = get_config()
+
+# 展开为 "分组.键" 形式的嵌套字段
+NESTED_FIELDS = ('properties', 'identities', 'lib')
+
+# 写入summit的列（其余属性保留在 all_json 中）
+SUMMIT_INSERT_COLUMNS = ('all_json', 'distinct_id', 'event', 'created_at', 'url', 'referrer')
+
+# 扁平化事件列 -> 展开后的字段名
+INGEST_COLUMN_SOURCES = {
+    column: f'properties.{property_name}' if property_name else column
+    for column, property_name in EVENT_COLUMNS.items()
+}
+INGEST_COLUMN_SOURCES.update({'url': 'properties.$url', 'referrer': 'properties.$referrer'})
+
+def flatten_event(record):
+    """
+    展开一条SDK事件：顶层标量字段原样保留，properties/identities/lib 展开为 "分组.键"
+
+    created_at 取入库时间 db_time（秒），缺失时由客户端时间 time（毫秒）换算。
+
+    Args:
+        record (dict): all_json 解析后的事件
+
+    Returns:
+        dict: 扁平化事件
+    """
+    flat = {}
+    for key, value in record.items():
+        if key in NESTED_FIELDS and isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                flat[f'{key}.{sub_key}'] = sub_value
+        elif not isinstance(value, (dict, list)):
+            flat[key] = value
+
+    created_at = record.get('db_time')
+    if created_at is None and record.get('time') is not None:
+        created_at = int(record['time']) // 1000
+    flat['created_at'] = int(created_at) if created_at is not None else None
+    return flat
+
+def summit_row(raw, flat):
+    """
+    生成写入summit的一行参数（列顺序同 SUMMIT_INSERT_COLUMNS）
+
+    Args:
+        raw (str): 原始JSON（写入 all_json）
+        flat (dict): flatten_event 的结果
+
+    Returns:
+        tuple: 插入参数
+    """
+    return (raw,) + tuple(flat.get(INGEST_COLUMN_SOURCES[column]) for column in SUMMIT_INSERT_COLUMNS[1:])
+
+def _open_text(path):
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+def iter_export_records(path):
+    """
+    流式读取导出文件中的原始事件
+
+    支持：
+    - CSV：含 all_json 列（数据库客户端导出格式）
+    - JSON Lines（.jsonl/.ndjson 或逐行JSON的 .json）：每行一个事件，或 {"all_json": "..."}
+    - JSON数组 / {"查询名": [...]}：整体解析后逐条返回
+
+    Args:
+        path (str): 文件路径
+
+    Yields:
+        tuple: (原始JSON字符串, 解析后的事件dict)，无法解析的行返回 (原始内容, None)
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.csv':
+        csv.field_size_limit(sys.maxsize)
+        with _open_text(path) as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or []
+            if 'all_json' not in header:
+                raise ValueError(f'CSV文件缺少 all_json 列: {path}')
+            index = header.index('all_json')
+            for row in reader:
+                if len(row) > index and row[index]:
+                    yield _parse_raw(row[index])
+        return
+
+    with _open_text(path) as f:
+        first_char = f.read(1)
+        while first_char and first_char.isspace():
+            first_char = f.read(1)
+        f.seek(0)
+
+        if first_char in ('[', '{') and extension == '.json' and not _is_json_lines(f):
+            data = json.load(f)
+            if isinstance(data, dict) and len(data) == 1 and isinstance(next(iter(data.values())), list):
+                data = next(iter(data.values()))
+            for item in data if isinstance(data, list) else [data]:
+                yield _unwrap(item)
+            return
+
+        for line in f:
+            line = line.strip()
+            if line:
+                raw, record = _parse_raw(line)
+                if record is not None and isinstance(record.get('all_json'), str):
+                    raw, record = _parse_raw(record['all_json'])
+                yield raw, record
+
+def _is_json_lines(f):
+    """判断 .json 文件是否为逐行JSON（首行即是一个完整的事件对象）"""
+    first_line = f.readline().strip()
+    f.seek(0)
+    try:
+        first = _loads(first_line)
+    except ValueError:
+        return False
+    return isinstance(first, dict) and not any(isinstance(value, list) for value in first.values())
+
+def _parse_raw(raw):
+    try:
+        record = _loads(raw)
+    except ValueError:
+        return raw, None
+    return raw, record if isinstance(record, dict) else None
+
+def _unwrap(item):
+    """兼容 {"all_json": "..."} 形式的导出行"""
+    if isinstance(item, dict) and isinstance(item.get('all_json'), str):
+        return _parse_raw(item['all_json'])
+    if isinstance(item, dict):
+        return json.dumps(item, ensure_ascii=False), item
+    return str(item), None
+
+class SummitSink:
+    """
+    写入summit表：每批一条多行INSERT（execute_bulk_insert，失败时按批重试）
+
+    skip_existing 为True时，先在本批时间范围内查询已入库的 _track_id 并跳过，
+    同一文件重复导入不会产生重复数据。
+    """
+
+    name = 'db'
+
+    def __init__(self, skip_existing=True):
+        self.skip_existing = skip_existing
+
+    def existing_track_ids(self, batch):
+        """
+        查询本批事件中已入库的 _track_id（两侧统一按字符串比较）
+        
+        已执行 flask migrate-json-columns 时按带索引的 track_id 物化列查找；
+        否则只能在本批的 created_at 范围内逐行提取JSON比较。
+        """
+        track_ids = sorted({str(flat['_track_id']) for _, flat in batch if flat.get('_track_id') is not None})
+        timestamps = [flat['created_at'] for _, flat in batch if flat.get('created_at') is not None]
+        if not track_ids:
+            return set()
+
+        track_id_sql, indexed = json_top_level_sql('_track_id')
+        conditions = [f"{track_id_sql} IN ({', '.join(['%s'] * len(track_ids))})"]
+        params = list(track_ids)
+        if not indexed:
+            if not timestamps:
+                return set()
+            conditions.insert(0, 'created_at BETWEEN %s AND %s')
+            params = [min(timestamps), max(timestamps)] + params
+
+        query = f'''
+            SELECT {track_id_sql}
+            FROM summit
+            WHERE {' AND '.join(conditions)}
+        '''
+        results, _ = execute_query(query, params)
+        return {str(row[0]) for row in results or [] if row[0] is not None}
+
+    def write(self, batch):
+        """
+        写入一批事件
+
+        Args:
+            batch (list): [(原始JSON, 扁平化事件), ...]
+
+        Returns:
+            tuple: (写入行数, 因已存在跳过的行数)
+        """
+        skipped = 0
+        if self.skip_existing:
+            existing = self.existing_track_ids(batch)
+            if existing:
+                before = len(batch)
+                batch = [item for item in batch if item[1].get('_track_id') is None
+                         or str(item[1]['_track_id']) not in existing]
+                skipped = before - len(batch)
+        if not batch:
+            return 0, skipped
+
+        rows = (summit_row(raw, flat) for raw, flat in batch)
+        result = execute_bulk_insert('summit', SUMMIT_INSERT_COLUMNS, rows, batch_size=len(batch))
+        return result['rows'], skipped
+
+    def close(self):
+        pass
+
+class ParquetSink:
+    """写入Parquet数据集（按天分区追加，列与 event_store 一致）"""
+
+    name = 'parquet'
+
+    def __init__(self, path=None):
+        import pandas as pd
+        from event_store import EventStoreWriter, EVENT_STORE_COLUMNS
+        self.pd = pd
+        self.columns = EVENT_STORE_COLUMNS
+        self.writer = EventStoreWriter(path or config.EVENT_STORE_PATH, overwrite_partitions=False)
+
+    def write(self, batch):
+        rows = [
+            [flat.get(INGEST_COLUMN_SOURCES[column]) for column in self.columns]
+            for _, flat in batch if flat.get('created_at') is not None
+        ]
+        self.writer.write(self.pd.DataFrame(rows, columns=self.columns))
+        return len(rows), 0
+
+    def close(self):
+        self.writer.close()
+
+def ingest_export(path, target='db', batch_size=None, output_path=None, dedupe=True,
+                  report_interval=10):
+    """
+    流式导入summit导出文件
+
+    Args:
+        path (str): 导出文件（.csv / .json / .jsonl）
+        target (str): 写入目标，db（summit表）或 parquet（EVENT_STORE_PATH 数据集）
+        batch_size (int): 每批行数，默认 INGEST_BATCH_SIZE
+        output_path (str): parquet目标目录，默认 EVENT_STORE_PATH
+        dedupe (bool): 按 _track_id 去重（文件内去重；写入数据库时同时跳过已入库的事件）
+        report_interval (int): 进度日志间隔（秒）
+
+    Returns:
+        dict: 导入结果和吞吐统计
+    """
+    batch_size = batch_size or config.INGEST_BATCH_SIZE
+    stats = {
+        'rows_read': 0,
+        'rows_written': 0,
+        'duplicates': 0,
+        'invalid': 0,
+        'failed': 0,
+        'batches': 0,
+        'min_created_at': None  # 写入事件的最早时间，用于提示需要重建的汇总和缓存
+    }
+    start_time = time.monotonic()
+    last_report = start_time
+    seen_track_ids = set()
+
+    try:
+        sink = ParquetSink(output_path) if target == 'parquet' else SummitSink(skip_existing=dedupe)
+    except Exception as e:
+        logging.error(f"初始化导入目标失败: {e}")
+        return {'success': False, 'message': f'导入失败: {str(e)}', **stats}
+
+    def flush(batch):
+        written, skipped = sink.write(batch)
+        if written:
+            timestamps = [flat['created_at'] for _, flat in batch if flat.get('created_at') is not None]
+            if timestamps and (stats['min_created_at'] is None or min(timestamps) < stats['min_created_at']):
+                stats['min_created_at'] = int(min(timestamps))
+        stats['batches'] += 1
+        stats['rows_written'] += written
+        stats['duplicates'] += skipped
+        stats['failed'] += len(batch) - written - skipped
+
+    try:
+        batch = []
+        for raw, record in iter_export_records(path):
+            stats['rows_read'] += 1
+            if record is None:
+                stats['invalid'] += 1
+                continue
+
+            flat = flatten_event(record)
+            track_id = flat.get('_track_id')
+            if dedupe and track_id is not None:
+                if track_id in seen_track_ids:
+                    stats['duplicates'] += 1
+                    continue
+                seen_track_ids.add(track_id)
+
+            batch.append((raw, flat))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+
+                now = time.monotonic()
+                if now - last_report >= report_interval:
+                    last_report = now
+                    logging.info(f"导入进度: 已读取 {stats['rows_read']} 行，"
+                                 f"{stats['rows_read'] / (now - start_time):.0f} 行/秒")
+        if batch:
+            flush(batch)
+
+    except Exception as e:
+        logging.error(f"导入导出文件失败: {e}")
+        return {'success': False, 'message': f'导入失败: {str(e)}', **stats}
+    finally:
+        sink.close()
+
+    elapsed = time.monotonic() - start_time
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_sec'] = round(stats['rows_read'] / elapsed, 1) if elapsed > 0 else 0.0
+    stats['parser'] = 'orjson' if orjson is not None else 'json'
+
+    return {
+        'success': stats['failed'] == 0,
+        'message': (f"导入完成: 读取 {stats['rows_read']} 行，写入 {stats['rows_written']} 行，"
+                    f"重复 {stats['duplicates']} 行，无效 {stats['invalid']} 行，失败 {stats['failed']} 行，"
+                    f"{stats['rows_per_sec']} 行/秒"),
+        **stats
+    }
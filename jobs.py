@@ -0,0 +1,550 @@
+# jobs.py
+# 🧵 异步分析任务管理（进程池执行 + 文件共享状态）
+
+import os
+import sys
+import json
+import fcntl
+import time
+import pickle
+import socket
+import uuid
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import get_config
+from utils import clear_result_caches, clear_memoized
+
+# 获取配置
+config = get_config()
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# 已创建的任务管理器：名称 -> JobManager
+_managers = {}
+
+# 本机名，任务进程存活检查只对同一台机器上的任务有效
+HOSTNAME = socket.gethostname()
+
+class JobQueueFullError(Exception):
+    """任务队列已满"""
+    pass
+
+class JobCancelled(Exception):
+    """任务在执行中被取消"""
+    pass
+
+class JobStore:
+    """
+    基于目录的任务状态存储
+
+    状态和结果以JSON文件保存（原子替换写入），gunicorn的多个worker以及执行任务的
+    子进程共享同一目录，因此任意worker都能查询、取消其他worker提交的任务。
+    状态更新在目录级文件锁内读-改-写，并可要求当前状态和执行批次与预期一致（比较并设置），
+    避免执行进程的进度写入覆盖其他进程写入的失败、取消或接管状态。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.directory, f'{job_id}.{suffix}')
+
+    def _write_json(self, path, data):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def claim(self, job_id, name='claim'):
+        """
+        原子地创建标记文件，多个进程中只有一个能成功
+
+        Returns:
+            bool: 是否由当前进程创建
+        """
+        try:
+            fd = os.open(self._path(job_id, name), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    def create(self, state):
+        """
+        创建任务状态（已存在时不覆盖）
+
+        Returns:
+            bool: 是否创建成功
+        """
+        if not self.claim(state['id']):
+            return False
+        self._write_json(self._path(state['id'], 'json'), state)
+        return True
+
+    def read(self, job_id):
+        """读取任务状态，不存在时返回None"""
+        return self._read_json(self._path(job_id, 'json'))
+
+    def update(self, job_id, expect_status=None, expect_run=None, **fields):
+        """
+        更新任务状态字段
+
+        Returns:
+            dict: 更新后的状态；不满足预期条件时返回未修改的当前状态，任务不存在时返回None
+        """
+        return self.compare_and_update(job_id, expect_status, expect_run, **fields)[0]
+
+    def compare_and_update(self, job_id, expect_status=None, expect_run=None, **fields):
+        """
+        在文件锁内读-改-写任务状态，当前状态不满足预期时不修改
+
+        Args:
+            job_id (str): 任务id
+            expect_status (tuple): 当前状态在其中时才更新
+            expect_run (str): 当前执行批次（run）一致时才更新
+            **fields: 需要更新的字段
+
+        Returns:
+            tuple: (当前状态, 是否已更新)，任务不存在时状态为None
+        """
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                state = self.read(job_id)
+                if state is None:
+                    return None, False
+                if expect_status is not None and state['status'] not in expect_status:
+                    return state, False
+                if expect_run is not None and state.get('run') != expect_run:
+                    return state, False
+                state.update(fields)
+                state['updated_at'] = time.time()
+                self._write_json(self._path(job_id, 'json'), state)
+                return state, True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save_result(self, job_id, result):
+        """保存任务结果"""
+        self._write_json(self._path(job_id, 'result'), result)
+
+    def load_result(self, job_id):
+        """读取任务结果，不存在时返回None"""
+        return self._read_json(self._path(job_id, 'result'))
+
+    def save_params(self, job_id, params):
+        """保存任务参数（提交进程退出后由其他进程重新提交时使用）"""
+        path = self._path(job_id, 'params')
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(params, f)
+        os.replace(tmp_path, path)
+
+    def load_params(self, job_id):
+        """读取任务参数，不存在时返回None"""
+        try:
+            with open(self._path(job_id, 'params'), 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def request_cancel(self, job_id):
+        """写入取消标记，执行中的任务在下一个检查点退出"""
+        with open(self._path(job_id, 'cancel'), 'w'):
+            pass
+
+    def is_cancel_requested(self, job_id):
+        """是否已请求取消"""
+        return os.path.exists(self._path(job_id, 'cancel'))
+
+    def remove(self, job_id):
+        """删除任务的全部文件（含接管标记）"""
+        for name in os.listdir(self.directory):
+            if name.startswith(f'{job_id}.') and not name.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def job_ids(self):
+        """所有任务id"""
+        return [name[:-5] for name in os.listdir(self.directory) if name.endswith('.json')]
+
+def _run_job(directory, job_id, run_id, func, params):
+    """
+    在子进程中执行任务（模块级函数，可被进程池序列化）
+
+    所有状态写入都要求任务仍处于活动状态且执行批次为 run_id：任务已被取消、判定超时
+    或由其他进程接管重新提交后，本次执行不再修改状态，并在下一个进度检查点退出。
+
+    Args:
+        directory (str): 任务状态目录
+        job_id (str): 任务id
+        run_id (str): 本次执行批次
+        func (callable): 任务函数，签名为 func(params, progress=None)
+        params (dict): 任务参数
+    """
+    store = JobStore(directory)
+
+    def update(expect_status=ACTIVE_STATUSES, **fields):
+        return store.compare_and_update(job_id, expect_status, run_id, **fields)[1]
+
+    def progress(stage, fraction):
+        if store.is_cancel_requested(job_id):
+            raise JobCancelled()
+        if not update(expect_status=(JOB_RUNNING,), stage=stage, progress=round(float(fraction), 3)):
+            raise JobCancelled()
+
+    try:
+        if store.is_cancel_requested(job_id):
+            raise JobCancelled()
+        if not update(expect_status=(JOB_QUEUED,), status=JOB_RUNNING, started_at=time.time(), pid=os.getpid()):
+            return
+
+        result = func(params, progress=progress)
+
+        store.save_result(job_id, result)
+        update(expect_status=(JOB_RUNNING,), status=JOB_SUCCEEDED, stage='done', progress=1.0,
+               finished_at=time.time())
+    except JobCancelled:
+        update(status=JOB_CANCELLED, finished_at=time.time())
+    except Exception as e:
+        logging.error(f"分析任务 {job_id} 执行失败: {e}")
+        update(status=JOB_FAILED, error=str(e), finished_at=time.time())
+    finally:
+        # 子进程可能继续执行后续任务：不保留本次任务填充的模块级缓存
+        clear_result_caches()
+        clear_memoized()
+
+def _pid_alive(pid):
+    """进程是否存在（当前机器）"""
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobManager:
+    """
+    异步任务管理器
+
+    - 任务在有界进程池中执行，本进程排队+执行中的任务数超过上限时拒绝提交
+    - 任务id由任务类型和去重键确定，相同参数的任务在执行中或结果未过期时直接复用
+    - 排队中的任务可直接取消；执行中的任务在下一个进度检查点退出
+    - 提交进程（排队中）或执行进程（执行中）已退出的任务由下一个访问它的进程接管并重新提交，
+      避免web进程重启后相同参数的请求一直复用已失效的任务
+    - 结束的任务保留 result_ttl 秒后清理
+    """
+
+    def __init__(self, name, func, max_workers=2, max_queue=8, result_ttl=1800, timeout=3600,
+                 directory=None, max_tasks_per_child=None):
+        self.name = name
+        self.func = func
+        self.max_workers = max(1, int(max_workers))
+        self.max_tasks_per_child = (config.ANALYSIS_JOB_MAX_TASKS_PER_CHILD
+                                    if max_tasks_per_child is None else max_tasks_per_child)
+        self.max_queue = max(0, int(max_queue))
+        self.result_ttl = result_ttl
+        self.timeout = timeout
+        self.store = JobStore(directory or config.ANALYSIS_JOB_DIR)
+
+        # 可重入：进程池提交后立即完成时回调会在持有锁的线程中执行
+        self._lock = threading.RLock()
+        self._executor = None
+        self._pid = None
+        self._futures = {}  # job_id -> Future（仅本进程提交的任务）
+        self._last_sweep = 0.0
+        self._stats = {
+            'submitted': 0,
+            'deduplicated': 0,
+            'rejected': 0,
+            'cancelled': 0,
+            'worker_crashes': 0
+        }
+        _managers[name] = self
+
+    def _get_executor(self):
+        """获取进程池（调用方需持有锁），fork出的子进程中重新创建"""
+        if self._executor is None or self._pid != os.getpid():
+            options = {}
+            if self.max_tasks_per_child and sys.version_info >= (3, 11):
+                # 定期重建子进程，任务中分配的内存（DataFrame、路径计数等）归还操作系统
+                options['max_tasks_per_child'] = self.max_tasks_per_child
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                **options
+            )
+            self._pid = os.getpid()
+            self._futures = {}
+        return self._executor
+
+    def make_job_id(self, dedupe_key):
+        """根据去重键生成任务id"""
+        digest = hashlib.sha1(repr((self.name, dedupe_key)).encode('utf-8')).hexdigest()
+        return digest[:24]
+
+    def submit(self, params, dedupe_key=None, force=False):
+        """
+        提交任务
+
+        Args:
+            params (dict): 任务参数（需可序列化）
+            dedupe_key: 去重键，不传则不去重
+            force (bool): 忽略已完成的同参数任务，重新执行
+
+        Returns:
+            tuple: (任务状态, 是否复用了已有任务)
+        """
+        self.sweep()
+        job_id = self.make_job_id(dedupe_key) if dedupe_key is not None else uuid.uuid4().hex[:24]
+
+        with self._lock:
+            existing = self.store.read(job_id)
+            if existing is not None and self._is_orphaned(existing):
+                return self._recover(job_id, existing, params), False
+            if existing is not None:
+                reusable = existing['status'] in ACTIVE_STATUSES or (
+                    existing['status'] == JOB_SUCCEEDED and not force)
+                if reusable:
+                    self._stats['deduplicated'] += 1
+                    return existing, True
+                self.store.remove(job_id)
+
+            self._check_capacity()
+
+            now = time.time()
+            state = {
+                'id': job_id,
+                'type': self.name,
+                'status': JOB_QUEUED,
+                'stage': 'queued',
+                'progress': 0.0,
+                'error': None,
+                'created_at': now,
+                'updated_at': now,
+                'started_at': None,
+                'finished_at': None,
+                'host': HOSTNAME,
+                'owner_pid': os.getpid(),
+                'run': uuid.uuid4().hex[:12]
+            }
+            if not self.store.create(state):
+                # 其他进程刚好提交了同一任务
+                self._stats['deduplicated'] += 1
+                return self.store.read(job_id) or state, True
+
+            self.store.save_params(job_id, params)
+            self._enqueue(job_id, state['run'], params)
+
+        return state, False
+
+    def _check_capacity(self):
+        """本进程排队+执行中的任务数达到上限时拒绝提交（调用方需持有锁）"""
+        self._get_executor()
+        pending = sum(1 for future in self._futures.values() if not future.done())
+        if pending >= self.max_workers + self.max_queue:
+            self._stats['rejected'] += 1
+            raise JobQueueFullError(f'分析任务队列已满（{pending}个任务进行中）')
+
+    def _enqueue(self, job_id, run_id, params):
+        """提交到本进程的进程池（调用方需持有锁）"""
+        args = (_run_job, self.store.directory, job_id, run_id, self.func, params)
+        try:
+            future = self._get_executor().submit(*args)
+        except BrokenProcessPool:
+            self._stats['worker_crashes'] += 1
+            self._executor = None
+            future = self._get_executor().submit(*args)
+
+        self._futures[job_id] = future
+        self._stats['submitted'] += 1
+        future.add_done_callback(lambda f, job_id=job_id, run_id=run_id: self._on_done(job_id, run_id, f))
+
+    def _is_orphaned(self, state):
+        """
+        任务是否已失去执行者：排队中的任务检查提交进程，执行中的任务检查执行进程
+
+        Returns:
+            bool: 进程已退出时返回True（其他机器上的任务无法检查，返回False，由超时清理）
+        """
+        if state['status'] not in ACTIVE_STATUSES or state.get('host') != HOSTNAME:
+            return False
+        pid = state.get('pid') if state['status'] == JOB_RUNNING else state.get('owner_pid')
+        return pid is not None and not _pid_alive(pid)
+
+    def _recover(self, job_id, state, params=None):
+        """
+        接管执行者已退出的任务并在本进程重新提交（调用方需持有锁）
+
+        多个进程同时发现时通过以失效进程pid命名的标记文件保证只有一个接管。
+
+        Returns:
+            dict: 接管后的任务状态
+        """
+        dead_pid = state.get('pid') if state['status'] == JOB_RUNNING else state.get('owner_pid')
+        if not self.store.claim(job_id, f'takeover-{dead_pid}'):
+            return self.store.read(job_id) or state
+
+        logging.warning(f"分析任务 {job_id} 的进程 {dead_pid} 已退出，重新提交")
+        now = time.time()
+        run = state.get('run')
+        params = params if params is not None else self.store.load_params(job_id)
+        if params is None:
+            return self.store.update(job_id, expect_status=ACTIVE_STATUSES, expect_run=run,
+                                     status=JOB_FAILED, error='任务进程已退出', finished_at=now)
+        if self.store.is_cancel_requested(job_id):
+            return self.store.update(job_id, expect_status=ACTIVE_STATUSES, expect_run=run,
+                                     status=JOB_CANCELLED, finished_at=now)
+
+        try:
+            self._check_capacity()
+        except JobQueueFullError as e:
+            return self.store.update(job_id, expect_status=ACTIVE_STATUSES, expect_run=run,
+                                     status=JOB_FAILED, error=str(e), finished_at=now)
+
+        new_run = uuid.uuid4().hex[:12]
+        state, requeued = self.store.compare_and_update(
+            job_id, ACTIVE_STATUSES, run, status=JOB_QUEUED, stage='queued', progress=0.0, error=None,
+            started_at=None, pid=None, host=HOSTNAME, owner_pid=os.getpid(), run=new_run)
+        if not requeued:
+            # 接管前任务已结束（执行进程退出前写入了最终状态）
+            return state
+        self.store.save_params(job_id, params)
+        self._enqueue(job_id, new_run, params)
+        return state
+
+    def _on_done(self, job_id, run_id, future):
+        """子进程异常退出或排队中被取消时补写任务状态（只修改本次执行批次仍在进行的任务）"""
+        with self._lock:
+            if self._futures.get(job_id) is future:
+                self._futures.pop(job_id)
+
+        if future.cancelled():
+            self.store.update(job_id, expect_status=ACTIVE_STATUSES, expect_run=run_id,
+                              status=JOB_CANCELLED, finished_at=time.time())
+            return
+
+        error = future.exception()
+        if error is not None:
+            if isinstance(error, BrokenProcessPool):
+                with self._lock:
+                    self._stats['worker_crashes'] += 1
+                    self._executor = None
+            logging.error(f"分析任务 {job_id} 进程异常: {error}")
+            self.store.update(job_id, expect_status=ACTIVE_STATUSES, expect_run=run_id, status=JOB_FAILED,
+                              error=str(error) or '任务进程异常退出', finished_at=time.time())
+
+    def get(self, job_id):
+        """
+        获取任务状态
+
+        Returns:
+            dict: 任务状态，不存在时返回None
+        """
+        self.sweep()
+        state = self.store.read(job_id)
+        if state is not None and self._is_orphaned(state):
+            with self._lock:
+                state = self._recover(job_id, state)
+        if state is not None:
+            state['cancel_requested'] = (state['status'] in ACTIVE_STATUSES and
+                                         self.store.is_cancel_requested(job_id))
+        return state
+
+    def get_result(self, job_id):
+        """获取任务结果，未完成或已过期时返回None"""
+        return self.store.load_result(job_id)
+
+    def cancel(self, job_id):
+        """
+        取消任务
+
+        Returns:
+            dict: 取消后的任务状态，不存在时返回None
+        """
+        state = self.get(job_id)
+        if state is None or state['status'] in FINISHED_STATUSES:
+            return state
+
+        self.store.request_cancel(job_id)
+        with self._lock:
+            future = self._futures.get(job_id)
+            self._stats['cancelled'] += 1
+        if future is not None and future.cancel():
+            return self.store.update(job_id, expect_status=ACTIVE_STATUSES, status=JOB_CANCELLED,
+                                     finished_at=time.time())
+        # 执行中（或由其他进程提交）的任务只写标记，状态由执行进程更新，避免并发覆盖
+        return self.get(job_id)
+
+    def sweep(self, force=False):
+        """清理过期结果，并把长时间无进展的任务标记为失败（最多每分钟执行一次）"""
+        now = time.time()
+        if not force and now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+
+        for job_id in self.store.job_ids():
+            state = self.store.read(job_id)
+            if state is None:
+                continue
+            if state['status'] in FINISHED_STATUSES:
+                if now - (state.get('finished_at') or state['updated_at']) > self.result_ttl:
+                    self.store.remove(job_id)
+            elif self._is_orphaned(state):
+                with self._lock:
+                    self._recover(job_id, state)
+            elif now - state['updated_at'] > self.timeout:
+                self.store.update(job_id, expect_status=ACTIVE_STATUSES, expect_run=state.get('run'),
+                                  status=JOB_FAILED, error='任务超时', finished_at=now)
+
+    def get_stats(self):
+        """
+        获取任务统计
+
+        Returns:
+            dict: 统计信息
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = sum(1 for future in self._futures.values() if not future.done())
+        stats['max_workers'] = self.max_workers
+        stats['max_queue'] = self.max_queue
+        return stats
+
+    def shutdown(self):
+        """关闭进程池（不等待执行中的任务）"""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def get_job_stats():
+    """
+    获取所有任务管理器的统计（当前进程）
+
+    Returns:
+        dict: 任务类型 -> 统计信息
+    """
+    return {name: manager.get_stats() for name, manager in _managers.items()}
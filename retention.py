@@ -0,0 +1,171 @@
+# retention.py
+# 🔁 留存分析按天用户集合缓存（一次流式扫描 + 已完成日期落盘）
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from config import get_config
+from utils import hash_user_ids
+
+# 获取配置
+config = get_config()
+
+# 缓存文件格式版本，变化时旧缓存自动失效
+CACHE_VERSION = 1
+
+class RetentionDayStore:
+    """
+    留存分析的按天用户集合
+
+    每组 (起始事件, 回访事件) 每个自然日保存两份排序去重后的用户哈希（uint64）：
+    当天发生起始事件的用户、当天发生回访事件的用户（回访事件为空表示任意事件）。
+    已结束的日期写入缓存目录后不再扫描，缺失的连续日期合并为一次流式扫描，
+    今天的数据每次重新扫描。缓存文件原子写入，同一台机器的所有worker共享。
+    """
+
+    def __init__(self, directory, scanner, lag=60):
+        """
+        Args:
+            directory (str): 缓存目录
+            scanner (callable): scanner(columns, start_ts, end_ts, events) -> DataFrame分块迭代器
+            lag (int): 日期结束后再等待N秒才落盘，等待写入完成
+        """
+        self.directory = directory
+        self.scanner = scanner
+        self.lag = lag
+        self._stats_lock = threading.Lock()
+        self._stats = {'days_cached': 0, 'days_scanned': 0, 'scans': 0, 'rows_scanned': 0, 'scan_time_total': 0.0}
+
+    def spec_key(self, start_event, return_event):
+        """(起始事件, 回访事件) -> 缓存子目录名"""
+        return hashlib.sha1(repr((CACHE_VERSION, start_event, return_event)).encode('utf-8')).hexdigest()[:24]
+
+    def _path(self, start_event, return_event, day):
+        return os.path.join(self.directory, self.spec_key(start_event, return_event), f"{day.strftime('%Y-%m-%d')}.npz")
+
+    def _load(self, path):
+        try:
+            with np.load(path) as data:
+                return data['start'], data['returned']
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"读取留存缓存失败 {path}: {e}")
+            return None
+
+    def _save(self, path, users):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz'
+        np.savez(tmp_path, start=users[0], returned=users[1])
+        os.replace(tmp_path, path)
+
+    def daily_users(self, start_event, return_event, days, now):
+        """
+        获取每天的起始/回访用户哈希
+
+        Args:
+            start_event (str): 起始事件
+            return_event (str): 回访事件，为空表示任意事件
+            days (list): 连续的本地零点datetime列表
+            now (datetime): 当前时间
+
+        Returns:
+            list: 每天的 (起始用户哈希, 回访用户哈希)
+        """
+        result = [None] * len(days)
+        missing = []
+        for index, day in enumerate(days):
+            if self._is_complete(day, now):
+                result[index] = self._load(self._path(start_event, return_event, day))
+            if result[index] is None:
+                missing.append(index)
+            else:
+                with self._stats_lock:
+                    self._stats['days_cached'] += 1
+
+        # 连续缺失的日期合并为一次扫描
+        for run in np.split(np.asarray(missing, dtype=np.int64), np.flatnonzero(np.diff(missing) != 1) + 1):
+            if not len(run):
+                continue
+            run_days = [days[index] for index in run]
+            for index, users in zip(run, self._scan(start_event, return_event, run_days)):
+                result[index] = users
+                if self._is_complete(days[index], now):
+                    try:
+                        self._save(self._path(start_event, return_event, days[index]), users)
+                    except OSError as e:
+                        logging.error(f"写入留存缓存失败: {e}")
+
+        return result
+
+    def _is_complete(self, day, now):
+        return (day + timedelta(days=1)).timestamp() + self.lag <= now.timestamp()
+
+    def _scan(self, start_event, return_event, days):
+        """
+        一次流式扫描连续日期，按天汇总去重后的用户哈希
+
+        Returns:
+            list: 每天的 (起始用户哈希, 回访用户哈希)
+        """
+        boundaries = np.array([int(day.timestamp()) for day in days] +
+                              [int((days[-1] + timedelta(days=1)).timestamp())], dtype=np.int64)
+        events = [start_event, return_event] if return_event else None
+        start_parts, return_parts = [], []
+        rows = 0
+        start_time = time.monotonic()
+
+        for chunk in self.scanner(['distinct_id', 'created_at', 'event'], int(boundaries[0]), int(boundaries[-1]) - 1, events):
+            chunk = chunk[chunk['distinct_id'].notna()]
+            if chunk.empty:
+                continue
+            rows += len(chunk)
+            created = pd.to_numeric(chunk['created_at'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+            frame = pd.DataFrame({
+                'day': np.searchsorted(boundaries, created, side='right') - 1,
+                'user': hash_user_ids(chunk['distinct_id'])
+            })
+            in_range = ((frame['day'] >= 0) & (frame['day'] < len(days))).to_numpy()
+            is_start = (chunk['event'] == start_event).to_numpy() & in_range
+            is_return = ((chunk['event'] == return_event).to_numpy() if return_event else np.ones(len(chunk), dtype=bool)) & in_range
+            start_parts.append(frame[is_start].drop_duplicates())
+            return_parts.append(frame[is_return].drop_duplicates())
+
+        result = list(zip(self._group_by_day(start_parts, len(days)), self._group_by_day(return_parts, len(days))))
+
+        elapsed = time.monotonic() - start_time
+        with self._stats_lock:
+            self._stats['scans'] += 1
+            self._stats['days_scanned'] += len(days)
+            self._stats['rows_scanned'] += rows
+            self._stats['scan_time_total'] += elapsed
+        logging.info(f"留存数据扫描完成: {len(days)} 天，{rows} 行，耗时 {elapsed:.2f} 秒")
+        return result
+
+    def _group_by_day(self, parts, n_days):
+        """分块的 (day, user) -> 每天排序去重的用户哈希"""
+        empty = np.empty(0, dtype=np.uint64)
+        if not parts:
+            return [empty] * n_days
+        frame = pd.concat(parts, ignore_index=True).drop_duplicates().sort_values(['day', 'user'])
+        day_values = frame['day'].to_numpy()
+        users = frame['user'].to_numpy(dtype=np.uint64)
+        bounds = np.searchsorted(day_values, np.arange(n_days + 1))
+        return [users[bounds[index]:bounds[index + 1]] for index in range(n_days)]
+
+    def get_stats(self):
+        """
+        获取缓存统计（当前进程）
+
+        Returns:
+            dict: 统计信息
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['scan_time_total'] = round(stats['scan_time_total'], 3)
+        return stats
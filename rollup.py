@@ -0,0 +1,771 @@
+# rollup.py
+# 🧮 预聚合（小时级汇总表）管理
+
+import time
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from config import get_config
+from database import get_pool, execute_query, execute_query_stream, json_property_sql
+from utils.hll import HyperLogLog, hash64
+
+# 获取配置
+config = get_config()
+
+# 计入PV的事件
+PV_EVENTS = ('$MPViewScreen', '$MPShow')
+
+# 按操作系统统计用户时使用的事件（与设备分布口径一致）
+OS_USER_EVENT = '$MPLaunch'
+
+ROLLUP_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS summit_rollup_hourly (
+        bucket_start INT NOT NULL PRIMARY KEY COMMENT '小时起始时间戳',
+        events BIGINT NOT NULL DEFAULT 0,
+        pv BIGINT NOT NULL DEFAULT 0,
+        users_sketch MEDIUMBLOB NOT NULL COMMENT 'distinct_id的HyperLogLog草图',
+        updated_at INT NOT NULL
+    ) DEFAULT CHARSET=utf8mb4
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS summit_rollup_hourly_os (
+        bucket_start INT NOT NULL,
+        os VARCHAR(64) NOT NULL,
+        users_sketch MEDIUMBLOB NOT NULL,
+        PRIMARY KEY (bucket_start, os)
+    ) DEFAULT CHARSET=utf8mb4
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS summit_rollup_hourly_event (
+        bucket_start INT NOT NULL,
+        event VARCHAR(128) NOT NULL,
+        events BIGINT NOT NULL DEFAULT 0,
+        users_sketch MEDIUMBLOB NOT NULL,
+        PRIMARY KEY (bucket_start, event)
+    ) DEFAULT CHARSET=utf8mb4
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS summit_rollup_hourly_sessions (
+        bucket_start INT NOT NULL PRIMARY KEY COMMENT '会话开始小时',
+        sessions BIGINT NOT NULL DEFAULT 0,
+        bounce_sessions BIGINT NOT NULL DEFAULT 0,
+        engaged_sessions BIGINT NOT NULL DEFAULT 0,
+        engaged_duration BIGINT NOT NULL DEFAULT 0 COMMENT '多事件会话的时长合计（秒）'
+    ) DEFAULT CHARSET=utf8mb4
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS summit_rollup_open_sessions (
+        user_hash BIGINT UNSIGNED NOT NULL PRIMARY KEY COMMENT 'distinct_id的64位哈希',
+        session_start INT NOT NULL,
+        last_event INT NOT NULL,
+        events INT NOT NULL
+    ) DEFAULT CHARSET=utf8mb4 COMMENT='水位线处尚未结束的会话'
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS summit_rollup_state (
+        name VARCHAR(64) NOT NULL PRIMARY KEY,
+        watermark INT NOT NULL COMMENT '已汇总数据的created_at上界（不含）',
+        updated_at INT NOT NULL
+    ) DEFAULT CHARSET=utf8mb4
+    '''
+]
+
+# 汇总表结构变化时更换状态名，旧状态下的汇总会在下次更新时自动清空重建；
+# 已保存的草图与 HLL_PRECISION 绑定，精度写入状态名，修改精度后同样自动重建
+ROLLUP_STATE_NAME = f'hourly_v3_p{config.HLL_PRECISION}'
+ROLLUP_LOCK_NAME = 'summit_rollup_update'
+
+# 按会话开始小时汇总的会话指标列
+SESSION_COLUMNS = ('sessions', 'bounce_sessions', 'engaged_sessions', 'engaged_duration')
+
+_refresh_thread = None
+_refresh_lock = threading.Lock()
+
+def floor_hour(timestamp):
+    """时间戳向下取整到小时"""
+    return int(timestamp) // 3600 * 3600
+
+def ceil_hour(timestamp):
+    """时间戳向上取整到小时"""
+    return -(-int(timestamp) // 3600) * 3600
+
+def ensure_rollup_tables(cursor):
+    """
+    创建汇总表（已存在时跳过）
+
+    Args:
+        cursor: 数据库游标
+    """
+    for statement in ROLLUP_TABLES:
+        cursor.execute(statement)
+
+def get_rollup_watermark():
+    """
+    获取汇总水位线
+
+    Returns:
+        int: 已汇总数据的created_at上界，未初始化或读取失败时返回None
+    """
+    results, _ = execute_query(
+        "SELECT watermark FROM summit_rollup_state WHERE name = %s",
+        (ROLLUP_STATE_NAME,), fetch_all=False
+    )
+    return int(results[0]) if results else None
+
+def aggregate_events(start_ts, end_ts):
+    """
+    流式扫描 [start_ts, end_ts) 区间的事件，按小时聚合
+
+    口径与精确查询一致：只统计 event 非空的事件，distinct_id 为空的事件计入次数和PV，不计入用户。
+
+    Args:
+        start_ts (int): 起始时间戳（含）
+        end_ts (int): 结束时间戳（不含）
+
+    Returns:
+        tuple: (小时桶 -> {'events', 'pv', 'users'}, (小时桶, os) -> HyperLogLog,
+                (小时桶, event) -> {'events', 'users'}, (用户哈希数组, created_at数组))
+    """
+    query = f'''
+        SELECT created_at, distinct_id, event, {json_property_sql('$os')} AS os
+        FROM summit
+        WHERE created_at >= %s AND created_at < %s AND event IS NOT NULL
+    '''
+
+    hourly = {}
+    hourly_os = {}
+    hourly_event = {}
+    user_parts, time_parts = [], []
+
+    for rows, columns in execute_query_stream(query, (start_ts, end_ts)):
+        chunk = pd.DataFrame.from_records(rows, columns=columns)
+        chunk['bucket'] = chunk['created_at'].astype(np.int64) // 3600 * 3600
+        chunk['is_pv'] = chunk['event'].isin(PV_EVENTS)
+
+        for bucket, index in chunk.groupby('bucket').indices.items():
+            entry = hourly.setdefault(int(bucket), {
+                'events': 0, 'pv': 0, 'users': HyperLogLog(config.HLL_PRECISION)
+            })
+            entry['events'] += len(index)
+            entry['pv'] += int(chunk['is_pv'].to_numpy()[index].sum())
+
+        for (bucket, event), index in chunk.groupby(['bucket', 'event']).indices.items():
+            hourly_event.setdefault((int(bucket), str(event)[:128]), {
+                'events': 0, 'users': HyperLogLog(config.HLL_PRECISION)
+            })['events'] += len(index)
+
+        # 用户草图和会话只统计有 distinct_id 的事件
+        known = chunk[chunk['distinct_id'].notna()].reset_index(drop=True)
+        if known.empty:
+            continue
+        known['user_hash'] = hash64(known['distinct_id'])
+        user_parts.append(known['user_hash'].to_numpy())
+        time_parts.append(known['created_at'].to_numpy(dtype=np.int64))
+
+        for bucket, index in known.groupby('bucket').indices.items():
+            hourly[int(bucket)]['users'].add_hashes(known['user_hash'].to_numpy()[index])
+
+        launches = known[(known['event'] == OS_USER_EVENT) & known['os'].notna() & (known['os'] != 'null')]
+        for (bucket, os_name), index in launches.groupby(['bucket', 'os']).indices.items():
+            os_name = str(os_name)[:64]
+            if not os_name.strip():
+                continue
+            sketch = hourly_os.setdefault((int(bucket), os_name), HyperLogLog(config.HLL_PRECISION))
+            sketch.add_hashes(launches['user_hash'].to_numpy()[index])
+
+        for (bucket, event), index in known.groupby(['bucket', 'event']).indices.items():
+            hourly_event[(int(bucket), str(event)[:128])]['users'].add_hashes(known['user_hash'].to_numpy()[index])
+
+    user_events = (
+        np.concatenate(user_parts) if user_parts else np.empty(0, dtype=np.uint64),
+        np.concatenate(time_parts) if time_parts else np.empty(0, dtype=np.int64)
+    )
+    return hourly, hourly_os, hourly_event, user_events
+
+def split_sessions(user_events, open_sessions, batch_end, timeout):
+    """
+    按会话超时切分会话（口径同 calculate_session_metrics），区分已结束和仍可能延续的会话
+
+    Args:
+        user_events (tuple): (用户哈希数组, created_at数组)，本批事件
+        open_sessions (pandas.DataFrame): 上一批未结束的会话，列为 user_hash、session_start、last_event、events
+        batch_end (int): 本批结束时间戳（不含）
+        timeout (int): 会话超时秒数，相邻事件间隔超过该值开始新会话
+
+    Returns:
+        tuple: (已结束会话, 未结束会话)，均为与 open_sessions 相同列的DataFrame
+    """
+    users, times = user_events
+    frame = pd.concat([
+        open_sessions.assign(created_at=open_sessions['last_event']),
+        pd.DataFrame({'user_hash': users, 'session_start': times, 'last_event': times,
+                      'events': np.ones(len(users), dtype=np.int64), 'created_at': times})
+    ], ignore_index=True)
+    columns = ['user_hash', 'session_start', 'last_event', 'events']
+    if frame.empty:
+        return frame[columns], frame[columns]
+
+    frame = frame.sort_values(['user_hash', 'created_at'], kind='stable')
+    new_session = frame['user_hash'].ne(frame['user_hash'].shift()) | (frame['created_at'].diff() > timeout)
+    sessions = frame.groupby(new_session.cumsum().to_numpy()).agg(
+        user_hash=('user_hash', 'first'), session_start=('session_start', 'min'),
+        last_event=('last_event', 'max'), events=('events', 'sum')
+    ).reset_index(drop=True)
+
+    # 下一批最早的事件与最后事件的间隔超过超时才能确定会话已结束
+    finished = (batch_end - sessions['last_event']) > timeout
+    return sessions[finished], sessions[~finished]
+
+def summarize_sessions(sessions):
+    """
+    已结束会话按开始小时汇总
+
+    Returns:
+        dict: 小时桶 -> {'sessions', 'bounce_sessions', 'engaged_sessions', 'engaged_duration'}
+    """
+    summary = {}
+    if sessions.empty:
+        return summary
+    frame = pd.DataFrame({
+        'bucket': sessions['session_start'].to_numpy(dtype=np.int64) // 3600 * 3600,
+        'bounce': (sessions['events'] == 1).to_numpy(),
+        'engaged': (sessions['events'] > 1).to_numpy(),
+        'duration': np.where(sessions['events'] > 1, sessions['last_event'] - sessions['session_start'], 0)
+    })
+    grouped = frame.groupby('bucket').agg(sessions=('bounce', 'size'), bounce_sessions=('bounce', 'sum'),
+                                          engaged_sessions=('engaged', 'sum'), engaged_duration=('duration', 'sum'))
+    for bucket, row in grouped.iterrows():
+        summary[int(bucket)] = {key: int(value) for key, value in row.items()}
+    return summary
+
+def load_open_sessions(cursor):
+    """读取上一批未结束的会话"""
+    cursor.execute("SELECT user_hash, session_start, last_event, events FROM summit_rollup_open_sessions")
+    rows = cursor.fetchall()
+    return pd.DataFrame({
+        'user_hash': np.array([row[0] for row in rows], dtype=np.uint64),
+        'session_start': np.array([row[1] for row in rows], dtype=np.int64),
+        'last_event': np.array([row[2] for row in rows], dtype=np.int64),
+        'events': np.array([row[3] for row in rows], dtype=np.int64)
+    })
+
+def save_sessions(cursor, finished, open_sessions):
+    """
+    已结束会话合并进开始小时的会话汇总，未结束会话整体替换
+
+    Args:
+        cursor: 数据库游标
+        finished (pandas.DataFrame): 已结束会话
+        open_sessions (pandas.DataFrame): 未结束会话
+    """
+    summary = summarize_sessions(finished)
+    if summary:
+        buckets = sorted(summary)
+        placeholders = ', '.join(['%s'] * len(buckets))
+        cursor.execute(
+            f"SELECT bucket_start, sessions, bounce_sessions, engaged_sessions, engaged_duration "
+            f"FROM summit_rollup_hourly_sessions WHERE bucket_start IN ({placeholders})", buckets
+        )
+        for bucket, *values in cursor.fetchall():
+            entry = summary[int(bucket)]
+            for key, value in zip(SESSION_COLUMNS, values):
+                entry[key] += int(value)
+
+        cursor.executemany(
+            f'''
+            REPLACE INTO summit_rollup_hourly_sessions (bucket_start, {', '.join(SESSION_COLUMNS)})
+            VALUES (%s, %s, %s, %s, %s)
+            ''',
+            [(bucket, *(entry[key] for key in SESSION_COLUMNS)) for bucket, entry in summary.items()]
+        )
+
+    cursor.execute("DELETE FROM summit_rollup_open_sessions")
+    if not open_sessions.empty:
+        cursor.executemany(
+            "INSERT INTO summit_rollup_open_sessions (user_hash, session_start, last_event, events) VALUES (%s, %s, %s, %s)",
+            [(int(user), int(start), int(last), int(events)) for user, start, last, events in
+             open_sessions[['user_hash', 'session_start', 'last_event', 'events']].itertuples(index=False)]
+        )
+
+def merge_and_save(cursor, hourly, hourly_os, hourly_event):
+    """
+    与已有汇总行合并后写回（水位线所在小时可能已有部分数据）
+
+    Args:
+        cursor: 数据库游标
+        hourly (dict): aggregate_events 的小时汇总
+        hourly_os (dict): aggregate_events 的小时+OS汇总
+        hourly_event (dict): aggregate_events 的小时+事件汇总
+    """
+    if hourly:
+        buckets = sorted(hourly)
+        placeholders = ', '.join(['%s'] * len(buckets))
+        cursor.execute(
+            f"SELECT bucket_start, events, pv, users_sketch FROM summit_rollup_hourly "
+            f"WHERE bucket_start IN ({placeholders})", buckets
+        )
+        for bucket, events, pv, sketch in cursor.fetchall():
+            entry = hourly[int(bucket)]
+            entry['events'] += int(events)
+            entry['pv'] += int(pv)
+            entry['users'].merge(HyperLogLog.from_bytes(sketch))
+
+        now = int(time.time())
+        cursor.executemany(
+            '''
+            REPLACE INTO summit_rollup_hourly (bucket_start, events, pv, users_sketch, updated_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ''',
+            [(bucket, entry['events'], entry['pv'], entry['users'].to_bytes(), now)
+             for bucket, entry in hourly.items()]
+        )
+
+    if hourly_os:
+        buckets = sorted({bucket for bucket, _ in hourly_os})
+        placeholders = ', '.join(['%s'] * len(buckets))
+        cursor.execute(
+            f"SELECT bucket_start, os, users_sketch FROM summit_rollup_hourly_os "
+            f"WHERE bucket_start IN ({placeholders})", buckets
+        )
+        for bucket, os_name, sketch in cursor.fetchall():
+            key = (int(bucket), os_name)
+            if key in hourly_os:
+                hourly_os[key].merge(HyperLogLog.from_bytes(sketch))
+
+        cursor.executemany(
+            '''
+            REPLACE INTO summit_rollup_hourly_os (bucket_start, os, users_sketch)
+            VALUES (%s, %s, %s)
+            ''',
+            [(bucket, os_name, sketch.to_bytes()) for (bucket, os_name), sketch in hourly_os.items()]
+        )
+
+    if hourly_event:
+        buckets = sorted({bucket for bucket, _ in hourly_event})
+        placeholders = ', '.join(['%s'] * len(buckets))
+        cursor.execute(
+            f"SELECT bucket_start, event, events, users_sketch FROM summit_rollup_hourly_event "
+            f"WHERE bucket_start IN ({placeholders})", buckets
+        )
+        for bucket, event, events, sketch in cursor.fetchall():
+            key = (int(bucket), event)
+            if key in hourly_event:
+                hourly_event[key]['events'] += int(events)
+                hourly_event[key]['users'].merge(HyperLogLog.from_bytes(sketch))
+
+        cursor.executemany(
+            '''
+            REPLACE INTO summit_rollup_hourly_event (bucket_start, event, events, users_sketch)
+            VALUES (%s, %s, %s, %s)
+            ''',
+            [(bucket, event, entry['events'], entry['users'].to_bytes())
+             for (bucket, event), entry in hourly_event.items()]
+        )
+
+def update_rollups(rebuild=False):
+    """
+    从水位线开始增量更新小时汇总
+
+    按 ROLLUP_BATCH_SECONDS 分批处理，每批在一个事务内写入汇总并推进水位线，
+    中途失败可从上次提交的水位线继续。多进程并发时通过MySQL命名锁保证只有一个在执行。
+    created_at 早于水位线的迟到数据不会被计入，需要时可用 rebuild 重建。
+
+    Args:
+        rebuild (bool): 是否清空汇总后从头重建
+
+    Returns:
+        dict: 更新结果
+    """
+    start_time = time.monotonic()
+    processed_batches = 0
+
+    try:
+        with get_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT GET_LOCK(%s, 0)", (ROLLUP_LOCK_NAME,))
+                if cursor.fetchone()[0] != 1:
+                    return {'success': False, 'message': '汇总更新正在其他进程中执行'}
+
+                try:
+                    ensure_rollup_tables(cursor)
+
+                    cursor.execute("SELECT watermark FROM summit_rollup_state WHERE name = %s", (ROLLUP_STATE_NAME,))
+                    row = cursor.fetchone()
+
+                    # 重建或当前状态不存在（首次汇总、汇总表结构升级）时清空旧汇总
+                    if rebuild or not row:
+                        cursor.execute("DELETE FROM summit_rollup_hourly")
+                        cursor.execute("DELETE FROM summit_rollup_hourly_os")
+                        cursor.execute("DELETE FROM summit_rollup_hourly_event")
+                        cursor.execute("DELETE FROM summit_rollup_hourly_sessions")
+                        cursor.execute("DELETE FROM summit_rollup_open_sessions")
+                        cursor.execute("DELETE FROM summit_rollup_state")
+                        conn.commit()
+                        row = None
+
+                    if row:
+                        watermark = int(row[0])
+                    else:
+                        cursor.execute("SELECT MIN(created_at) FROM summit")
+                        first = cursor.fetchone()[0]
+                        if first is None:
+                            return {'success': True, 'message': 'summit表为空，无需汇总'}
+                        watermark = floor_hour(first)
+                    conn.commit()
+
+                    # 留出延迟窗口，等待同一时刻的事件写入完成
+                    upper = int(time.time()) - config.ROLLUP_LAG
+
+                    while watermark < upper:
+                        batch_end = min(upper, watermark + config.ROLLUP_BATCH_SECONDS)
+                        hourly, hourly_os, hourly_event, user_events = aggregate_events(watermark, batch_end)
+                        merge_and_save(cursor, hourly, hourly_os, hourly_event)
+                        save_sessions(cursor, *split_sessions(user_events, load_open_sessions(cursor),
+                                                              batch_end, config.SESSION_TIMEOUT))
+                        cursor.execute(
+                            '''
+                            REPLACE INTO summit_rollup_state (name, watermark, updated_at)
+                            VALUES (%s, %s, %s)
+                            ''',
+                            (ROLLUP_STATE_NAME, batch_end, int(time.time()))
+                        )
+                        conn.commit()
+                        watermark = batch_end
+                        processed_batches += 1
+
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (ROLLUP_LOCK_NAME,))
+                    cursor.fetchone()
+
+        return {
+            'success': True,
+            'message': f'汇总更新完成: {processed_batches} 批，耗时 {time.monotonic() - start_time:.1f} 秒',
+            'watermark': watermark
+        }
+
+    except Exception as e:
+        logging.error(f"汇总更新失败: {e}")
+        return {'success': False, 'message': f'汇总更新失败: {str(e)}'}
+
+def refresh_rollups_async():
+    """
+    汇总数据过旧时在后台线程中更新（每个进程同时最多一个线程）
+
+    Returns:
+        bool: 是否启动了后台更新
+    """
+    global _refresh_thread
+
+    watermark = get_rollup_watermark()
+    if watermark is not None and time.time() - watermark < config.ROLLUP_REFRESH_INTERVAL:
+        return False
+
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return False
+        _refresh_thread = threading.Thread(target=update_rollups, name='rollup-refresh', daemon=True)
+        _refresh_thread.start()
+    return True
+
+def load_hourly_rollups(start_ts, end_ts):
+    """
+    读取 [start_ts, end_ts) 区间的小时汇总
+
+    Args:
+        start_ts (int): 起始时间戳
+        end_ts (int): 结束时间戳
+
+    Returns:
+        dict: 小时桶 -> {'events', 'pv', 'users'}，读取失败时返回None
+    """
+    results, _ = execute_query(
+        '''
+        SELECT bucket_start, events, pv, users_sketch
+        FROM summit_rollup_hourly
+        WHERE bucket_start >= %s AND bucket_start < %s
+        ''',
+        (floor_hour(start_ts), end_ts)
+    )
+    if results is None:
+        return None
+
+    return {
+        int(bucket): {'events': int(events), 'pv': int(pv), 'users': HyperLogLog.from_bytes(sketch)}
+        for bucket, events, pv, sketch in results
+    }
+
+def load_hourly_os_rollups(start_ts, end_ts):
+    """
+    读取 [start_ts, end_ts) 区间按OS的小时用户草图
+
+    Args:
+        start_ts (int): 起始时间戳
+        end_ts (int): 结束时间戳
+
+    Returns:
+        dict: os -> 合并后的HyperLogLog，读取失败时返回None
+    """
+    results, _ = execute_query(
+        '''
+        SELECT os, users_sketch
+        FROM summit_rollup_hourly_os
+        WHERE bucket_start >= %s AND bucket_start < %s
+        ''',
+        (floor_hour(start_ts), end_ts)
+    )
+    if results is None:
+        return None
+
+    merged = {}
+    for os_name, sketch in results:
+        sketch = HyperLogLog.from_bytes(sketch)
+        if os_name in merged:
+            merged[os_name].merge(sketch)
+        else:
+            merged[os_name] = sketch
+    return merged
+
+def load_hourly_event_rollups(start_ts, end_ts, events=None):
+    """
+    读取 [start_ts, end_ts) 区间按事件的小时用户草图
+
+    Args:
+        start_ts (int): 起始时间戳
+        end_ts (int): 结束时间戳
+        events (list): 只读取这些事件，默认全部
+
+    Returns:
+        dict: event -> {'events', 'users'}（已合并），读取失败时返回None
+    """
+    query = '''
+        SELECT event, events, users_sketch
+        FROM summit_rollup_hourly_event
+        WHERE bucket_start >= %s AND bucket_start < %s
+    '''
+    params = [floor_hour(start_ts), end_ts]
+    if events:
+        query += f" AND event IN ({', '.join(['%s'] * len(events))})"
+        params.extend(events)
+
+    results, _ = execute_query(query, params)
+    if results is None:
+        return None
+
+    merged = {}
+    for event, events_count, sketch in results:
+        entry = merged.setdefault(event, {'events': 0, 'users': HyperLogLog(config.HLL_PRECISION)})
+        entry['events'] += int(events_count)
+        entry['users'].merge(HyperLogLog.from_bytes(sketch))
+    return merged
+
+def sketch_coverage(start_ts, end_ts):
+    """
+    把 [start_ts, end_ts] 拆分为小时草图覆盖的整小时区间和需要扫描原始事件的零散区间
+
+    只使用水位线之前的完整小时；区间开头不足一小时的部分和水位线之后的部分扫描原始事件。
+
+    Args:
+        start_ts (int): 起始时间戳（含）
+        end_ts (int): 结束时间戳（含）
+
+    Returns:
+        tuple: ((草图起始, 草图结束), [(原始起始, 原始结束), ...])，结束均不含；
+               汇总不可用或原始区间超过 APPROX_UV_MAX_RAW_SECONDS 时返回None
+    """
+    watermark = get_rollup_watermark()
+    if watermark is None:
+        return None
+
+    end_exclusive = int(end_ts) + 1
+    sketch_start = min(ceil_hour(start_ts), end_exclusive)
+    sketch_end = max(sketch_start, min(floor_hour(end_exclusive), floor_hour(watermark)))
+
+    raw_ranges = [(start, end) for start, end in ((int(start_ts), sketch_start), (sketch_end, end_exclusive)) if start < end]
+    if sum(end - start for start, end in raw_ranges) > config.APPROX_UV_MAX_RAW_SECONDS:
+        return None
+    return (sketch_start, sketch_end), raw_ranges
+
+def scan_raw_user_sketches(raw_ranges, key_sql=None, event=None):
+    """
+    流式扫描零散区间的原始事件生成用户草图（与汇总使用相同的哈希）
+
+    Args:
+        raw_ranges (list): [(起始, 结束)]，结束不含
+        key_sql (str): 分组列的SQL表达式，默认不分组
+        event (str): 只统计该事件
+
+    Returns:
+        dict: 分组值（不分组时为None） -> HyperLogLog
+    """
+    sketches = {}
+    for start_ts, end_ts in raw_ranges:
+        query = f'''
+            SELECT distinct_id, {key_sql or 'NULL'} AS group_key
+            FROM summit
+            WHERE created_at >= %s AND created_at < %s
+            AND event {'= %s' if event else 'IS NOT NULL'}
+        '''
+        params = (start_ts, end_ts, event) if event else (start_ts, end_ts)
+        for rows, columns in execute_query_stream(query, params):
+            chunk = pd.DataFrame.from_records(rows, columns=columns)
+            chunk = chunk[chunk['distinct_id'].notna()]
+            for key, index in chunk.groupby('group_key', dropna=False).indices.items():
+                key = None if key_sql is None or pd.isna(key) else key
+                sketch = sketches.setdefault(key, HyperLogLog(config.HLL_PRECISION))
+                sketch.add_many(chunk['distinct_id'].to_numpy()[index])
+    return sketches
+
+def estimate_users(start_ts, end_ts):
+    """
+    估计 [start_ts, end_ts] 的去重用户数（合并小时草图 + 零散区间原始事件）
+
+    Returns:
+        HyperLogLog: 合并后的草图，不可用时返回None
+    """
+    coverage = sketch_coverage(start_ts, end_ts)
+    if coverage is None:
+        return None
+    (sketch_start, sketch_end), raw_ranges = coverage
+
+    sketches = []
+    if sketch_start < sketch_end:
+        rollups = load_hourly_rollups(sketch_start, sketch_end)
+        if rollups is None:
+            return None
+        sketches.extend(row['users'] for row in rollups.values())
+    sketches.extend(scan_raw_user_sketches(raw_ranges).values())
+    return HyperLogLog.merge_all(sketches, config.HLL_PRECISION)
+
+def estimate_os_users(start_ts, end_ts):
+    """
+    估计 [start_ts, end_ts] 内按OS的 $MPLaunch 去重用户数
+
+    Returns:
+        dict: os -> HyperLogLog，不可用时返回None
+    """
+    coverage = sketch_coverage(start_ts, end_ts)
+    if coverage is None:
+        return None
+    (sketch_start, sketch_end), raw_ranges = coverage
+
+    merged = {}
+    if sketch_start < sketch_end:
+        merged = load_hourly_os_rollups(sketch_start, sketch_end)
+        if merged is None:
+            return None
+    raw = scan_raw_user_sketches(raw_ranges, key_sql=json_property_sql('$os'), event=OS_USER_EVENT)
+    for os_name, sketch in raw.items():
+        if os_name is None or os_name == 'null' or not str(os_name).strip():
+            continue
+        os_name = str(os_name)[:64]
+        if os_name in merged:
+            merged[os_name].merge(sketch)
+        else:
+            merged[os_name] = sketch
+    return merged
+
+def estimate_event_users(start_ts, end_ts, events=None):
+    """
+    估计 [start_ts, end_ts] 内每个事件的次数和去重用户数
+
+    Args:
+        start_ts (int): 起始时间戳（含）
+        end_ts (int): 结束时间戳（含）
+        events (list): 只统计这些事件，默认全部
+
+    Returns:
+        dict: event -> {'events', 'users'(HyperLogLog)}，不可用时返回None
+    """
+    coverage = sketch_coverage(start_ts, end_ts)
+    if coverage is None:
+        return None
+    (sketch_start, sketch_end), raw_ranges = coverage
+
+    merged = {}
+    if sketch_start < sketch_end:
+        merged = load_hourly_event_rollups(sketch_start, sketch_end, events)
+        if merged is None:
+            return None
+    for start, end in raw_ranges:
+        query = '''
+            SELECT event, distinct_id
+            FROM summit
+            WHERE created_at >= %s AND created_at < %s AND event IS NOT NULL
+        '''
+        params = [start, end]
+        if events:
+            query += f" AND event IN ({', '.join(['%s'] * len(events))})"
+            params.extend(events)
+        for rows, columns in execute_query_stream(query, params):
+            chunk = pd.DataFrame.from_records(rows, columns=columns)
+            for event, index in chunk.groupby('event').indices.items():
+                entry = merged.setdefault(str(event)[:128], {'events': 0, 'users': HyperLogLog(config.HLL_PRECISION)})
+                entry['events'] += len(index)
+                user_ids = chunk['distinct_id'].to_numpy()[index]
+                entry['users'].add_many(user_ids[pd.notna(user_ids)])
+    return merged
+
+def load_hourly_session_rollups(start_ts, end_ts):
+    """
+    读取 [start_ts, end_ts) 区间开始的会话汇总（已合并）
+
+    Returns:
+        dict: {'sessions', 'bounce_sessions', 'engaged_sessions', 'engaged_duration'}，读取失败时返回None
+    """
+    results, _ = execute_query(
+        f'''
+        SELECT {', '.join(f'COALESCE(SUM({column}), 0)' for column in SESSION_COLUMNS)}
+        FROM summit_rollup_hourly_sessions
+        WHERE bucket_start >= %s AND bucket_start < %s
+        ''',
+        (floor_hour(start_ts), end_ts), fetch_all=False
+    )
+    if results is None:
+        return None
+    return {key: int(value or 0) for key, value in zip(SESSION_COLUMNS, results)}
+
+def estimate_basic_metrics(start_ts, end_ts):
+    """
+    由小时汇总估计 [start_ts, end_ts] 的仪表板基础指标
+
+    UV合并小时草图，PV累加小时汇总，只有不足一小时的边缘区间扫描原始事件；
+    会话指标取开始于草图覆盖小时内、且已结束的会话（边缘区间和尚未结束的会话不计入）。
+
+    Args:
+        start_ts (int): 起始时间戳（含）
+        end_ts (int): 结束时间戳（含）
+
+    Returns:
+        dict: {'users'(HyperLogLog), 'pv', 'sessions'(会话汇总)}，汇总不可用时返回None
+    """
+    coverage = sketch_coverage(start_ts, end_ts)
+    if coverage is None:
+        return None
+    (sketch_start, sketch_end), raw_ranges = coverage
+
+    sketches, pv = [], 0
+    sessions = dict.fromkeys(SESSION_COLUMNS, 0)
+    if sketch_start < sketch_end:
+        rollups = load_hourly_rollups(sketch_start, sketch_end)
+        sessions = load_hourly_session_rollups(sketch_start, sketch_end)
+        if rollups is None or sessions is None:
+            return None
+        sketches.extend(row['users'] for row in rollups.values())
+        pv += sum(row['pv'] for row in rollups.values())
+
+    for start, end in raw_ranges:
+        sketch = HyperLogLog(config.HLL_PRECISION)
+        query = '''
+            SELECT distinct_id, event
+            FROM summit
+            WHERE created_at >= %s AND created_at < %s AND event IS NOT NULL
+        '''
+        for rows, columns in execute_query_stream(query, (start, end)):
+            chunk = pd.DataFrame.from_records(rows, columns=columns)
+            pv += int(chunk['event'].isin(PV_EVENTS).sum())
+            sketch.add_many(chunk['distinct_id'].dropna().to_numpy())
+        sketches.append(sketch)
+
+    return {'users': HyperLogLog.merge_all(sketches, config.HLL_PRECISION), 'pv': pv, 'sessions': sessions}
@@ -6,51 +6,119 @@ from .data_processor import (
     clean_page_path,
     extract_domain_from_url,
     categorize_referrer,
+    invalidate_normalizer_caches,
+    get_time_bounds,
     get_time_condition,
     extract_json_property,
     build_comprehensive_step_identifier,
+    build_step_identifiers,
     apply_path_length_filter,
     preprocess_dataframe,
+    build_dataframe_from_chunks,
     generate_mock_trend_data,
     generate_mock_hourly_data
 )
 
+from .cache import (
+    memoized,
+    get_memoized_stats,
+    clear_memoized,
+    StaleWhileRevalidateCache,
+    LRUCache,
+    get_result_cache_stats,
+    clear_result_caches
+)
+
+from .path_store import (
+    PathStore,
+    PATH_SEPARATOR
+)
+
 from .path_analyzer import (
     extract_option_key,
     build_enhanced_user_paths,
+    build_user_path_store,
+    build_user_path_store_parallel,
     calculate_step_positions,
     build_enhanced_sankey_data,
     analyze_step_distribution,
     analyze_path_conversion,
     calculate_enhanced_path_stats,
+    build_path_analysis_result,
+    sample_count_interval,
+    path_user_square_sums,
+    scale_path_analysis_result,
     build_session_paths,
     get_popular_paths,
     calculate_path_metrics
 )
 
+from .funnel_analyzer import (
+    match_funnel_steps,
+    compute_funnel
+)
+
+from .retention_analyzer import (
+    hash_user_ids,
+    build_activity_bitmaps,
+    compute_retention
+)
+
 __all__ = [
     # data_processor
     'format_event_name',
     'clean_page_path',
     'extract_domain_from_url',
     'categorize_referrer',
+    'invalidate_normalizer_caches',
+    'get_time_bounds',
     'get_time_condition',
     'extract_json_property',
     'build_comprehensive_step_identifier',
+    'build_step_identifiers',
     'apply_path_length_filter',
     'preprocess_dataframe',
+    'build_dataframe_from_chunks',
     'generate_mock_trend_data',
     'generate_mock_hourly_data',
     
+    # cache
+    'memoized',
+    'get_memoized_stats',
+    'clear_memoized',
+    'StaleWhileRevalidateCache',
+    'LRUCache',
+    'get_result_cache_stats',
+    'clear_result_caches',
+    
+    # path_store
+    'PathStore',
+    'PATH_SEPARATOR',
+    
     # path_analyzer
     'extract_option_key',
     'build_enhanced_user_paths',
+    'build_user_path_store',
+    'build_user_path_store_parallel',
     'calculate_step_positions',
     'build_enhanced_sankey_data',
     'analyze_step_distribution',
     'analyze_path_conversion',
     'calculate_enhanced_path_stats',
+    'build_path_analysis_result',
+    'sample_count_interval',
+    'path_user_square_sums',
+    'scale_path_analysis_result',
     'build_session_paths',
     'get_popular_paths',
-    'calculate_path_metrics'
+    'calculate_path_metrics',
+    
+    # funnel_analyzer
+    'match_funnel_steps',
+    'compute_funnel',
+    
+    # retention_analyzer
+    'hash_user_ids',
+    'build_activity_bitmaps',
+    'compute_retention'
 ]
\ No newline at end of file
@@ -0,0 +1,344 @@
+# utils/benchmark.py
+# ⏱️ 性能基准测试工具模块（合成数据，不依赖数据库）
+
+import time
+import json
+import numpy as np
+import pandas as pd
+from utils.data_processor import (
+    clean_page_path, build_comprehensive_step_identifier, build_step_identifiers
+)
+from utils.path_analyzer import (
+    build_enhanced_user_paths, _build_user_paths_rowwise, build_enhanced_sankey_data,
+    analyze_step_distribution, analyze_path_conversion, calculate_enhanced_path_stats,
+    build_path_analysis_result, build_user_path_store_parallel
+)
+from utils.path_store import PathStore
+from utils.funnel_analyzer import match_funnel_steps, compute_funnel, compute_funnel_rowwise
+from utils.retention_analyzer import hash_user_ids, compute_retention, compute_retention_reference
+
+# 合成数据使用的步骤词表
+SYNTHETIC_STEPS = [
+    '小程序启动', '页面显示(首页)', '页面浏览(首页)', '页面浏览(商品详情)', '页面浏览(搜索结果)',
+    '点击事件[立即购买]', '点击事件[加入购物车]', '添加购物车', '提交订单', '页面离开(首页)',
+    '页面浏览(个人中心)', '分享', '搜索', '小程序隐藏', '页面浏览(直播)', '页面浏览(文章)'
+]
+
+# 合成原始事件使用的取值（含缺失值、空白值和需要截断的长文本）
+SYNTHETIC_EVENTS = ['$MPLaunch', '$MPShow', '$MPViewScreen', '$MPPageLeave', '$MPHide', 'click',
+                    'custom_event_name', '$WebClick', None]
+SYNTHETIC_URL_PATHS = ['pages/tabBar/home/home', 'pages/article/live', 'pages/goods/detail?id=1',
+                       'pages/user/center', 'null', '', None]
+SYNTHETIC_TITLES = ['亚马逊全球开店', '商品详情页面-这是一个特别长的页面标题用于测试截断', '  ', '', None]
+SYNTHETIC_URLS = ['https://www.example.com/shop/list.html', 'https://m.example.com/', 'pages/home/index',
+                  'http://localhost/test', ' ', None]
+SYNTHETIC_CONTENTS = ['立即购买', '  加入购物车并继续浏览更多相关商品  ', '', None]
+
+def timed(func, *args, **kwargs):
+    """
+    执行函数并计时
+
+    Returns:
+        tuple: (返回值, 耗时秒数)
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def generate_path_events(n_rows, n_users=None, seed=42):
+    """
+    生成预处理后格式的合成路径数据
+
+    Args:
+        n_rows (int): 行数
+        n_users (int): 用户数，默认为行数的1/20
+        seed (int): 随机种子
+
+    Returns:
+        pandas.DataFrame: 含 distinct_id、timestamp、step_identifier 列的数据
+    """
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(1, n_rows // 20)
+
+    user_ids = np.sort(rng.integers(0, n_users, n_rows))
+    # 每个用户独立的时间线，约5%的间隔超过30分钟以产生多会话
+    gaps = np.where(rng.random(n_rows) < 0.05, rng.integers(1800, 86400, n_rows), rng.integers(0, 120, n_rows))
+    elapsed = np.cumsum(gaps)
+    user_first_row = np.searchsorted(user_ids, user_ids)
+    created_at = 1750000000 + (elapsed - elapsed[user_first_row]) % (30 * 86400)
+    steps = np.asarray(SYNTHETIC_STEPS, dtype=object)[rng.integers(0, len(SYNTHETIC_STEPS), n_rows)]
+
+    return pd.DataFrame({
+        'distinct_id': pd.Series(user_ids).map(lambda uid: f'user-{uid}'),
+        'created_at': created_at,
+        'timestamp': pd.to_datetime(created_at, unit='s'),
+        'step_identifier': steps
+    })
+
+def benchmark_user_paths(n_rows=1000000, compare=True, path_type='start', start_option='', end_option='',
+                         path_length='all', workers=0):
+    """
+    用户路径构建基准测试：向量化实现 vs 逐行参考实现（可选多进程实现）
+
+    Args:
+        n_rows (int): 合成数据行数
+        compare (bool): 是否运行逐行实现并校验结果一致
+        workers (int): 大于1时同时测试多进程实现并校验结果一致
+
+    Returns:
+        dict: 基准测试结果
+    """
+    df = generate_path_events(n_rows)
+
+    vectorized_paths, vectorized_seconds = timed(
+        build_enhanced_user_paths, df, path_type, start_option, end_option, path_length
+    )
+
+    result = {
+        'rows': n_rows,
+        'distinct_paths': len(vectorized_paths),
+        'sessions': sum(vectorized_paths.values()),
+        'vectorized_seconds': round(vectorized_seconds, 3)
+    }
+
+    if workers > 1:
+        # 预热进程池，避免把子进程启动时间计入
+        build_user_path_store_parallel(df, path_type, start_option, end_option, path_length, workers=workers)
+        parallel_store, parallel_seconds = timed(
+            build_user_path_store_parallel, df, path_type, start_option, end_option, path_length,
+            workers=workers
+        )
+        result['parallel_workers'] = workers
+        result['parallel_seconds'] = round(parallel_seconds, 3)
+        result['parallel_identical'] = list(parallel_store.to_dict().items()) == list(vectorized_paths.items())
+
+    if compare:
+        rowwise_paths, rowwise_seconds = timed(
+            _build_user_paths_rowwise, df, path_type, start_option, end_option, path_length
+        )
+        result['rowwise_seconds'] = round(rowwise_seconds, 3)
+        result['speedup'] = round(rowwise_seconds / vectorized_seconds, 1) if vectorized_seconds else None
+        result['identical'] = rowwise_paths == vectorized_paths
+
+    return result
+
+def generate_raw_events(n_rows, seed=42):
+    """
+    生成与 query_user_path_data 查询结果格式一致的合成原始事件
+
+    Args:
+        n_rows (int): 行数
+        seed (int): 随机种子
+
+    Returns:
+        pandas.DataFrame: 原始事件数据（object列，缺失值为None）
+    """
+    rng = np.random.default_rng(seed)
+
+    def pick(values, missing_rate=0.0):
+        picked = np.asarray(values, dtype=object)[rng.integers(0, len(values), n_rows)]
+        if missing_rate:
+            picked[rng.random(n_rows) < missing_rate] = None
+        return picked
+
+    return pd.DataFrame({
+        'distinct_id': pick([f'user-{i}' for i in range(max(1, n_rows // 20))]),
+        'event': pick(SYNTHETIC_EVENTS),
+        'created_at': 1750000000 + rng.integers(0, 30 * 86400, n_rows),
+        'url_path': pick(SYNTHETIC_URL_PATHS),
+        'event_duration': pick(['1.5', '36.225', None]),
+        'page_title': pick(SYNTHETIC_TITLES, missing_rate=0.6),
+        'url': pick(SYNTHETIC_URLS),
+        'referrer': pick(['https://www.baidu.com/s', None]),
+        'screen_name': pick(['首页', ' ', None], missing_rate=0.5),
+        'element_content': pick(SYNTHETIC_CONTENTS)
+    }, dtype=object)
+
+def benchmark_step_identifiers(n_rows=500000, compare=True):
+    """
+    步骤标识构建基准测试：按列批量实现 vs 逐行apply实现
+
+    Args:
+        n_rows (int): 合成数据行数
+        compare (bool): 是否运行逐行实现并校验结果一致
+
+    Returns:
+        dict: 基准测试结果
+    """
+    df = generate_raw_events(n_rows)
+    df['clean_path'] = df['url_path'].apply(clean_page_path)
+
+    vectorized, vectorized_seconds = timed(build_step_identifiers, df)
+
+    result = {
+        'rows': n_rows,
+        'distinct_steps': vectorized.nunique(),
+        'vectorized_seconds': round(vectorized_seconds, 3)
+    }
+
+    if compare:
+        rowwise, rowwise_seconds = timed(df.apply, build_comprehensive_step_identifier, axis=1)
+        result['rowwise_seconds'] = round(rowwise_seconds, 3)
+        result['speedup'] = round(rowwise_seconds / vectorized_seconds, 1) if vectorized_seconds else None
+        result['identical'] = rowwise.tolist() == vectorized.tolist()
+
+    return result
+
+def generate_path_store(n_paths, n_steps=200, max_length=12, seed=42):
+    """
+    生成指定数量不同路径的合成路径存储
+
+    Args:
+        n_paths (int): 不同路径数
+        n_steps (int): 步骤词表大小
+        max_length (int): 最大路径长度
+        seed (int): 随机种子
+
+    Returns:
+        PathStore: 路径存储
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = [f'{SYNTHETIC_STEPS[i % len(SYNTHETIC_STEPS)]}#{i}' for i in range(n_steps)]
+    store = PathStore()
+    step_ids = store.intern_all(vocabulary)
+
+    while len(store) < n_paths:
+        length = int(rng.integers(2, max_length + 1))
+        sequence = rng.integers(0, n_steps, length)
+        if (sequence[1:] == sequence[:-1]).any():
+            continue
+        # 长尾分布的会话数
+        store.add_ids([step_ids[i] for i in sequence], int(rng.zipf(1.5)) % 1000 + 1)
+
+    return store
+
+def benchmark_result_builder(n_paths=100000, compare=True):
+    """
+    分析结果构建基准测试：单次遍历实现 vs 分别调用四个函数（字符串路径）
+
+    Args:
+        n_paths (int): 不同路径数
+        compare (bool): 是否运行原实现并校验JSON一致
+
+    Returns:
+        dict: 基准测试结果
+    """
+    store = generate_path_store(n_paths)
+    fused, fused_seconds = timed(build_path_analysis_result, store)
+
+    result = {
+        'distinct_paths': len(store),
+        'sessions': store.total(),
+        'fused_seconds': round(fused_seconds, 3)
+    }
+
+    if compare:
+        user_paths = store.to_dict()
+
+        def separate():
+            return {
+                'sankey': build_enhanced_sankey_data(user_paths),
+                'stepDistribution': analyze_step_distribution(user_paths),
+                'pathConversion': analyze_path_conversion(None, user_paths),
+                'pathStats': calculate_enhanced_path_stats(None, user_paths)
+            }
+
+        separate_result, separate_seconds = timed(separate)
+        result['separate_seconds'] = round(separate_seconds, 3)
+        result['speedup'] = round(separate_seconds / fused_seconds, 1) if fused_seconds else None
+        result['identical'] = (json.dumps(fused, ensure_ascii=False) ==
+                               json.dumps(separate_result, ensure_ascii=False))
+
+    return result
+
+def benchmark_funnel(n_rows=1000000, compare=True, n_steps=4, window_seconds=86400):
+    """
+    漏斗计算基准测试：逐步 merge_asof 向量化实现 vs 逐用户扫描参考实现
+
+    Args:
+        n_rows (int): 事件行数（约30天、每用户20行）
+        compare (bool): 是否运行参考实现并校验每步用户数一致
+        n_steps (int): 漏斗步骤数
+        window_seconds (int): 转化窗口（秒）
+
+    Returns:
+        dict: 基准测试结果
+    """
+    rng = np.random.default_rng(42)
+    df = generate_path_events(n_rows)[['distinct_id', 'created_at']]
+    events = np.asarray(SYNTHETIC_EVENTS[:6], dtype=object)
+    df['event'] = events[rng.integers(0, len(events), n_rows)]
+    step_filters = [('event', '=', events[index % len(events)]) for index in range(n_steps)]
+
+    masks, match_seconds = timed(match_funnel_steps, df, step_filters)
+    steps, funnel_seconds = timed(compute_funnel, df, masks, window_seconds)
+
+    result = {
+        'rows': n_rows,
+        'steps': n_steps,
+        'users_per_step': [step['users'] for step in steps],
+        'match_seconds': round(match_seconds, 3),
+        'funnel_seconds': round(funnel_seconds, 3)
+    }
+
+    if compare:
+        counts, rowwise_seconds = timed(compute_funnel_rowwise, df, masks, window_seconds)
+        result['rowwise_seconds'] = round(rowwise_seconds, 3)
+        result['speedup'] = round(rowwise_seconds / funnel_seconds, 1) if funnel_seconds else None
+        result['identical'] = counts == result['users_per_step']
+
+    return result
+
+def benchmark_retention(n_users=1000000, n_days=30, compare=True):
+    """
+    留存计算基准测试：每用户活跃位图 vs pandas分组参考实现
+
+    Args:
+        n_users (int): 用户数（每个用户在随机的一天首次启动，之后每天以递减的概率回访）
+        n_days (int): 天数（同期群数与留存周期数）
+        compare (bool): 是否运行参考实现并校验矩阵一致
+
+    Returns:
+        dict: 基准测试结果
+    """
+    rng = np.random.default_rng(42)
+    users = np.asarray([f'user-{uid}' for uid in range(n_users)], dtype=object)
+    first_day = rng.integers(0, n_days, n_users)
+
+    frames = []
+    for offset in range(n_days):
+        day = first_day + offset
+        active = (day < n_days) & (rng.random(n_users) < (1.0 if offset == 0 else 0.4 / offset ** 0.5))
+        frames.append(pd.DataFrame({'distinct_id': users[active], 'period': day[active],
+                                    'event': '$MPLaunch' if offset == 0 else '$MPShow'}))
+    events = pd.concat(frames, ignore_index=True)
+
+    def build_period_users():
+        grouped = dict(tuple(events.groupby('period')))
+        empty = pd.DataFrame(columns=events.columns)
+        result = []
+        for period in range(n_days):
+            frame = grouped.get(period, empty)
+            result.append((hash_user_ids(frame.loc[frame['event'] == '$MPLaunch', 'distinct_id']),
+                           hash_user_ids(frame['distinct_id'])))
+        return result
+
+    period_users, hash_seconds = timed(build_period_users)
+    retention, bitmap_seconds = timed(compute_retention, period_users, 0, n_days - 1)
+
+    result = {
+        'users': n_users,
+        'days': n_days,
+        'events': len(events),
+        'hash_seconds': round(hash_seconds, 3),
+        'bitmap_seconds': round(bitmap_seconds, 3),
+        'bitmap_bytes': n_users * 2 * 8 * ((n_days + 63) // 64)
+    }
+
+    if compare:
+        reference, reference_seconds = timed(compute_retention_reference, events, '$MPLaunch', '', 0, n_days, n_days - 1)
+        result['reference_seconds'] = round(reference_seconds, 3)
+        result['speedup'] = round(reference_seconds / bitmap_seconds, 1) if bitmap_seconds else None
+        result['identical'] = reference == retention
+
+    return result
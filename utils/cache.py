@@ -0,0 +1,336 @@
+# utils/cache.py
+# 🧊 缓存工具模块
+
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+# 已注册的记忆化函数：名称 -> lru_cache包装后的函数
+_memoized_functions = {}
+_registry_lock = threading.Lock()
+
+def memoized(maxsize=4096):
+    """
+    有界记忆化装饰器（LRU淘汰），用于纯函数
+
+    被装饰的函数会登记到全局注册表，可通过 get_memoized_stats 查看命中情况，
+    通过 clear_memoized 在依赖的配置变化后统一失效。
+
+    Args:
+        maxsize (int): 每个函数最多缓存的结果数
+
+    Returns:
+        callable: 装饰器
+    """
+    def decorator(func):
+        cached = lru_cache(maxsize=maxsize)(func)
+        with _registry_lock:
+            _memoized_functions[func.__name__] = cached
+        return cached
+    return decorator
+
+def get_memoized_stats():
+    """
+    获取所有记忆化函数的命中统计
+
+    Returns:
+        dict: 函数名 -> 统计信息
+    """
+    stats = {}
+    with _registry_lock:
+        functions = dict(_memoized_functions)
+    for name, cached in functions.items():
+        info = cached.cache_info()
+        total = info.hits + info.misses
+        stats[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+            'hit_rate': round(info.hits / total, 4) if total else 0.0
+        }
+    return stats
+
+def clear_memoized(*names):
+    """
+    清空记忆化缓存
+
+    Args:
+        *names (str): 需要清空的函数名，不传则清空全部
+    """
+    with _registry_lock:
+        functions = dict(_memoized_functions)
+    for name, cached in functions.items():
+        if not names or name in names:
+            cached.cache_clear()
+
+# 已注册的结果缓存：名称 -> 缓存实例
+_result_caches = {}
+
+class _Flight:
+    """一次进行中的加载，同key的并发请求共享其结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+class StaleWhileRevalidateCache:
+    """
+    带TTL的结果缓存，支持过期后返回旧值并在后台刷新（stale-while-revalidate），
+    同一个key同时只会有一次加载（single-flight）
+
+    - 未过期：直接返回缓存值
+    - 已过期但在 stale_ttl 宽限期内：返回旧值，同时启动后台刷新
+    - 无缓存或超出宽限期：当前请求同步加载，其他并发请求等待同一次加载的结果
+    """
+
+    def __init__(self, name, stale_ttl=3600):
+        self.name = name
+        self.stale_ttl = stale_ttl
+        self._entries = {}  # key -> (value, loaded_at)
+        self._inflight = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'shared_loads': 0,
+            'background_refreshes': 0,
+            'load_errors': 0
+        }
+        with _registry_lock:
+            _result_caches[name] = self
+
+    def get(self, key, loader, ttl, cache_if=None):
+        """
+        获取缓存值，必要时调用loader加载
+
+        Args:
+            key: 缓存键
+            loader (callable): 无参加载函数
+            ttl (float): 有效期（秒）
+            cache_if (callable): 判断结果是否写入缓存，默认全部缓存
+
+        Returns:
+            any: 缓存值或新加载的值
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            flight = self._inflight.get(key)
+            age = time.monotonic() - entry[1] if entry is not None else None
+
+            if entry is not None and age < ttl:
+                self._stats['hits'] += 1
+                return entry[0]
+
+            if entry is not None and age < ttl + self.stale_ttl:
+                # 宽限期内：返回旧值，没有刷新在进行时启动后台刷新
+                self._stats['stale_hits'] += 1
+                if flight is not None:
+                    return entry[0]
+                flight = self._inflight[key] = _Flight()
+                self._stats['background_refreshes'] += 1
+                action = 'refresh'
+            elif flight is None:
+                flight = self._inflight[key] = _Flight()
+                self._stats['misses'] += 1
+                action = 'load'
+            else:
+                # 已有同key的加载在进行，等待其结果
+                self._stats['shared_loads'] += 1
+                action = 'wait'
+
+        if action == 'refresh':
+            threading.Thread(
+                target=self._load, args=(key, loader, flight, cache_if),
+                name=f'{self.name}-refresh', daemon=True
+            ).start()
+            return entry[0]
+
+        if action == 'load':
+            self._load(key, loader, flight, cache_if)
+        else:
+            flight.event.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _load(self, key, loader, flight, cache_if):
+        try:
+            value = loader()
+            flight.value = value
+            if cache_if is None or cache_if(value):
+                with self._lock:
+                    self._entries[key] = (value, time.monotonic())
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._stats['load_errors'] += 1
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def put(self, key, value):
+        """
+        直接写入缓存值（例如一次加载同时得到多个key的结果）
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+
+    def invalidate(self, key=None):
+        """
+        使缓存失效
+
+        Args:
+            key: 缓存键，不传则清空全部
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 统计信息
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['inflight'] = len(self._inflight)
+        return stats
+
+class LRUCache:
+    """
+    线程安全的LRU缓存，同时受条目数、有效期和内存预算约束
+
+    写入时按 sizeof 估算条目大小，超出条目数或内存预算时淘汰最久未使用的条目；
+    读取时丢弃已过期的条目。单个条目超过整个预算时不缓存。
+    """
+
+    def __init__(self, name, maxsize=256, ttl=600, max_bytes=64 * 1024 * 1024, sizeof=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self._entries = OrderedDict()  # key -> (value, stored_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'rejected': 0
+        }
+        with _registry_lock:
+            _result_caches[name] = self
+
+    def get(self, key, default=None):
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+            default: 未命中时的返回值
+
+        Returns:
+            any: 缓存值或default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            if time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        size = self.sizeof(value)
+        with self._lock:
+            if size > self.max_bytes:
+                self._stats['rejected'] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.maxsize or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, key=None):
+        """
+        使缓存失效
+
+        Args:
+            key: 缓存键，不传则清空全部
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            elif key in self._entries:
+                self._remove(key)
+
+    def get_stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 统计信息
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+        return stats
+
+def get_result_cache_stats():
+    """
+    获取所有结果缓存的统计
+
+    Returns:
+        dict: 缓存名 -> 统计信息
+    """
+    with _registry_lock:
+        caches = dict(_result_caches)
+    return {name: cache.get_stats() for name, cache in caches.items()}
+
+def clear_result_caches():
+    """清空所有已注册的结果缓存（分析任务子进程在任务结束后调用，不跨任务保留缓存）"""
+    with _registry_lock:
+        caches = dict(_result_caches)
+    for cache in caches.values():
+        cache.invalidate()
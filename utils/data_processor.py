@@ -1,15 +1,21 @@
 # utils/data_processor.py
 # 📈 数据处理工具模块
 
+import numpy as np
 import pandas as pd
 import re
 from urllib.parse import urlparse
 from datetime import datetime, timedelta
 from config import get_config
+from utils.cache import memoized, clear_memoized
 
 # 获取配置
 config = get_config()
 
+# 规范化函数（纯函数）使用记忆化缓存，真实流量中不同取值通常只有几百个
+NORMALIZER_FUNCTIONS = ('format_event_name', 'clean_page_path', 'extract_domain_from_url', 'categorize_referrer')
+
+@memoized(maxsize=config.NORMALIZER_CACHE_SIZE)
 def format_event_name(event):
     """
     格式化事件显示名称
@@ -34,6 +40,7 @@ def format_event_name(event):
     
     return formatted_name
 
+@memoized(maxsize=config.NORMALIZER_CACHE_SIZE)
 def clean_page_path(path):
     """
     清理页面路径
@@ -72,6 +79,7 @@ def clean_page_path(path):
     
     return path_str
 
+@memoized(maxsize=config.NORMALIZER_CACHE_SIZE)
 def extract_domain_from_url(url):
     """
     从URL中提取域名
@@ -101,6 +109,7 @@ def extract_domain_from_url(url):
     except Exception:
         return 'unknown'
 
+@memoized(maxsize=config.NORMALIZER_CACHE_SIZE)
 def categorize_referrer(referrer):
     """
     分类来源渠道
@@ -123,17 +132,27 @@ def categorize_referrer(referrer):
     
     return domain, f"来源: {domain}"
 
-def get_time_condition(time_range):
+def invalidate_normalizer_caches():
     """
-    根据时间范围生成查询条件
+    清空规范化函数的缓存
+    
+    修改 Config.EVENT_NAME_MAPPING、REFERRER_MAPPING 或 EXCLUDED_PATHS 后需调用，
+    否则已缓存的结果仍按旧映射返回。
+    """
+    clear_memoized(*NORMALIZER_FUNCTIONS)
+
+def get_time_bounds(time_range, now=None):
+    """
+    根据时间范围计算起止时间戳
     
     Args:
         time_range (str): 时间范围标识
+        now (datetime): 计算相对时间范围的基准时间，默认当前时间
         
     Returns:
-        str: SQL时间条件语句
+        tuple: (起始时间戳, 结束时间戳)，均为闭区间；未知范围返回 (None, None)
     """
-    now = datetime.now()
+    now = now or datetime.now()
     
     if time_range == 'today':
         start_time = now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -148,10 +167,24 @@ def get_time_condition(time_range):
         start_time = now - timedelta(days=30)
         end_time = now
     else:
-        return ""
+        return None, None
     
-    start_timestamp = int(start_time.timestamp())
-    end_timestamp = int(end_time.timestamp())
+    return int(start_time.timestamp()), int(end_time.timestamp())
+
+def get_time_condition(time_range, now=None):
+    """
+    根据时间范围生成查询条件
+    
+    Args:
+        time_range (str): 时间范围标识
+        now (datetime): 计算相对时间范围的基准时间，默认当前时间
+        
+    Returns:
+        str: SQL时间条件语句
+    """
+    start_timestamp, end_timestamp = get_time_bounds(time_range, now)
+    if start_timestamp is None:
+        return ""
     
     return f"AND created_at BETWEEN {start_timestamp} AND {end_timestamp}"
 
@@ -198,13 +231,13 @@ def build_comprehensive_step_identifier(row):
     Returns:
         str: 步骤标识符
     """
-    event = row.get('event', '')
-    clean_path = row.get('clean_path', '')
-    page_title = row.get('page_title', '')
-    url = row.get('url', '')
-    referrer = row.get('referrer', '')
-    screen_name = row.get('screen_name', '')
-    element_content = row.get('element_content', '')
+    event = _blank_if_missing(row.get('event', ''))
+    clean_path = _blank_if_missing(row.get('clean_path', ''))
+    page_title = _blank_if_missing(row.get('page_title', ''))
+    url = _blank_if_missing(row.get('url', ''))
+    referrer = _blank_if_missing(row.get('referrer', ''))
+    screen_name = _blank_if_missing(row.get('screen_name', ''))
+    element_content = _blank_if_missing(row.get('element_content', ''))
     
     # 格式化事件名称
     formatted_event = format_event_name(event)
@@ -219,21 +252,117 @@ def build_comprehensive_step_identifier(row):
     elif clean_path and clean_path != 'unknown':
         identifier_parts.append(f"({clean_path})")
     elif url and len(str(url).strip()) > 0:
-        try:
-            parsed = urlparse(str(url))
-            path = parsed.path if parsed.path and parsed.path != '/' else parsed.netloc
-            if path:
-                clean_url_path = clean_page_path(path)
-                if clean_url_path != 'unknown':
-                    identifier_parts.append(f"({clean_url_path})")
-        except:
-            pass
+        identifier_parts.append(_url_step_suffix(url))
     elif element_content and len(str(element_content).strip()) > 0:
         content = str(element_content).strip()[:15]
         identifier_parts.append(f"[{content}]")
     
     return "".join(identifier_parts)
 
+def _blank_if_missing(value):
+    """缺失值（None/NaN）统一视为空字符串"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    return value
+
+def _url_step_suffix(url):
+    """
+    由URL生成步骤标识后缀
+    
+    Args:
+        url (str): URL
+        
+    Returns:
+        str: 形如 "(path)" 的后缀，无法提取时返回空字符串
+    """
+    try:
+        parsed = urlparse(str(url))
+        path = parsed.path if parsed.path and parsed.path != '/' else parsed.netloc
+        if path:
+            clean_url_path = clean_page_path(path)
+            if clean_url_path != 'unknown':
+                return f"({clean_url_path})"
+    except:
+        pass
+    return ''
+
+def _map_unique(series, func):
+    """
+    对列中每个不同的值只调用一次func，再按编码展开回整列
+    
+    Args:
+        series (pandas.Series): 数据列
+        func (callable): 单值处理函数，缺失值以None传入
+        
+    Returns:
+        numpy.ndarray: 处理结果（object数组）
+    """
+    codes, uniques = pd.factorize(series)
+    mapped = np.empty(len(uniques) + 1, dtype=object)
+    for i, value in enumerate(uniques):
+        mapped[i] = func(value)
+    mapped[-1] = func(None)  # 编码-1表示缺失值
+    return mapped[codes]
+
+def _dictionary_text(df, column):
+    """
+    对文本列做字典编码
+    
+    Args:
+        df (pandas.DataFrame): 数据
+        column (str): 列名
+        
+    Returns:
+        tuple: (行编码数组, 去重后的文本Series)，缺失值编码指向末尾的空字符串
+    """
+    if column not in df.columns:
+        return np.zeros(len(df), dtype=np.intp), pd.Series([''], dtype=object)
+    codes, uniques = pd.factorize(df[column])
+    texts = pd.Series(np.asarray(uniques, dtype=object), dtype=object).astype(str)
+    codes = np.where(codes < 0, len(texts), codes)
+    return codes, pd.concat([texts, pd.Series([''], dtype=object)], ignore_index=True)
+
+def build_step_identifiers(df):
+    """
+    按列批量构建步骤标识符（与逐行调用 build_comprehensive_step_identifier 结果一致）
+    
+    事件名称通过预先计算的映射字典转换；各文本列先字典编码，截断等字符串操作
+    只在去重后的取值上批量执行，再按优先级做掩码选择：
+    页面标题 > 屏幕名称 > 页面路径 > URL路径 > 元素内容。
+    
+    Args:
+        df (pandas.DataFrame): 含 clean_path 列的数据
+        
+    Returns:
+        pandas.Series: 步骤标识符
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    
+    events = df['event'] if 'event' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    formatted_events = _map_unique(events, lambda event: format_event_name(_blank_if_missing(event)))
+    
+    conditions = []
+    choices = []
+    
+    # (列名, 是否有效, 后缀) —— 按优先级排列
+    for column, is_valid, make_suffix in [
+        ('page_title', lambda t: t.str.strip().str.len() > 0, lambda t: '(' + t.str[:20] + ')'),
+        ('screen_name', lambda t: t.str.strip().str.len() > 0, lambda t: '(' + t.str[:20] + ')'),
+        ('clean_path', lambda t: (t != '') & (t != 'unknown'), lambda t: '(' + t + ')'),
+        ('url', lambda t: t.str.strip().str.len() > 0,
+         lambda t: t.map(lambda value: _url_step_suffix(value) if value else '')),
+        ('element_content', lambda t: t.str.strip().str.len() > 0,
+         lambda t: '[' + t.str.strip().str[:15] + ']')
+    ]:
+        codes, texts = _dictionary_text(df, column)
+        conditions.append(is_valid(texts).to_numpy(dtype=bool)[codes])
+        choices.append(make_suffix(texts).to_numpy(dtype=object)[codes])
+    
+    suffixes = np.select(conditions, choices, default='')
+    
+    return pd.Series(formatted_events + suffixes, index=df.index, dtype=object)
+
 def apply_path_length_filter(path_sequence, path_length):
     """
     应用路径长度筛选
@@ -275,11 +404,53 @@ def preprocess_dataframe(df):
     
     # 数据预处理
     df['timestamp'] = pd.to_datetime(df['created_at'], unit='s')
-    df['clean_path'] = df['url_path'].apply(clean_page_path)
+    df['clean_path'] = _map_unique(df['url_path'], clean_page_path)
     df['event_duration'] = pd.to_numeric(df.get('event_duration', 0), errors='coerce').fillna(0)
     
-    # 构建步骤标识（综合多个维度）
-    df['step_identifier'] = df.apply(lambda row: build_comprehensive_step_identifier(row), axis=1)
+    # 构建步骤标识（综合多个维度，按列批量计算）
+    df['step_identifier'] = build_step_identifiers(df)
+    
+    return df
+
+def build_dataframe_from_chunks(chunks, transform=None, category_columns=None):
+    """
+    由分块查询结果构建DataFrame
+
+    每块单独转换为DataFrame并可先做预处理/列裁剪，原始行元组用完即释放，
+    内存中不会同时存在完整的元组列表和DataFrame两份数据。
+
+    Args:
+        chunks (iterable): (行列表, 列名列表) 或 DataFrame 的迭代器，如 execute_query_stream
+            或数据源 iter_events 的返回值
+        transform (callable): 对每块DataFrame的处理函数，返回处理后的DataFrame
+        category_columns (list): 合并后转换为category类型的低基数列
+
+    Returns:
+        pandas.DataFrame: 合并后的数据
+    """
+    frames = []
+    
+    for chunk in chunks:
+        if isinstance(chunk, pd.DataFrame):
+            chunk_df = chunk
+        else:
+            rows, columns = chunk
+            chunk_df = pd.DataFrame.from_records(rows, columns=columns)
+            del rows
+        del chunk
+        if transform:
+            chunk_df = transform(chunk_df)
+        if not chunk_df.empty:
+            frames.append(chunk_df)
+    
+    if not frames:
+        return pd.DataFrame()
+    
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    
+    for column in category_columns or []:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
     
     return df
 
@@ -0,0 +1,130 @@
+# utils/funnel_analyzer.py
+# 🔄 漏斗分析工具模块（严格顺序 + 转化窗口）
+
+import numpy as np
+import pandas as pd
+
+def match_funnel_steps(df, step_filters):
+    """
+    计算每一行事件满足哪些漏斗步骤
+
+    Args:
+        df (pandas.DataFrame): 事件数据
+        step_filters (list): 每个步骤的 (列名, 匹配方式, 值)，匹配方式为 '=' 或 'contains'
+
+    Returns:
+        list: 每个步骤的布尔数组
+    """
+    masks = []
+    for column, op, value in step_filters:
+        if column not in df.columns:
+            masks.append(np.zeros(len(df), dtype=bool))
+            continue
+        values = df[column]
+        if op == 'contains':
+            mask = values.astype(str).str.contains(value, case=False, regex=False, na=False)
+            mask &= values.notna()
+        else:
+            mask = values.astype(object) == value
+        masks.append(mask.to_numpy(dtype=bool))
+    return masks
+
+def compute_funnel(df, step_masks, window_seconds):
+    """
+    严格顺序漏斗：用户在转化窗口内依次完成第1..k步即计为到达第k步
+
+    每一步只需一次按位置排序的 merge_asof：第k步的每个事件取同一用户在它之前
+    （严格更早的行）到达第k-1步的事件中最晚的链起点，起点到当前事件不超过窗口
+    即到达第k步。取最晚起点等价于尝试所有起点，结果与逐用户扫描的贪心算法一致。
+
+    Args:
+        df (pandas.DataFrame): 事件数据，需含 distinct_id、created_at
+        step_masks (list): match_funnel_steps 的结果
+        window_seconds (int): 转化窗口（秒），从第1步开始计算
+
+    Returns:
+        list: 每步 {'users', 'avg_time', 'median_time'}，时间为从第1步到首次到达该步的秒数
+    """
+    results = []
+    if df.empty or not step_masks:
+        return [{'users': 0, 'avg_time': None, 'median_time': None} for _ in step_masks]
+
+    # 按用户、时间排序，行号作为严格先后顺序（同一秒内的事件按读取顺序）
+    valid = df['distinct_id'].notna().to_numpy()
+    order = np.lexsort((df['created_at'].to_numpy(dtype=np.int64), pd.factorize(df['distinct_id'])[0]))
+    order = order[valid[order]]
+    users = pd.factorize(df['distinct_id'].to_numpy()[order])[0]
+    times = df['created_at'].to_numpy(dtype=np.int64)[order]
+    positions = np.arange(len(order), dtype=np.int64)
+
+    previous = None
+    for level, mask in enumerate(step_masks):
+        rows = np.flatnonzero(mask[order])
+        current = pd.DataFrame({'user': users[rows], 'pos': positions[rows], 'time': times[rows]})
+
+        if level == 0:
+            current['start'] = current['time']
+        elif previous is None or previous.empty or current.empty:
+            current = current.iloc[0:0].assign(start=pd.Series(dtype=np.int64))
+        else:
+            # 之前各位置上可用的最晚链起点（按用户累计最大值）
+            chains = previous[['user', 'pos', 'start']].sort_values('pos')
+            chains['start'] = chains.groupby('user')['start'].cummax()
+            current = pd.merge_asof(current.sort_values('pos'), chains, on='pos', by='user',
+                                    direction='backward', allow_exact_matches=False)
+            current = current[current['start'].notna()]
+            current['start'] = current['start'].astype(np.int64)
+            current = current[current['time'] - current['start'] <= window_seconds]
+
+        if current.empty:
+            results.append({'users': 0, 'avg_time': None, 'median_time': None})
+            previous = current
+            continue
+
+        # 每个用户首次到达该步所用的时间
+        first_reach = current.sort_values('pos').groupby('user', sort=False).first()
+        elapsed = (first_reach['time'] - first_reach['start']).to_numpy(dtype=np.float64)
+        results.append({
+            'users': int(len(first_reach)),
+            'avg_time': round(float(elapsed.mean()), 1),
+            'median_time': round(float(np.median(elapsed)), 1)
+        })
+        previous = current
+
+    return results
+
+def compute_funnel_rowwise(df, step_masks, window_seconds):
+    """
+    逐用户扫描的参考实现（用于基准测试校验）
+
+    Returns:
+        list: 每步到达的用户数
+    """
+    n_steps = len(step_masks)
+    counts = [0] * n_steps
+    frame = pd.DataFrame({'distinct_id': df['distinct_id'], 'created_at': df['created_at']})
+    for level, mask in enumerate(step_masks):
+        frame[f'step_{level}'] = mask
+    frame = frame[frame['distinct_id'].notna()]
+    frame = frame.iloc[np.lexsort((frame['created_at'].to_numpy(), pd.factorize(frame['distinct_id'])[0]))]
+
+    for _, events in frame.groupby('distinct_id', sort=False):
+        # starts[k]: 到达第k+1步的链中最晚的起点
+        starts = [None] * n_steps
+        best = 0
+        for row in events.itertuples(index=False):
+            # 先更新高层级，同一事件不会在同一行连续推进多步
+            for level in range(n_steps - 1, -1, -1):
+                if not getattr(row, f'step_{level}'):
+                    continue
+                if level == 0:
+                    starts[0] = row.created_at
+                elif starts[level - 1] is not None and row.created_at - starts[level - 1] <= window_seconds:
+                    if starts[level] is None or starts[level - 1] > starts[level]:
+                        starts[level] = starts[level - 1]
+                    best = max(best, level + 1)
+            if starts[0] is not None:
+                best = max(best, 1)
+        for level in range(best):
+            counts[level] += 1
+    return counts
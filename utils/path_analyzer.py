@@ -1,9 +1,26 @@
 # utils/path_analyzer.py
 # 🔄 路径分析工具模块
 
+import os
+import logging
+import threading
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 from collections import Counter, defaultdict
 from utils.data_processor import format_event_name, apply_path_length_filter
+from utils.path_store import PathStore, PATH_SEPARATOR
+from config import get_config
+
+# 获取配置
+config = get_config()
+
+# 并行构建路径使用的进程池
+_parallel_executor = None
+_parallel_executor_key = None
+_parallel_lock = threading.Lock()
 
 def extract_option_key(option):
     """
@@ -28,9 +45,268 @@ def extract_option_key(option):
         return option.replace('referrer_', '')
     return option
 
-def build_enhanced_user_paths(df, path_type, start_option, end_option, path_length):
+def build_enhanced_user_paths(df, path_type, start_option, end_option, path_length,
+                              session_timeout_minutes=30):
     """
-    构建增强的用户路径
+    构建增强的用户路径（向量化实现）
+    
+    会话划分、相邻重复步骤去重和路径筛选都在整数编码数组上完成，
+    只有最终的去重路径才会拼接成字符串。结果与逐行实现完全一致。
+    
+    Args:
+        df (pandas.DataFrame): 预处理后的数据
+        path_type (str): 路径类型 ('start' 或 'end')
+        start_option (str): 起始选项
+        end_option (str): 结束选项
+        path_length (str): 路径长度限制
+        session_timeout_minutes (int): 会话超时时间（分钟）
+        
+    Returns:
+        Counter: 用户路径计数
+    """
+    return build_user_path_store(df, path_type, start_option, end_option, path_length,
+                                 session_timeout_minutes).to_dict()
+
+def build_user_path_store(df, path_type, start_option, end_option, path_length,
+                          session_timeout_minutes=30, per_user=False):
+    """
+    构建用户路径存储（参数与 build_enhanced_user_paths 相同）
+    
+    路径直接以步骤id写入前缀树，不拼接字符串，后续的桑基图、分布和统计
+    计算都可以直接复用步骤序列。
+    
+    Args:
+        per_user (bool): 同时保存每条路径的逐用户会话数（采样分析计算置信区间时使用）
+        
+    Returns:
+        PathStore: 用户路径存储
+    """
+    store = PathStore()
+    
+    if df.empty:
+        return store
+    
+    user_codes, step_codes, timestamps, step_names, match_side, step_matches = _encode_path_frame(
+        df, path_type, start_option, end_option
+    )
+    sequence_counts = _count_session_paths(user_codes, step_codes, timestamps, match_side, step_matches,
+                                           path_length, session_timeout_minutes, per_user)
+    return _fill_path_store(store, step_names, sequence_counts)
+
+def _encode_path_frame(df, path_type, start_option, end_option):
+    """
+    把预处理后的数据编码为整数数组，并预先计算起止选项的步骤匹配表
+    
+    Returns:
+        tuple: (用户编码, 步骤编码, 时间戳, 步骤名称, 匹配位置('start'/'end'/None), 步骤是否匹配)
+    """
+    # 用户和步骤转换为整数编码
+    user_codes, _ = pd.factorize(df['distinct_id'])
+    step_codes, step_names = pd.factorize(df['step_identifier'])
+    step_names = np.asarray(step_names, dtype=object)
+    timestamps = df['timestamp'].to_numpy()
+    
+    # 根据路径类型确定筛选条件（只在去重后的步骤名称上做一次子串匹配）
+    if path_type == 'start' and start_option:
+        match_side, option_key = 'start', extract_option_key(start_option)
+    elif path_type == 'end' and end_option:
+        match_side, option_key = 'end', extract_option_key(end_option)
+    else:
+        match_side, option_key = None, None
+    
+    step_matches = None
+    if option_key is not None:
+        step_matches = np.fromiter((option_key in name for name in step_names),
+                                   dtype=bool, count=len(step_names))
+    
+    return user_codes, step_codes, timestamps, step_names, match_side, step_matches
+
+def _count_session_paths(user_codes, step_codes, timestamps, match_side, step_matches, path_length,
+                         session_timeout_minutes=30, per_user=False):
+    """
+    在整数编码数组上完成会话划分、相邻去重和路径筛选，统计每种步骤序列的会话数
+    
+    只依赖NumPy数组，可在子进程中对按用户分片的数据独立执行。
+    
+    Returns:
+        Counter: 步骤编码元组 -> 会话数（按路径长度、编码字典序排列）；per_user 时
+        值为 (用户编码数组, 会话数数组)
+    """
+    sequence_counts = Counter()
+    
+    # 按用户、时间稳定排序（无用户标识的记录无法划分会话，直接丢弃）
+    order = np.lexsort((timestamps, user_codes))
+    order = order[user_codes[order] >= 0]
+    if len(order) == 0:
+        return sequence_counts
+    user_codes = user_codes[order]
+    step_codes = step_codes[order]
+    timestamps = timestamps[order]
+    
+    # 会话划分：用户切换或时间间隔超过超时阈值
+    new_session = np.ones(len(order), dtype=bool)
+    if len(order) > 1:
+        time_diff = timestamps[1:] - timestamps[:-1]
+        timeout = np.timedelta64(session_timeout_minutes * 60, 's')
+        new_session[1:] = ((user_codes[1:] != user_codes[:-1]) |
+                           (time_diff > timeout) | np.isnat(time_diff))
+    
+    # 去重相邻重复步骤（会话首个步骤始终保留）
+    keep = new_session.copy()
+    keep[1:] |= step_codes[1:] != step_codes[:-1]
+    steps = step_codes[keep]
+    step_users = user_codes[keep]
+    session_ids = np.cumsum(new_session)[keep] - 1
+    
+    # 每个会话在压缩步骤数组中的起止位置
+    session_starts = np.flatnonzero(np.r_[True, session_ids[1:] != session_ids[:-1]])
+    session_lengths = np.diff(np.r_[session_starts, len(steps)])
+    
+    # 路径长度筛选
+    valid = session_lengths >= 2
+    if path_length == '2-3':
+        valid &= session_lengths <= 3
+    elif path_length == '4-5':
+        valid &= (session_lengths >= 4) & (session_lengths <= 5)
+    elif path_length == '6-8':
+        valid &= (session_lengths >= 6) & (session_lengths <= 8)
+    elif path_length == '9+':
+        valid &= session_lengths >= 9
+    
+    # 起始路径看前两步，结束路径看后两步
+    if match_side is not None:
+        if match_side == 'start':
+            first = session_starts
+            second = session_starts + 1
+        else:
+            first = session_starts + session_lengths - 1
+            second = first - 1
+        # 长度为1的会话已被排除，越界位置裁剪到合法范围即可
+        second = np.clip(second, 0, len(steps) - 1)
+        valid &= step_matches[steps[first]] | step_matches[steps[second]]
+    
+    session_starts = session_starts[valid]
+    session_lengths = session_lengths[valid]
+    
+    # 按长度分桶，每个桶构成二维编码矩阵后统计相同路径
+    for length in np.unique(session_lengths):
+        starts = session_starts[session_lengths == length]
+        sequences = steps[starts[:, None] + np.arange(length)]
+        if not per_user:
+            unique_sequences, counts = np.unique(sequences, axis=0, return_counts=True)
+            for sequence, count in zip(unique_sequences.tolist(), counts.tolist()):
+                sequence_counts[tuple(sequence)] = count
+            continue
+        
+        # 按（步骤序列, 用户）计数，同一序列的各用户相邻
+        rows, counts = np.unique(np.column_stack([sequences, step_users[starts]]), axis=0, return_counts=True)
+        group_starts = np.flatnonzero(np.r_[True, (rows[1:, :length] != rows[:-1, :length]).any(axis=1)])
+        for begin, end in zip(group_starts, np.r_[group_starts[1:], len(rows)]):
+            sequence_counts[tuple(rows[begin, :length].tolist())] = (rows[begin:end, length], counts[begin:end])
+    
+    return sequence_counts
+
+def _fill_path_store(store, step_names, sequence_counts):
+    """把步骤编码序列计数（或逐用户计数）写入路径存储"""
+    # 因子化编码 -> 存储内的步骤id
+    store_ids = store.intern_all(step_names)
+    for sequence, count in sequence_counts.items():
+        step_ids = [store_ids[code] for code in sequence]
+        if isinstance(count, tuple):
+            store.add_ids(step_ids, int(count[1].sum()), count)
+        else:
+            store.add_ids(step_ids, count)
+    return store
+
+def build_user_path_store_parallel(df, path_type, start_option, end_option, path_length,
+                                   session_timeout_minutes=30, workers=None, shard_rows=None, per_user=False):
+    """
+    多进程构建用户路径存储（结果与 build_user_path_store 完全一致）
+    
+    按 distinct_id 哈希把行分成若干分片，同一用户的全部事件落在同一分片；
+    分片以NumPy数组传给子进程做会话划分和路径计数，最后在主进程合并计数。
+    数据量小于 PATH_PARALLEL_MIN_ROWS、只有一个worker或进程池异常时在当前进程执行。
+    
+    Args:
+        workers (int): 子进程数，默认 PATH_PARALLEL_WORKERS
+        shard_rows (int): 每个分片的目标行数，默认 PATH_PARALLEL_SHARD_ROWS
+        其余参数同 build_user_path_store
+        
+    Returns:
+        PathStore: 用户路径存储
+    """
+    workers = config.PATH_PARALLEL_WORKERS if workers is None else workers
+    shard_rows = shard_rows or config.PATH_PARALLEL_SHARD_ROWS
+    
+    if workers < 2 or len(df) < config.PATH_PARALLEL_MIN_ROWS:
+        return build_user_path_store(df, path_type, start_option, end_option, path_length,
+                                     session_timeout_minutes, per_user)
+    
+    user_codes, step_codes, timestamps, step_names, match_side, step_matches = _encode_path_frame(
+        df, path_type, start_option, end_option
+    )
+    
+    # 按用户哈希分片（无用户标识的记录直接丢弃）
+    valid_rows = np.flatnonzero(user_codes >= 0)
+    n_shards = max(workers, -(-len(valid_rows) // shard_rows))
+    shard_ids = pd.util.hash_array(user_codes[valid_rows].astype(np.int64)) % np.uint64(n_shards)
+    order = valid_rows[np.argsort(shard_ids, kind='stable')]
+    boundaries = np.cumsum(np.bincount(shard_ids.astype(np.int64), minlength=n_shards))[:-1]
+    
+    try:
+        executor = _get_parallel_executor(workers)
+        futures = [
+            executor.submit(_count_session_paths, user_codes[rows], step_codes[rows], timestamps[rows],
+                            match_side, step_matches, path_length, session_timeout_minutes, per_user)
+            for rows in np.split(order, boundaries) if len(rows)
+        ]
+        sequence_counts = Counter() if not per_user else {}
+        for future in futures:
+            if not per_user:
+                sequence_counts.update(future.result())
+                continue
+            # 同一用户只在一个分片中，逐用户计数直接拼接
+            for sequence, (users, counts) in future.result().items():
+                existing = sequence_counts.get(sequence)
+                sequence_counts[sequence] = (users, counts) if existing is None else (
+                    np.concatenate([existing[0], users]), np.concatenate([existing[1], counts]))
+    except Exception as e:
+        logging.error(f"并行构建用户路径失败，改为单进程执行: {e}")
+        _reset_parallel_executor()
+        sequence_counts = _count_session_paths(user_codes, step_codes, timestamps, match_side, step_matches,
+                                               path_length, session_timeout_minutes, per_user)
+    
+    # 与单进程结果保持相同的路径顺序（按长度、编码字典序）
+    ordered = dict(sorted(sequence_counts.items(), key=lambda item: (len(item[0]), item[0])))
+    return _fill_path_store(PathStore(), step_names, ordered)
+
+def _get_parallel_executor(workers):
+    """获取并行构建路径的进程池（按需创建，worker数变化或fork后重新创建）"""
+    global _parallel_executor, _parallel_executor_key
+    key = (os.getpid(), workers)
+    with _parallel_lock:
+        if _parallel_executor is None or _parallel_executor_key != key:
+            _parallel_executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            _parallel_executor_key = key
+            # 在异步任务子进程中使用时，进程退出前需先关闭进程池，否则会一直等待池中的子进程；
+            # 优先级需高于进程池内部队列的清理，保证退出信号还能发送出去
+            multiprocessing.util.Finalize(_parallel_executor, _parallel_executor.shutdown, exitpriority=100)
+        return _parallel_executor
+
+def _reset_parallel_executor():
+    """丢弃异常的进程池，下次使用时重新创建"""
+    global _parallel_executor, _parallel_executor_key
+    with _parallel_lock:
+        if _parallel_executor is not None and _parallel_executor_key[0] == os.getpid():
+            _parallel_executor.shutdown(wait=False, cancel_futures=True)
+        _parallel_executor = None
+        _parallel_executor_key = None
+
+def _build_user_paths_rowwise(df, path_type, start_option, end_option, path_length):
+    """
+    逐行构建用户路径（参考实现，用于基准测试和结果校验）
     
     Args:
         df (pandas.DataFrame): 预处理后的数据
@@ -53,7 +329,7 @@ def build_enhanced_user_paths(df, path_type, start_option, end_option, path_leng
     df['session_global'] = df['distinct_id'].astype(str) + '-session-' + df['session_id'].astype(str)
     
     for session_id, session_df in df.groupby('session_global'):
-        session_df = session_df.sort_values('timestamp')
+        session_df = session_df.sort_values('timestamp', kind='stable')
         
         # 构建路径序列
         path_sequence = []
@@ -81,7 +357,7 @@ def build_enhanced_user_paths(df, path_type, start_option, end_option, path_leng
         if not apply_path_length_filter(path_sequence, path_length):
             continue
         
-        path_str = ' → '.join(path_sequence)
+        path_str = PATH_SEPARATOR.join(path_sequence)
         user_paths[path_str] += 1
     
     return user_paths
@@ -91,7 +367,7 @@ def calculate_step_positions(user_paths):
     计算步骤在路径中的典型位置
     
     Args:
-        user_paths (dict): 用户路径数据
+        user_paths (dict|PathStore): 用户路径数据
         
     Returns:
         dict: 步骤位置权重
@@ -99,8 +375,7 @@ def calculate_step_positions(user_paths):
     step_positions = {}
     step_counts = {}
     
-    for path, count in user_paths.items():
-        steps = path.split(' → ')
+    for steps, count in PathStore.coerce(user_paths).items():
         for i, step in enumerate(steps):
             if step not in step_positions:
                 step_positions[step] = 0
@@ -122,7 +397,7 @@ def build_enhanced_sankey_data(user_paths):
     构建增强的桑基图数据
     
     Args:
-        user_paths (dict): 用户路径数据
+        user_paths (dict|PathStore): 用户路径数据
         
     Returns:
         dict: 桑基图数据结构
@@ -131,12 +406,13 @@ def build_enhanced_sankey_data(user_paths):
         if not user_paths:
             return {'nodes': [], 'links': []}
         
+        user_paths = PathStore.coerce(user_paths)
+        
         # 收集所有步骤和转换
         all_steps = set()
         transitions = Counter()
         
-        for path, count in user_paths.items():
-            steps = path.split(' → ')
+        for steps, count in user_paths.items():
             for step in steps:
                 all_steps.add(step)
             
@@ -182,15 +458,15 @@ def analyze_step_distribution(user_paths):
     分析步骤分布
     
     Args:
-        user_paths (dict): 用户路径数据
+        user_paths (dict|PathStore): 用户路径数据
         
     Returns:
         dict: 步骤分布数据
     """
     step_counts = Counter()
     
-    for path, count in user_paths.items():
-        step_count = len(path.split(' → '))
+    for steps, count in PathStore.coerce(user_paths).items():
+        step_count = len(steps)
         
         if step_count <= 3:
             category = '2-3步路径'
@@ -212,7 +488,7 @@ def analyze_path_conversion(df, user_paths):
     
     Args:
         df (pandas.DataFrame): 原始数据
-        user_paths (dict): 用户路径数据
+        user_paths (dict|PathStore): 用户路径数据
         
     Returns:
         dict: 转化分析数据
@@ -222,8 +498,7 @@ def analyze_path_conversion(df, user_paths):
         all_steps = set()
         step_user_counts = Counter()
         
-        for path, count in user_paths.items():
-            steps = path.split(' → ')
+        for steps, count in PathStore.coerce(user_paths).items():
             for step in steps:
                 all_steps.add(step)
                 step_user_counts[step] += count
@@ -262,21 +537,23 @@ def calculate_enhanced_path_stats(df, user_paths):
     
     Args:
         df (pandas.DataFrame): 原始数据
-        user_paths (dict): 用户路径数据
+        user_paths (dict|PathStore): 用户路径数据
         
     Returns:
         dict: 路径统计数据
     """
     try:
         path_stats = {}
-        total_users = sum(user_paths.values())
+        user_paths = PathStore.coerce(user_paths)
+        total_users = user_paths.total()
         
-        for path, count in user_paths.items():
+        for steps, count in user_paths.items():
+            path = PATH_SEPARATOR.join(steps)
+            
             # 计算占比
             percentage = (count / total_users) * 100 if total_users > 0 else 0
             
             # 估算平均时长（基于路径长度和复杂度）
-            steps = path.split(' → ')
             base_duration = len(steps) * 15  # 每步基础15秒
             complexity_factor = 1 + (len([s for s in steps if ':' in s]) * 0.3)  # 页面跳转增加复杂度
             avg_duration = round(base_duration * complexity_factor + (count % 20), 1)
@@ -299,6 +576,252 @@ def calculate_enhanced_path_stats(df, user_paths):
         print(f"计算路径统计失败: {e}")
         return {}
 
+def _path_length_category(step_count):
+    """路径长度分类（与 analyze_step_distribution 一致）"""
+    if step_count <= 3:
+        return '2-3步路径'
+    elif step_count <= 5:
+        return '4-5步路径'
+    elif step_count <= 8:
+        return '6-8步路径'
+    return '9步以上'
+
+def _funnel_display_name(step):
+    """漏斗中显示的简化步骤名称（与 analyze_path_conversion 一致）"""
+    display_name = step.split(':')[0] if ':' in step else step
+    if '(' in display_name:
+        display_name = display_name.split('(')[0]
+    return display_name
+
+def build_path_analysis_result(user_paths):
+    """
+    单次遍历路径集合生成完整分析结果
+    
+    一次遍历同时累计步骤转换、步骤位置、长度分布、步骤计数和逐路径统计，
+    输出与分别调用 build_enhanced_sankey_data、analyze_step_distribution、
+    analyze_path_conversion、calculate_enhanced_path_stats 完全一致。
+    
+    Args:
+        user_paths (dict|PathStore): 用户路径数据
+        
+    Returns:
+        dict: 分析结果（sankey / stepDistribution / pathConversion / pathStats）
+    """
+    store = PathStore.coerce(user_paths)
+    step_names = store.steps
+    total_users = store.total()
+    
+    # 按步骤id累计（dict保持首次出现顺序，与原实现的迭代顺序一致）
+    position_sums = defaultdict(int)
+    step_counts = defaultdict(int)
+    transitions = defaultdict(int)
+    length_counts = defaultdict(int)
+    path_stats = {}
+    page_steps = [':' in step for step in step_names]
+    
+    for ids, count in store.id_items():
+        length = len(ids)
+        length_counts[length] += count
+        
+        for i, step_id in enumerate(ids):
+            position_sums[step_id] += i * count
+            step_counts[step_id] += count
+        
+        for transition in zip(ids, ids[1:]):
+            transitions[transition] += count
+        
+        # 逐路径统计（估算规则同 calculate_enhanced_path_stats）
+        percentage = (count / total_users) * 100 if total_users > 0 else 0
+        base_duration = length * 15
+        complexity_factor = 1 + (sum(map(page_steps.__getitem__, ids)) * 0.3)
+        avg_duration = round(base_duration * complexity_factor + (count % 20), 1)
+        conversion_rate = max(10, 80 - length * 5 + (count % 15))
+        
+        path_stats[PATH_SEPARATOR.join(map(step_names.__getitem__, ids))] = {
+            'count': count,
+            'percentage': f"{percentage:.1f}%",
+            'avgDuration': f"{avg_duration}s",
+            'conversionRate': f"{conversion_rate:.1f}%"
+        }
+    
+    # 桑基图：节点按平均位置排序，只保留向前的连接
+    nodes = []
+    links = []
+    if step_counts:
+        all_steps = set(step_names[step_id] for step_id in step_counts)
+        step_positions = {
+            step_names[step_id]: position_sums[step_id] / step_counts[step_id]
+            for step_id in step_counts
+        }
+        sorted_steps = sorted(all_steps, key=lambda x: step_positions.get(x, 0))
+        nodes = [{'name': step} for step in sorted_steps]
+        step_to_index = {step: i for i, step in enumerate(sorted_steps)}
+        
+        for (source_id, target_id), count in transitions.items():
+            source_step = step_names[source_id]
+            target_step = step_names[target_id]
+            source_idx = step_to_index[source_step]
+            target_idx = step_to_index[target_step]
+            if source_idx < target_idx:
+                links.append({
+                    'source': source_idx,
+                    'target': target_idx,
+                    'value': count,
+                    'sourceName': source_step,
+                    'targetName': target_step
+                })
+    
+    # 步骤分布
+    category_counts = Counter()
+    for length, count in length_counts.items():
+        category_counts[_path_length_category(length)] += count
+    
+    # 转化漏斗：按步骤会话数取前6
+    sorted_steps = sorted(step_counts.items(), key=lambda x: x[1], reverse=True)
+    funnel_data = [
+        {'value': count, 'name': _funnel_display_name(step_names[step_id])}
+        for step_id, count in sorted_steps[:6]
+    ]
+    
+    return {
+        'sankey': {'nodes': nodes, 'links': links},
+        'stepDistribution': {'steps': [{'value': count, 'name': category}
+                                       for category, count in category_counts.items()]},
+        'pathConversion': {
+            'funnelData': funnel_data,
+            'totalUsers': max(count for _, count in sorted_steps) if sorted_steps else 0
+        },
+        'pathStats': path_stats
+    }
+
+def sample_count_interval(count, rate, z=1.96, square_sum=None):
+    """
+    按用户采样的计数放大为全量估计，并给出正态近似置信区间
+    
+    每个用户以概率 rate 被选中，估计值为 count / rate，方差为 Σ c_u² * (1 - rate) / rate²
+    （c_u 为用户 u 贡献的会话数，square_sum 即 Σ c_u²）。未提供 square_sum 时按每个会话
+    独立采样近似（Σ c_u² 取 count），用户有多个会话时区间偏窄，只能作为下限参考。
+    下界不小于样本中观察到的计数。
+    
+    Args:
+        count (int): 样本中的计数
+        rate (float): 采样率（0~1]
+        z (float): 置信水平对应的分位数，1.96 为95%
+        square_sum (float): 逐用户计数的平方和
+        
+    Returns:
+        tuple: (估计值, 下界, 上界)
+    """
+    estimate = count / rate
+    margin = z * np.sqrt((count if square_sum is None else square_sum) * (1 - rate)) / rate
+    return int(round(estimate)), int(max(count, np.floor(estimate - margin))), int(np.ceil(estimate + margin))
+
+def path_user_square_sums(user_paths):
+    """
+    计算路径分析结果中各计数的逐用户平方和 Σ c_u²（采样方差使用）
+    
+    采样按用户进行，同一用户的全部会话同时被选中或落选，所以方差取决于每个用户
+    对该计数贡献的会话数。键与 build_path_analysis_result 的结果一一对应。
+    
+    Args:
+        user_paths (PathStore): 按用户构建（per_user=True）的路径存储
+        
+    Returns:
+        dict: paths（路径字符串）/ links（(来源步骤, 目标步骤)）/ lengths（长度分类）-> 平方和，
+        funnel 为与 funnelData 同序的平方和列表；没有逐用户计数时返回None
+    """
+    store = PathStore.coerce(user_paths)
+    if not store.has_user_counts():
+        return None
+    step_names = store.steps
+    families = {name: ({}, [], [], []) for name in ('paths', 'links', 'lengths', 'steps')}
+    
+    def add(family, key, users, values):
+        keys, codes, user_parts, value_parts = families[family]
+        code = keys.setdefault(key, len(keys))
+        codes.append(np.full(len(users), code, dtype=np.int64))
+        user_parts.append(users)
+        value_parts.append(values)
+    
+    for ids, users, counts in store.id_user_items():
+        add('paths', PATH_SEPARATOR.join(map(step_names.__getitem__, ids)), users, counts)
+        add('lengths', _path_length_category(len(ids)), users, counts)
+        for step_id, occurrences in Counter(ids).items():
+            add('steps', step_id, users, counts * occurrences)
+        for (source_id, target_id), occurrences in Counter(zip(ids, ids[1:])).items():
+            add('links', (step_names[source_id], step_names[target_id]), users, counts * occurrences)
+    
+    sums = {}
+    for family, (keys, codes, user_parts, value_parts) in families.items():
+        if not keys:
+            sums[family] = {}
+            continue
+        codes = np.concatenate(codes)
+        users = np.concatenate(user_parts)
+        values = np.concatenate(value_parts).astype(np.float64)
+        # 先按（键, 用户）求和得到 c_u，再按键累计 c_u²
+        width = int(users.max()) + 1
+        pairs, inverse = np.unique(codes * width + users, return_inverse=True)
+        per_user = np.bincount(inverse, weights=values)
+        totals = np.bincount(pairs // width, weights=per_user ** 2, minlength=len(keys))
+        sums[family] = {key: float(totals[code]) for key, code in keys.items()}
+    
+    # 转化漏斗取会话数最多的6个步骤（顺序同 build_path_analysis_result）
+    step_counts = defaultdict(int)
+    for ids, count in store.id_items():
+        for step_id in ids:
+            step_counts[step_id] += count
+    top_steps = sorted(step_counts.items(), key=lambda x: x[1], reverse=True)[:6]
+    steps = sums.pop('steps')
+    sums['funnel'] = [steps.get(step_id) for step_id, _ in top_steps]
+    return sums
+
+def scale_path_analysis_result(result, rate, z=1.96, square_sums=None):
+    """
+    把采样数据上的路径分析结果放大为全量估计
+    
+    桑基图连接、步骤分布、转化漏斗和逐路径统计的计数除以采样率，并附加置信区间
+    （ci 字段，[下界, 上界]）；百分比等比例指标不变。
+    
+    Args:
+        result (dict): build_path_analysis_result 的结果
+        rate (float): 采样率（0~1]
+        z (float): 置信水平对应的分位数
+        square_sums (dict): path_user_square_sums 的结果，不传时区间按会话独立近似（偏窄）
+        
+    Returns:
+        dict: 放大后的新结果（rate 为1时原样返回）
+    """
+    if rate >= 1:
+        return result
+    square_sums = square_sums or {}
+    
+    def scaled(item, key='value', square_sum=None):
+        estimate, low, high = sample_count_interval(item[key], rate, z, square_sum)
+        return {**item, key: estimate, 'ci': [low, high]}
+    
+    links = square_sums.get('links', {})
+    lengths = square_sums.get('lengths', {})
+    paths = square_sums.get('paths', {})
+    funnel = square_sums.get('funnel', [])
+    conversion = result['pathConversion']
+    return {
+        'sankey': {
+            'nodes': result['sankey']['nodes'],
+            'links': [scaled(link, square_sum=links.get((link['sourceName'], link['targetName'])))
+                      for link in result['sankey']['links']]
+        },
+        'stepDistribution': {'steps': [scaled(step, square_sum=lengths.get(step['name']))
+                                       for step in result['stepDistribution']['steps']]},
+        'pathConversion': {
+            **conversion,
+            'funnelData': [scaled(item, square_sum=funnel[i] if i < len(funnel) else None)
+                           for i, item in enumerate(conversion['funnelData'])],
+            'totalUsers': sample_count_interval(conversion.get('totalUsers', 0), rate, z)[0]
+        },
+        'pathStats': {path: scaled(stats, 'count', paths.get(path)) for path, stats in result['pathStats'].items()}
+    }
+
 def build_session_paths(df, session_timeout_minutes=30):
     """
     构建会话路径
@@ -336,12 +859,14 @@ def get_popular_paths(user_paths, top_n=10):
     获取最受欢迎的路径
     
     Args:
-        user_paths (dict): 用户路径数据
+        user_paths (dict|PathStore): 用户路径数据
         top_n (int): 返回前N个路径
         
     Returns:
         list: 排序后的路径列表
     """
+    if isinstance(user_paths, PathStore):
+        return user_paths.top_k(top_n)
     return sorted(user_paths.items(), key=lambda x: x[1], reverse=True)[:top_n]
 
 def calculate_path_metrics(user_paths):
@@ -349,7 +874,7 @@ def calculate_path_metrics(user_paths):
     计算路径指标
     
     Args:
-        user_paths (dict): 用户路径数据
+        user_paths (dict|PathStore): 用户路径数据
         
     Returns:
         dict: 路径指标
@@ -357,8 +882,9 @@ def calculate_path_metrics(user_paths):
     if not user_paths:
         return {}
     
-    path_lengths = [len(path.split(' → ')) for path in user_paths.keys()]
-    path_counts = list(user_paths.values())
+    user_paths = PathStore.coerce(user_paths)
+    path_lengths = [len(steps) for steps, _ in user_paths.items()]
+    path_counts = user_paths.counts()
     
     return {
         'total_paths': len(user_paths),
@@ -0,0 +1,321 @@
+# utils/path_store.py
+# 🌳 路径存储（步骤整数编码 + 计数前缀树）
+
+import sys
+import heapq
+import numpy as np
+from collections import Counter
+
+# 路径字符串中的步骤分隔符（与前端、接口返回的路径键一致）
+PATH_SEPARATOR = ' → '
+
+class PathStore:
+    """
+    用户路径的紧凑存储
+
+    步骤名称统一编码为整数id，路径保存为前缀树中的节点：每个节点记录经过它的
+    会话数（前缀计数）和恰好在此结束的会话数（路径计数）。路径按首次加入的顺序
+    保存，与原先 Counter 的迭代顺序一致，消费方无需再拆分路径字符串。
+    采样分析时可同时保存每条路径的逐用户会话数，用于按用户聚集计算方差。
+    """
+
+    def __init__(self):
+        self.steps = []  # 步骤id -> 步骤名称
+        self._step_ids = {}  # 步骤名称 -> 步骤id
+        # 前缀树节点（0为根节点），按列存储
+        self._children = [{}]
+        self._parent = [-1]
+        self._through = [0]
+        self._terminal = [0]
+        # 路径（按首次加入顺序）：终止节点和步骤id序列
+        self._path_nodes = []
+        self._path_ids = []
+        self._node_path = {}  # 终止节点 -> 路径序号
+        self._user_counts = {}  # 路径序号 -> (用户编码数组, 会话数数组)，只在按用户构建时保存
+        self._named = None  # 懒加载的步骤名称元组
+
+    @classmethod
+    def from_dict(cls, user_paths):
+        """
+        从 {路径字符串: 次数} 构建（仅在此处拆分一次字符串）
+
+        Args:
+            user_paths (dict): 用户路径数据
+
+        Returns:
+            PathStore: 路径存储
+        """
+        store = cls()
+        for path, count in user_paths.items():
+            store.add(path.split(PATH_SEPARATOR), count)
+        return store
+
+    @classmethod
+    def coerce(cls, user_paths):
+        """兼容旧调用：传入dict时转换为PathStore，PathStore原样返回"""
+        if isinstance(user_paths, cls):
+            return user_paths
+        return cls.from_dict(user_paths or {})
+
+    def intern(self, step):
+        """
+        获取步骤的整数id（不存在时分配新id）
+
+        Args:
+            step (str): 步骤名称
+
+        Returns:
+            int: 步骤id
+        """
+        step_id = self._step_ids.get(step)
+        if step_id is None:
+            step_id = self._step_ids[step] = len(self.steps)
+            self.steps.append(step)
+        return step_id
+
+    def intern_all(self, steps):
+        """批量编码步骤名称，返回id列表"""
+        return [self.intern(step) for step in steps]
+
+    def add(self, steps, count=1):
+        """
+        加入一条路径
+
+        Args:
+            steps (iterable): 步骤名称序列
+            count (int): 会话数
+        """
+        self.add_ids([self.intern(step) for step in steps], count)
+
+    def add_ids(self, step_ids, count=1, user_counts=None):
+        """
+        按步骤id加入一条路径
+
+        Args:
+            step_ids (iterable): 步骤id序列（须来自本存储的 intern）
+            count (int): 会话数
+            user_counts (tuple): (用户编码数组, 会话数数组)，count 为其会话数之和
+        """
+        step_ids = tuple(int(step_id) for step_id in step_ids)
+        node = 0
+        self._through[0] += count
+        for step_id in step_ids:
+            child = self._children[node].get(step_id)
+            if child is None:
+                child = len(self._parent)
+                self._children[node][step_id] = child
+                self._children.append({})
+                self._parent.append(node)
+                self._through.append(0)
+                self._terminal.append(0)
+            node = child
+            self._through[node] += count
+
+        self._terminal[node] += count
+        if node not in self._node_path:
+            self._node_path[node] = len(self._path_nodes)
+            self._path_nodes.append(node)
+            self._path_ids.append(step_ids)
+            self._named = None
+
+        if user_counts is not None:
+            index = self._node_path[node]
+            users, counts = (np.asarray(values, dtype=np.int64) for values in user_counts)
+            existing = self._user_counts.get(index)
+            if existing is not None:
+                users = np.concatenate([existing[0], users])
+                counts = np.concatenate([existing[1], counts])
+            self._user_counts[index] = (users, counts)
+
+    def __len__(self):
+        return len(self._path_nodes)
+
+    def __contains__(self, steps):
+        node = self._find(steps)
+        return node is not None and self._terminal[node] > 0
+
+    def total(self):
+        """会话总数"""
+        return self._through[0]
+
+    def count(self, steps):
+        """
+        指定路径的会话数
+
+        Args:
+            steps (iterable): 步骤名称序列
+
+        Returns:
+            int: 会话数
+        """
+        node = self._find(steps)
+        return self._terminal[node] if node is not None else 0
+
+    def _find(self, steps):
+        node = 0
+        for step in steps:
+            step_id = self._step_ids.get(step)
+            node = self._children[node].get(step_id) if step_id is not None else None
+            if node is None:
+                return None
+        return node
+
+    def _names(self):
+        if self._named is None:
+            steps = self.steps
+            self._named = [tuple(steps[step_id] for step_id in ids) for ids in self._path_ids]
+        return self._named
+
+    def items(self):
+        """
+        按加入顺序遍历路径
+
+        Yields:
+            tuple: (步骤名称元组, 会话数)
+        """
+        terminal = self._terminal
+        return zip(self._names(), (terminal[node] for node in self._path_nodes))
+
+    def id_items(self):
+        """
+        按加入顺序遍历路径（步骤id形式）
+
+        Yields:
+            tuple: (步骤id元组, 会话数)
+        """
+        terminal = self._terminal
+        return zip(self._path_ids, (terminal[node] for node in self._path_nodes))
+
+    def has_user_counts(self):
+        """是否保存了逐用户会话数"""
+        return bool(self._user_counts)
+
+    def id_user_items(self):
+        """
+        按加入顺序遍历保存了逐用户会话数的路径
+
+        Yields:
+            tuple: (步骤id元组, 用户编码数组, 会话数数组)
+        """
+        for index, ids in enumerate(self._path_ids):
+            user_counts = self._user_counts.get(index)
+            if user_counts is not None:
+                yield (ids,) + user_counts
+
+    def counts(self):
+        """按加入顺序返回各路径的会话数"""
+        return [self._terminal[node] for node in self._path_nodes]
+
+    def prefix_count(self, steps):
+        """
+        以指定步骤序列开头的会话数
+
+        Args:
+            steps (iterable): 前缀步骤名称序列
+
+        Returns:
+            int: 会话数
+        """
+        node = self._find(steps)
+        return self._through[node] if node is not None else 0
+
+    def with_prefix(self, steps):
+        """
+        以指定步骤序列开头的路径
+
+        Args:
+            steps (iterable): 前缀步骤名称序列
+
+        Returns:
+            list: [(步骤名称元组, 会话数), ...]，按加入顺序
+        """
+        node = self._find(steps)
+        if node is None:
+            return []
+
+        indices = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current in self._node_path:
+                indices.append(self._node_path[current])
+            stack.extend(self._children[current].values())
+
+        names = self._names()
+        return [(names[i], self._terminal[self._path_nodes[i]]) for i in sorted(indices)]
+
+    def with_suffix(self, steps):
+        """
+        以指定步骤序列结尾的路径
+
+        Args:
+            steps (iterable): 后缀步骤名称序列
+
+        Returns:
+            list: [(步骤名称元组, 会话数), ...]，按加入顺序
+        """
+        suffix_ids = []
+        for step in steps:
+            step_id = self._step_ids.get(step)
+            if step_id is None:
+                return []
+            suffix_ids.append(step_id)
+        suffix_ids = tuple(suffix_ids)
+        length = len(suffix_ids)
+
+        names = self._names()
+        return [
+            (names[i], self._terminal[node])
+            for i, (ids, node) in enumerate(zip(self._path_ids, self._path_nodes))
+            if len(ids) >= length and ids[len(ids) - length:] == suffix_ids
+        ]
+
+    def top_k(self, k=10):
+        """
+        会话数最多的k条路径（并列时保持加入顺序）
+
+        Args:
+            k (int): 返回条数
+
+        Returns:
+            list: [(路径字符串, 会话数), ...]
+        """
+        counts = self.counts()
+        names = self._names()
+        top = heapq.nlargest(k, range(len(counts)), key=counts.__getitem__)
+        return [(PATH_SEPARATOR.join(names[i]), counts[i]) for i in top]
+
+    def filter(self, min_count=1):
+        """
+        筛选会话数不少于min_count的路径（步骤编码保持不变）
+
+        Args:
+            min_count (int): 最小会话数
+
+        Returns:
+            PathStore: 新的路径存储
+        """
+        store = PathStore()
+        store.steps = list(self.steps)
+        store._step_ids = dict(self._step_ids)
+        for index, (ids, count) in enumerate(self.id_items()):
+            if count >= min_count:
+                store.add_ids(ids, count, self._user_counts.get(index))
+        return store
+
+    def to_dict(self):
+        """
+        转换为 {路径字符串: 会话数}，用于JSON返回和兼容旧接口
+
+        Returns:
+            Counter: 用户路径计数（按加入顺序）
+        """
+        return Counter({PATH_SEPARATOR.join(steps): count for steps, count in self.items()})
+
+    def nbytes(self):
+        """估算内存占用（字节，用于缓存预算）"""
+        node_bytes = len(self._parent) * 200
+        path_bytes = sum(64 + 8 * len(ids) for ids in self._path_ids)
+        step_bytes = sum(sys.getsizeof(step) for step in self.steps)
+        user_bytes = sum(users.nbytes + counts.nbytes for users, counts in self._user_counts.values())
+        return node_bytes + path_bytes + step_bytes + user_bytes
@@ -0,0 +1,161 @@
+# utils/retention_analyzer.py
+# 🔁 留存分析工具模块（每用户按周期的活跃位图）
+
+import numpy as np
+import pandas as pd
+
+# 每个位图字的位数
+BITMAP_WORD_BITS = 64
+
+def hash_user_ids(values):
+    """
+    distinct_id -> 64位哈希（向量化，碰撞概率可忽略）
+
+    Args:
+        values: distinct_id 数组或Series
+
+    Returns:
+        numpy.ndarray: uint64 哈希数组
+    """
+    return pd.util.hash_array(np.asarray(values, dtype=object), categorize=False)
+
+def build_activity_bitmaps(period_users):
+    """
+    生成每个用户的起始行为位图和回访行为位图（每个周期一位）
+
+    Args:
+        period_users (list): 每个周期的 (起始行为用户哈希, 回访行为用户哈希)
+
+    Returns:
+        tuple: (start_bits, return_bits)，形状均为 (用户数, 字数) 的 uint64 数组
+    """
+    n_periods = len(period_users)
+    n_words = max(1, (n_periods + BITMAP_WORD_BITS - 1) // BITMAP_WORD_BITS)
+    arrays = [users for pair in period_users for users in pair]
+    all_users = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint64)
+    _, codes = np.unique(all_users, return_inverse=True)
+    n_users = int(codes.max()) + 1 if len(codes) else 0
+
+    start_bits = np.zeros((n_users, n_words), dtype=np.uint64)
+    return_bits = np.zeros((n_users, n_words), dtype=np.uint64)
+    offset = 0
+    for period, pair in enumerate(period_users):
+        word, bit = divmod(period, BITMAP_WORD_BITS)
+        for bits, users in zip((start_bits, return_bits), pair):
+            # 同一周期内重复的用户写入相同的值，不影响结果
+            rows = codes[offset:offset + len(users)]
+            bits[rows, word] |= np.uint64(1 << bit)
+            offset += len(users)
+
+    return start_bits, return_bits
+
+def first_set_period(bits):
+    """
+    每个用户最早置位的周期
+
+    Args:
+        bits (numpy.ndarray): (用户数, 字数) 的位图
+
+    Returns:
+        numpy.ndarray: 周期下标，没有置位时为 -1
+    """
+    result = np.full(len(bits), -1, dtype=np.int64)
+    for word in range(bits.shape[1] - 1, -1, -1):
+        values = bits[:, word]
+        nonzero = values != 0
+        lowest = values[nonzero] & (~values[nonzero] + np.uint64(1))
+        result[nonzero] = word * BITMAP_WORD_BITS + np.log2(lowest.astype(np.float64)).astype(np.int64)
+    return result
+
+def period_bit(bits, periods):
+    """
+    读取每个用户在指定周期的位
+
+    Args:
+        bits (numpy.ndarray): (用户数, 字数) 的位图
+        periods (numpy.ndarray): 每个用户要读取的周期下标
+
+    Returns:
+        numpy.ndarray: 布尔数组
+    """
+    word, bit = np.divmod(periods, BITMAP_WORD_BITS)
+    values = bits[np.arange(len(bits)), word]
+    return ((values >> bit.astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+def compute_retention(period_users, first_cohort, max_offset):
+    """
+    同期群留存矩阵：用户按最早发生起始行为的周期分组，统计之后第N个周期发生回访行为的人数
+
+    所有周期只构建一次位图；lookback周期（first_cohort之前）内已发生起始行为的用户视为老用户，不计入任何同期群。
+
+    Args:
+        period_users (list): build_activity_bitmaps 的输入
+        first_cohort (int): 第一个报告的同期群周期下标
+        max_offset (int): 最大留存周期数N（含第0周期）
+
+    Returns:
+        dict: {'cohort_users': 每个同期群人数, 'retained': 二维列表，尚未到达的周期为None}
+    """
+    n_periods = len(period_users)
+    n_cohorts = max(0, n_periods - first_cohort)
+    retained = [[None] * (max_offset + 1) for _ in range(n_cohorts)]
+    if not n_cohorts:
+        return {'cohort_users': [], 'retained': retained}
+
+    start_bits, return_bits = build_activity_bitmaps(period_users)
+    cohort = first_set_period(start_bits)
+    in_cohort = cohort >= first_cohort
+    cohort = cohort[in_cohort]
+    return_bits = return_bits[in_cohort]
+
+    cohort_index = cohort - first_cohort
+    cohort_users = np.bincount(cohort_index, minlength=n_cohorts)
+
+    for offset in range(max_offset + 1):
+        target = cohort + offset
+        observable = target < n_periods
+        hits = np.zeros(len(cohort), dtype=bool)
+        if observable.any():
+            hits[observable] = period_bit(return_bits[observable], target[observable])
+        counts = np.bincount(cohort_index[hits], minlength=n_cohorts)
+        for index in range(n_cohorts):
+            if first_cohort + index + offset < n_periods:
+                retained[index][offset] = int(counts[index])
+
+    return {'cohort_users': [int(count) for count in cohort_users], 'retained': retained}
+
+def compute_retention_reference(events, start_event, return_event, first_cohort, n_periods, max_offset):
+    """
+    基于 pandas 分组的参考实现（用于基准测试校验）
+
+    Args:
+        events (pandas.DataFrame): 含 distinct_id、event、period 列
+        start_event (str): 起始事件
+        return_event (str): 回访事件，为空表示任意事件
+        first_cohort (int): 第一个报告的同期群周期下标
+        n_periods (int): 周期总数
+        max_offset (int): 最大留存周期数
+
+    Returns:
+        dict: 与 compute_retention 相同的结构
+    """
+    starts = events[events['event'] == start_event]
+    cohort = starts.groupby('distinct_id')['period'].min()
+    cohort = cohort[cohort >= first_cohort]
+    returns = events if not return_event else events[events['event'] == return_event]
+    active = set(zip(returns['distinct_id'], returns['period']))
+
+    n_cohorts = n_periods - first_cohort
+    cohort_users = [0] * n_cohorts
+    retained = [[None] * (max_offset + 1) for _ in range(n_cohorts)]
+    for index in range(n_cohorts):
+        for offset in range(max_offset + 1):
+            if first_cohort + index + offset < n_periods:
+                retained[index][offset] = 0
+    for user, period in cohort.items():
+        index = period - first_cohort
+        cohort_users[index] += 1
+        for offset in range(max_offset + 1):
+            if period + offset < n_periods and (user, period + offset) in active:
+                retained[index][offset] += 1
+    return {'cohort_users': cohort_users, 'retained': retained}